@@ -1,14 +1,56 @@
 import inspect
+import os
 import re
 import sys
+import threading
+import warnings
+import weakref
 
+from zope.interface import implementer
+from zope.interface import providedBy
+
+from pyramid.config import Configurator
 from pyramid.exceptions import ConfigurationError
+from pyramid.exceptions import PredicateMismatch
+from pyramid.interfaces import IRequest
+from pyramid.interfaces import IView
+from pyramid.interfaces import IViewMapperFactory
+from pyramid.interfaces import IViewClassifier
+from pyramid.security import NO_PERMISSION_REQUIRED
+from pyramid.settings import asbool
+
+try:
+    from pyramid.viewderivers import DefaultViewMapper
+except ImportError: # pragma: no cover (Pyramid < 1.7)
+    from pyramid.config.views import DefaultViewMapper
+
+from pyramid_handlers.interfaces import IHandlerManifest
+from pyramid_handlers.interfaces import IHandlerRoutes
+from pyramid_handlers.manifest import HandlerManifest
+from pyramid_handlers.manifest import qualified_name
+from pyramid_handlers.manifest import xformer_id
+from pyramid_handlers.streaming import JSONStream
+from pyramid_handlers.timing import timing_decorator
 
 PY3 = sys.version_info[0] == 3
 
+if PY3: # pragma: no cover
+    string_types = (str,)
+else:
+    string_types = (basestring,)
+
+_iscoroutinefunction = getattr(inspect, 'iscoroutinefunction',
+                               lambda func: False)
+
 action_re = re.compile(r'''({action}|:action)''')
 
-def add_handler(self, route_name, pattern, handler, action=None, **kw):
+# action names made only of these characters can't mean anything special
+# to the regex engine, so they may be compared by simple string equality
+literal_action_re = re.compile(r'[A-Za-z0-9_\-]+$')
+
+def add_handler(self, route_name, pattern, handler, action=None,
+                single_view=False, lazy=False, timing=None, batch=None,
+                batch_pool=None, **kw):
     """ Add a Pylons-style view handler.  This function adds a
     route and some number of views based on a handler object
     (usually a class).
@@ -37,20 +79,67 @@ def add_handler(self, route_name, pattern, handler, action=None, **kw):
     Passing both ``action`` and having an ``{action}`` in the
     route pattern is disallowed.
 
+    If the handler has a ``__handler_scope__`` attribute of ``thread`` or
+    ``process``, its instances are reused across requests (see
+    :class:`~pyramid_handlers.HandlerInstances`).
+
+    If ``single_view`` is true and ``{action}`` is in the pattern, a
+    single dispatching view is registered for the route instead of one
+    predicated view per exposed method; it finds the method to call by
+    looking up the matched action name in a precomputed table, so the cost
+    of dispatch doesn't grow with the number of actions the handler
+    exposes.  Only actions which are regular expressions (see
+    :class:`~pyramid_handlers.action`) are matched one by one.
+
+    If ``lazy`` is true and ``handler`` is a dotted name, the handler isn't
+    imported when ``add_handler`` is called.  Instead a placeholder view is
+    registered for the route (see :class:`~pyramid_handlers.LazyHandler`),
+    and the handler is imported and its views registered when the route is
+    first matched.  The ``pyramid_handlers.eager`` and
+    ``pyramid_handlers.preload`` settings, when true, make ``lazy`` be
+    ignored.
+
+    If ``timing`` is true, the latency of every action of the handler is
+    counted in a histogram kept in the registry (see
+    :mod:`pyramid_handlers.timing`); an action may opt out by passing
+    ``timing=False`` to :class:`~pyramid_handlers.action`.  By default,
+    ``timing`` is the value of the ``pyramid_handlers.timing`` setting.
+
+    If ``batch`` is a route pattern and ``{action}`` is in ``pattern``, a
+    route named ``<route_name>.batch`` is added for it, with a view calling
+    several actions of the handler per request (see
+    :mod:`pyramid_handlers.batch`); if ``batch_pool`` names a pool of
+    :mod:`pyramid_handlers.pools`, the actions are called concurrently on
+    its threads.
+
     Any extra keyword arguments are passed along to ``add_route``.
 
     See :ref:`views_chapter` for more explanatory documentation."""
     if pattern is None:
         raise ConfigurationError('As of version 0.3 pattern cannot be None')
 
+    settings = self.registry.settings or {}
+    if timing is None:
+        timing = settings.get('pyramid_handlers.timing')
+
     default_view_args = {
-        'permission': kw.pop('view_permission', kw.pop('permission', None))
+        'permission': kw.pop('view_permission', kw.pop('permission', None)),
+        'timing': asbool(timing),
     }
 
+    if batch is not None:
+        if not action_re.search(pattern) or lazy:
+            raise ConfigurationError(
+                'batch= (%r) requires an action in the route path (%r) and '
+                'disallows lazy=True' % (batch, pattern))
+        # added first, or the handler route could match the batch route
+        self.add_route(route_name + '.batch', batch, request_method='POST')
+
     self.add_route(route_name, pattern, **kw)
 
-    handler = self.maybe_dotted(handler)
-    action_decorator = getattr(handler, '__action_decorator__', None)
+    manifest = self.registry.queryUtility(IHandlerManifest)
+    if manifest is not None:
+        manifest.record_route(route_name, pattern, handler, action)
 
     action_pattern = action_re.search(pattern)
     if action and action_pattern:
@@ -58,69 +147,210 @@ def add_handler(self, route_name, pattern, handler, action=None, **kw):
             'action= (%r) disallowed when an action is in the route '
             'path %r' % (action, pattern))
 
+    routes = handler_routes(self.registry)
+    if (lazy and isinstance(handler, string_types) and
+        not asbool(settings.get('pyramid_handlers.eager')) and
+        not asbool(settings.get('pyramid_handlers.preload'))):
+        if handler.startswith('.'):
+            name = self.package_name + handler
+        else:
+            name = handler
+        routes.add(name, route_name, action, bool(action_pattern))
+        dispatcher = LazyHandler(route_name, handler, self.package, action,
+                                 bool(action_pattern), default_view_args)
+        self.add_view(view=dispatcher, route_name=route_name,
+                      permission=NO_PERMISSION_REQUIRED)
+        return
+
+    handler = self.maybe_dotted(handler)
     if action_pattern:
-        scan_handler(self, handler, route_name, action_decorator,
-                     **default_view_args)
+        routes.add(handler, route_name, in_path=True)
+
+    dispatcher = None
+    if action_pattern and single_view:
+        dispatcher = ActionDispatcher(route_name)
+        self.add_view(view=dispatcher, route_name=route_name,
+                      permission=NO_PERMISSION_REQUIRED)
+    add_handler_views(self, handler, route_name, action,
+                      bool(action_pattern), dispatcher, default_view_args)
+    if batch is not None:
+        add_handler_batch(self, handler, route_name, batch_pool,
+                          default_view_args)
+
+
+def add_handler_batch(config, handler, route_name, pool, default_view_args):
+    """ Register a :class:`~pyramid_handlers.batch.HandlerBatch` calling
+    the exposed methods of ``handler`` as the view of the batch route of
+    the route named ``route_name``.  Batched calls of an action share the
+    concurrency limit of its views on that route."""
+    from pyramid_handlers.batch import DEFAULT_MAX_CALLS
+    from pyramid_handlers.batch import HandlerBatch
+    from pyramid_handlers.limits import get_limits
+    settings = config.registry.settings or {}
+    max_calls = settings.get('pyramid_handlers.batch.max_calls')
+    if pool is not None:
+        from pyramid_handlers.pools import get_pool
+        pool = get_pool(config.registry, pool)
+    async_timeout = settings.get('pyramid_handlers.async_timeout')
+    view = HandlerBatch(handler, default_view_args.get('permission'), pool,
+                        int(max_calls or DEFAULT_MAX_CALLS), config.package,
+                        float(async_timeout) if async_timeout else None)
+    limits = get_limits(config.registry)
+    for method_name, index, action in handler_plan(config, handler, True):
+        view_args = {}
+        if index is not None:
+            view_args = _exposed(handler, method_name)[index]
+        limit = None
+        if limits is not None and view_args.get('max_concurrency'):
+            limit = limits.limit(
+                route_name, qualified_name(handler), action,
+                view_args['max_concurrency'], view_args.get('max_queued'),
+                view_args.get('queue_timeout'))
+        view.add(action, method_name, view_args, limit)
+    config.add_view(view=view, route_name=route_name + '.batch',
+                    permission=NO_PERMISSION_REQUIRED)
+
+
+def add_handler_views(config, handler, route_name, action, scan, dispatcher,
+                      default_view_args):
+    """ Register the views of ``handler`` for the route named
+    ``route_name``: every exposed method if ``scan`` is true (the route
+    pattern has an ``{action}``), otherwise the views for ``action``.  If
+    ``dispatcher`` is an :class:`ActionDispatcher`, the views are registered
+    under view names known to it."""
+    action_decorator = getattr(handler, '__action_decorator__', None)
+    if scan:
+        scan_handler(config, handler, route_name, action_decorator,
+                     dispatcher=dispatcher, **default_view_args)
     else:
         locate_view_by_name(
-            config=self,
+            config=config,
             handler=handler,
             route_name=route_name,
             action_decorator=action_decorator,
             name=action,
+            dispatcher=dispatcher,
             **default_view_args
         )
 
 
 def scan_handler(config, handler, route_name, action_decorator,
-                 **default_view_args):
-    """Scan a handler for automatically exposed views to register"""
-    xformer = config.registry.settings.get(
-        'pyramid_handlers.method_name_xformer')
-    xformer = config.maybe_dotted(xformer)
+                 dispatcher=None, **default_view_args):
+    """Scan a handler for automatically exposed views to register
+
+    If ``dispatcher`` is an :class:`ActionDispatcher`, each view is
+    registered under a view name known to the dispatcher instead of being
+    guarded by an :class:`ActionPredicate`."""
+    group = ActionPatternGroup()
+    routes = handler_routes(config.registry)
+    for method_name, index, action in handler_plan(config, handler, True):
+        routes.add(handler, route_name, action, True)
+        # we don't want to mutate any dict in __exposed__,
+        # so we copy each
+        view_args = default_view_args.copy()
+        if index is not None:
+            view_args.update(_exposed(handler, method_name)[index])
+        view_args.pop('name', None)
+        if dispatcher is not None:
+            view_args['name'] = dispatcher.add(action)
+        else:
+            view_args['custom_predicates'] = tuple(
+                view_args.get('custom_predicates', ())) + (
+                    ActionPredicate(action, group),)
+        _add_action_view(config, handler, method_name, action,
+                         route_name=route_name,
+                         decorator=action_decorator, **view_args)
+
+
+def locate_view_by_name(config, handler, route_name, action_decorator, name,
+                        dispatcher=None, **default_view_args):
+    """Locate and add all the views in a handler with the matching name, or
+    the method itself if it exists.
+
+    If ``dispatcher`` is an :class:`ActionDispatcher`, the views are
+    registered under its :attr:`view_name_prefix` as their view name."""
+    handler_routes(config.registry).add(handler, route_name, name)
+    for attr, index, keep_name in handler_plan(config, handler, False, name):
+        # we don't want to mutate any dict in __exposed__,
+        # so we copy each
+        view_args = default_view_args.copy()
+        if index is not None:
+            view_args.update(_exposed(handler, attr or '__call__')[index])
+        if not keep_name:
+            del view_args['name']
+        if dispatcher is not None:
+            view_args['name'] = dispatcher.view_name_prefix
+        _add_action_view(config, handler, attr, name or attr or '__call__',
+                         route_name=route_name,
+                         decorator=action_decorator, **view_args)
+
+
+def handler_plan(config, handler, scan, name=None):
+    """ Return the views to register for ``handler`` as a list of
+    ``(attr, index, action)`` triples (if ``scan`` is true, for a route
+    with an ``{action}`` in its pattern) or ``(attr, index, keep_name)``
+    triples (for the action ``name``).  ``index`` is the
+    position of the view's configuration in the method's ``__exposed__``
+    list, or ``None`` if it has none.
+
+    The plan is taken from the handler manifest (see
+    :mod:`pyramid_handlers.manifest`) if one is configured and is current;
+    otherwise the handler is introspected."""
+    key = '*' if scan else 'action:%s' % (name or '__call__')
+    manifest = config.registry.queryUtility(IHandlerManifest)
+    if manifest is not None:
+        plan = manifest.get(handler, key)
+        if plan is not None:
+            return plan
+    if scan:
+        xformer = config.registry.settings.get(
+            'pyramid_handlers.method_name_xformer')
+        xformer = config.maybe_dotted(xformer)
+        plan = _scan_plan(handler, xformer)
+    else:
+        plan = _locate_plan(handler, name)
+    if manifest is not None:
+        manifest.record(handler, key, plan)
+    return plan
+
+
+def _scan_plan(handler, xformer):
     autoexpose = getattr(handler, '__autoexpose__', r'[A-Za-z]+')
     if autoexpose:
         try:
-            autoexpose = re.compile(autoexpose).match
+            autoexpose = compile_autoexpose(autoexpose).match
         except (re.error, TypeError) as why:
             raise ConfigurationError(why.args[0])
-    method_info = get_method_info(handler)
-    for method_name, method in method_info:
+    plan = []
+    for method_name, method in get_method_info(handler):
         configs = getattr(method, '__exposed__', [])
         if autoexpose and not configs:
             if autoexpose(method_name):
-                configs = [{}]
-        for expose_config in configs:
-            # we don't want to mutate any dict in __exposed__,
-            # so we copy each
-            view_args = default_view_args.copy()
-            view_args.update(expose_config.copy())
-            action = view_args.pop('name', None)
+                configs = [None]
+        for index, expose_config in enumerate(configs):
+            action = None
+            if expose_config is None:
+                index = None
+            else:
+                action = expose_config.get('name')
             if action is None:
                 action = method_name
                 if xformer is not None:
                     action = xformer(action)
-            preds = list(view_args.pop('custom_predicates', []))
-            preds.append(ActionPredicate(action))
-            view_args['custom_predicates'] = preds
-            config.add_view(view=handler, attr=method_name,
-                            route_name=route_name,
-                            decorator=action_decorator, **view_args)
+            plan.append((method_name, index, action))
+    return plan
 
 
-def locate_view_by_name(config, handler, route_name, action_decorator, name,
-                        **default_view_args):
-    """Locate and add all the views in a handler with the matching name, or
-    the method itself if it exists."""
+def _locate_plan(handler, name):
     method_name = name
     if method_name is None:
         method_name = '__call__'
+    plan = []
 
     # Scan the controller for any other methods with this action name
-    method_info = get_method_info(handler)
-    for attr, method in method_info:
+    for attr, method in get_method_info(handler):
         configs = getattr(method, '__exposed__', [{}])
-        for expose_config in configs:
+        for index, expose_config in enumerate(configs):
             # Don't re-register the same view if this method name is
             # the action name
             if attr == name:
@@ -128,41 +358,411 @@ def locate_view_by_name(config, handler, route_name, action_decorator, name,
             # We only reg a view if the name matches the action
             if expose_config.get('name') != method_name:
                 continue
-            # we don't want to mutate any dict in __exposed__,
-            # so we copy each
-            view_args = default_view_args.copy()
-            view_args.update(expose_config.copy())
-            del view_args['name']
-            config.add_view(view=handler, attr=attr,
-                            route_name=route_name,
-                            decorator=action_decorator, **view_args)
+            plan.append((attr, index, False))
 
     # Now register the method itself
     method = getattr(handler, method_name, None)
     if method:
         configs = getattr(method, '__exposed__', [])
         view_regged = False
-        for expose_config in configs:
+        for index, expose_config in enumerate(configs):
             if 'name' in expose_config and expose_config['name'] != name:
                 continue
             view_regged = True
-            view_args = default_view_args.copy()
-            view_args.update(expose_config.copy())
-            config.add_view(view=handler, attr=name, route_name=route_name,
-                            decorator=action_decorator, **view_args)
+            plan.append((name, index, True))
         if not view_regged:
-            config.add_view(view=handler, attr=name, route_name=route_name,
-                            decorator=action_decorator, **default_view_args)
+            plan.append((name, None, True))
+    return plan
+
+
+def _exposed(handler, attr):
+    return getattr(handler, attr).__exposed__
+
+
+def _add_action_view(config, handler, attr, action, **view_args):
+    """ Register the method ``attr`` of ``handler`` as the view of
+    ``action``.  Handlers with a ``__handler_scope__`` other than
+    ``request`` are registered through a view function which reuses handler
+    instances.  Methods which are coroutine functions (``async def``) are
+    run on the event loop of :mod:`pyramid_handlers.aio`.
+
+    ``view_args`` may hold options of this package on top of the arguments
+    of ``add_view`` (see :class:`action`): these are removed, and turned
+    into view decorators composed with the handler's
+    ``__action_decorator__``, or into wrappers of the view calling the
+    method."""
+    method = getattr(handler, attr or '__call__', None)
+    decorators = []
+    if view_args.pop('timing', False):
+        decorators.append(timing_decorator(
+            config.registry, view_args.get('route_name'),
+            handler, action))
+    if view_args.pop('profile', True):
+        from pyramid_handlers.profiling import get_profiles
+        from pyramid_handlers.profiling import profile_decorator
+        profiles = get_profiles(config.registry)
+        if profiles is not None:
+            decorators.append(profile_decorator(
+                profiles, view_args.get('route_name'), handler, action))
+    decorators.append(view_args.get('decorator'))
+    etag = view_args.pop('etag', None)
+    last_modified = view_args.pop('last_modified', None)
+    if etag is not None or last_modified is not None:
+        from pyramid_handlers.conditional import conditional_decorator
+        decorators.append(conditional_decorator(
+            config.maybe_dotted(etag), config.maybe_dotted(last_modified)))
+    cache_ttl = view_args.pop('cache_ttl', None)
+    cache_vary = view_args.pop('cache_vary', None)
+    if cache_ttl is not None:
+        from pyramid_handlers.cache import cache_decorator
+        decorators.append(cache_decorator(
+            config.registry, view_args.get('route_name'), handler, action,
+            cache_ttl, cache_vary))
+    shared_cache = getattr(method, '__shared_cache__', None)
+    if shared_cache is not None:
+        from pyramid_handlers.cache import cache_decorator
+        from pyramid_handlers.sharedcache import get_shared_cache
+        ttl, vary = shared_cache
+        decorators.append(cache_decorator(
+            config.registry, view_args.get('route_name'), handler, action,
+            ttl, vary, get_shared_cache(config.registry)))
+    coalesce = view_args.pop('coalesce', False)
+    coalesce_key = view_args.pop('coalesce_key', None)
+    coalesce_timeout = view_args.pop('coalesce_timeout', None)
+    if coalesce:
+        from pyramid_handlers.coalesce import coalesce_decorator
+        decorators.append(coalesce_decorator(
+            config.maybe_dotted(coalesce_key), coalesce_timeout))
+    elif coalesce_key is not None or coalesce_timeout is not None:
+        raise ConfigurationError(
+            'coalesce_key and coalesce_timeout are only allowed with '
+            'coalesce=True')
+    max_concurrency = view_args.pop('max_concurrency', None)
+    max_queued = view_args.pop('max_queued', None)
+    queue_timeout = view_args.pop('queue_timeout', None)
+    if max_concurrency is not None:
+        from pyramid_handlers.limits import limit_decorator
+        decorators.append(limit_decorator(
+            config.registry, view_args.get('route_name'), handler, action,
+            max_concurrency, max_queued, queue_timeout))
+    elif max_queued is not None or queue_timeout is not None:
+        raise ConfigurationError(
+            'max_queued and queue_timeout are only allowed with '
+            'max_concurrency')
+    warmup = view_args.pop('warmup', False)
+    if warmup:
+        from pyramid_handlers.warmup import get_warmups
+        get_warmups(config.registry).add(
+            view_args.get('route_name'), action, warmup)
+    view_args['decorator'] = _compose_decorators(decorators)
+    # wrappers of the view calling the method, the innermost first
+    wrappers = []
+    if view_args.pop('allocations', True):
+        from pyramid_handlers.allocations import allocations_wrapper
+        from pyramid_handlers.allocations import get_allocations
+        allocations = get_allocations(config.registry)
+        if allocations is not None:
+            wrappers.append(allocations_wrapper(
+                allocations, view_args.get('route_name'), handler, action))
+    run = None
+    if _iscoroutinefunction(method):
+        from pyramid_handlers import aio
+        settings = config.registry.settings or {}
+        timeout = settings.get('pyramid_handlers.async_timeout')
+        timeout = float(timeout) if timeout else None
+        def run(coro):
+            return aio.event_loop.run(coro, timeout)
+    stream = view_args.pop('stream', False)
+    content_type = view_args.pop('content_type', None)
+    if stream:
+        from pyramid_handlers.streaming import DEFAULT_CONTENT_TYPE
+        from pyramid_handlers.streaming import stream_wrapper
+        wrappers.append(stream_wrapper(content_type or DEFAULT_CONTENT_TYPE))
+    elif content_type is not None:
+        raise ConfigurationError(
+            'content_type (%r) is only allowed with stream=True' % (
+                content_type,))
+    pool = view_args.pop('pool', None)
+    if view_args.pop('offload', False) or pool is not None:
+        from pyramid_handlers import pools
+        wrappers.append(pools.offload_wrapper(
+            pools.get_pool(config.registry, pool or pools.DEFAULT_POOL)))
+    scope = getattr(handler, '__handler_scope__', 'request')
+    if scope == 'request':
+        if run is not None:
+            wrappers.insert(0, lambda view: aio.coroutine_view(view, run))
+        if wrappers:
+            view_args['mapper'] = _wrapping_mapper(
+                config.registry, config.maybe_dotted(view_args.get('mapper')),
+                wrappers)
+        config.add_view(view=handler, attr=attr, **view_args)
+        return
+    if scope not in HandlerInstances.scopes:
+        raise ConfigurationError(
+            '__handler_scope__ of %r must be one of %r, not %r' % (
+                handler, ('request',) + HandlerInstances.scopes, scope))
+    view = handler_instances(handler, scope).view(attr or '__call__', run)
+    for wrapper in wrappers:
+        view = wrapper(view)
+    config.add_view(view=view, **view_args)
+
+
+def _wrapping_mapper(registry, mapper, wrappers):
+    """ Return a view mapper factory which maps views with ``mapper`` (by
+    default, the mapper Pyramid would use) and wraps the mapped views with
+    each of ``wrappers`` in turn."""
+    def factory(**kw):
+        def map_view(view):
+            inner = mapper
+            if inner is None:
+                inner = getattr(view, '__view_mapper__', None)
+            if inner is None:
+                inner = registry.queryUtility(
+                    IViewMapperFactory, default=DefaultViewMapper)
+            mapped = inner(**kw)(view)
+            for wrapper in wrappers:
+                mapped = wrapper(mapped)
+            return mapped
+        return map_view
+    return factory
+
+
+def _compose_decorators(decorators):
+    """ Return a view decorator applying each of ``decorators`` (the
+    outermost first; ``None`` items are skipped), or ``None``."""
+    decorators = [d for d in decorators if d is not None]
+    if not decorators:
+        return None
+    if len(decorators) == 1:
+        return decorators[0]
+    def decorator(view):
+        for d in reversed(decorators):
+            view = d(view)
+        return view
+    return decorator
+
+
+def handler_routes(registry):
+    """ Return the :class:`HandlerRoutes` of ``registry``, creating it if
+    needed."""
+    routes = registry.queryUtility(IHandlerRoutes)
+    if routes is None:
+        routes = HandlerRoutes()
+        registry.registerUtility(routes, IHandlerRoutes)
+    return routes
+
+
+@implementer(IHandlerRoutes)
+class HandlerRoutes(object):
+    """ A reverse index of the routes added by
+    :func:`~pyramid_handlers.add_handler`, from a handler (a class, or the
+    dotted name of a handler added with ``lazy=True``) and an action name
+    to a route name, used by :func:`url_for`.  When several routes lead to
+    the same action, the first one added wins."""
+    def __init__(self):
+        # (handler, action) -> (route name, whether action is in the path)
+        self.actions = {}
+        # handler -> the first route with an {action} in its pattern
+        self.any_action = {}
+        # route name -> handler
+        self.handlers = {}
+
+    def add(self, handler, route_name, action=None, in_path=False):
+        handler = _handler_key(handler)
+        self.handlers.setdefault(route_name, handler)
+        if in_path and action is None:
+            self.any_action.setdefault(handler, route_name)
+        else:
+            self.actions.setdefault((handler, action), (route_name, in_path))
+
+    def lookup(self, handler, action=None):
+        """ Return a ``(route_name, in_path)`` pair, where ``in_path`` tells
+        whether the action must be passed to the route as its ``action``
+        element, or ``None``."""
+        handler = _handler_key(handler)
+        found = self.actions.get((handler, action))
+        if found is None:
+            route_name = self.any_action.get(handler)
+            if route_name is not None:
+                found = (route_name, True)
+        return found
+
+
+def _handler_key(handler):
+    if isinstance(handler, string_types):
+        return handler.replace(':', '.')
+    return handler
+
+
+def url_for(request, handler, action=None, *elements, **kw):
+    """ Return the URL of the ``action`` of ``handler`` (a handler class,
+    or its dotted name), generated by :meth:`pyramid.request.Request.route_url`
+    for the route which :func:`~pyramid_handlers.add_handler` added for it.
+    ``elements`` and ``kw`` are passed to ``route_url``, along with
+    ``action`` if it is an element of the route's pattern.  Leaving
+    ``action`` out designates the action of a route added without one.
+    Raises :exc:`KeyError` if there is no such route."""
+    routes = request.registry.queryUtility(IHandlerRoutes)
+    found = None
+    if routes is not None:
+        found = routes.lookup(handler, action)
+        if found is None and not isinstance(handler, string_types):
+            # the handler may have been added lazily, by its dotted name
+            found = routes.lookup(qualified_name(handler), action)
+    if found is None:
+        raise KeyError('No route leads to the %r action of %r' % (
+            action, handler))
+    route_name, in_path = found
+    if in_path:
+        kw['action'] = action
+    return request.route_url(route_name, *elements, **kw)
+
+
+class HandlerInstances(object):
+    """ Hands out reusable instances of a handler class which declares a
+    ``__handler_scope__`` of ``thread`` (one instance per thread) or
+    ``process`` (one instance shared by all threads).
+
+    Such a handler is constructed without arguments and its actions are
+    called with the request.  An instance is only reused as long as it
+    stays stateless: if calling an action adds, removes or replaces any of
+    its attributes, the instance is thrown away, a warning is issued, and
+    from then on a new instance is created for every request.  A forked
+    process creates its own instances rather than using those of its
+    parent."""
+    scopes = ('thread', 'process')
+
+    def __init__(self, handler, scope):
+        self.handler = handler
+        self.scope = scope
+        self.reuse = True
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shared = None
+        self.pid = os.getpid()
+
+    def view(self, attr, run=None):
+        """ Return a view callable which calls the method ``attr`` of an
+        instance with the request.  If ``run`` is not ``None``, the result
+        of the method is passed to it (e.g. to run a coroutine)."""
+        def handler_view(context, request):
+            inst, state = self.acquire()
+            try:
+                result = getattr(inst, attr)(request)
+                if run is not None:
+                    result = run(result)
+                return result
+            finally:
+                if state is not None and self.changed(inst, state):
+                    self.refuse(inst, attr)
+        handler_view.__name__ = attr
+        handler_view.__module__ = self.handler.__module__
+        handler_view.__doc__ = getattr(self.handler, '__doc__', None)
+        return handler_view
+
+    def acquire(self):
+        """ Return an ``(instance, state)`` pair.  ``state`` is a copy of
+        the instance's attributes when it was created, or ``None`` if the
+        instance won't be reused."""
+        if not self.reuse:
+            return self.handler(), None
+        if self.pid != os.getpid():
+            # the instances of the parent may hold its connections, and
+            # its lock may have been held by one of its threads
+            self.local = threading.local()
+            self.lock = threading.Lock()
+            self.shared = None
+            self.pid = os.getpid()
+        if self.scope == 'thread':
+            slot = getattr(self.local, 'slot', None)
+            if slot is None:
+                slot = self.local.slot = self.create()
+            return slot
+        slot = self.shared
+        if slot is None:
+            with self.lock:
+                if self.shared is None:
+                    self.shared = self.create()
+                slot = self.shared
+        return slot
+
+    def create(self):
+        inst = self.handler()
+        return inst, dict(getattr(inst, '__dict__', {}))
+
+    def changed(self, inst, state):
+        attrs = getattr(inst, '__dict__', {})
+        if len(attrs) != len(state):
+            return True
+        for name, value in attrs.items():
+            if state.get(name, _marker) is not value:
+                return True
+        return False
+
+    def refuse(self, inst, attr):
+        if self.reuse:
+            self.reuse = False
+            warnings.warn(
+                'Instances of handler %r are no longer reused: the %r '
+                'action changed its attributes, but its __handler_scope__ '
+                'is %r' % (self.handler, attr, self.scope), RuntimeWarning)
+        self.local = threading.local()
+        self.shared = None
+
+def handler_instances(handler, scope):
+    """ Return the :class:`HandlerInstances` of ``handler`` for ``scope``,
+    creating them if needed."""
+    instances = _handler_instances.get(handler)
+    if instances is None or instances.scope != scope:
+        instances = _handler_instances[handler] = HandlerInstances(
+            handler, scope)
+    return instances
+
+_handler_instances = weakref.WeakKeyDictionary()
+_marker = object()
+_action_predicates = {}
 
 
 class ActionPredicate(object):
+    """ The view predicate matching the ``action`` of a request to an
+    action name, or to an action pattern of a :class:`ActionPatternGroup`.
+
+    Predicates are flyweights: constructing a predicate for an action name
+    (and, for a pattern, a group) which already has one returns that
+    predicate, so a handler mounted on many routes shares the predicates of
+    its literal actions between them."""
+    __slots__ = ('action', 'action_re', 'group', 'index')
     action_name = 'action'
-    def __init__(self, action):
-        self.action = action
+
+    def __new__(cls, action, group=None):
         try:
-            self.action_re = re.compile(action + '$')
-        except (re.error, TypeError) as why:
+            literal = literal_action_re.match(action)
+        except TypeError as why:
             raise ConfigurationError(why.args[0])
+        if literal or group is None:
+            # compared by equality, or matched alone; see __call__
+            group = None
+            interned = _action_predicates
+        else:
+            interned = group.predicates
+        key = (cls, action)
+        pred = interned.get(key)
+        if pred is not None:
+            return pred
+        pred = object.__new__(cls)
+        pred.action = action
+        pred.group = group
+        pred.index = None
+        if literal:
+            pred.action_re = None
+        else:
+            try:
+                pred.action_re = compile_action(action)
+            except re.error as why:
+                raise ConfigurationError(why.args[0])
+            if group is not None:
+                pred.index = group.add(action)
+        return interned.setdefault(key, pred)
 
     def __call__(self, context, request):
         matchdict = request.matchdict
@@ -171,6 +771,10 @@ class ActionPredicate(object):
         action = matchdict.get(self.action_name)
         if action is None:
             return False
+        if self.action_re is None:
+            return action == self.action
+        if self.group is not None:
+            return self.group.matches(self.index, action)
         return bool(self.action_re.match(action))
 
     def __hash__(self):
@@ -179,6 +783,232 @@ class ActionPredicate(object):
         return hash(self.action)
 
 
+class ActionDispatcher(object):
+    """ The one view registered for a handler route when
+    :func:`~pyramid_handlers.add_handler` is passed ``single_view=True``.
+
+    Each exposed method is registered as a view named after its action on
+    the same route; the dispatcher maps the ``action`` in the matchdict to
+    that view name with a dictionary lookup.  Actions which are regular
+    expressions are tried in registration order only when no literal action
+    matches."""
+    action_name = 'action'
+    view_name_prefix = 'pyramid_handlers.action:'
+
+    def __init__(self, route_name):
+        self.route_name = route_name
+        self.actions = {}
+        self.group = ActionPatternGroup()
+        self.pattern_views = []
+
+    def add(self, action):
+        """ Add ``action`` to the dispatch table and return the view name
+        that the views for it should be registered under."""
+        view_name = self.view_name_prefix + action
+        if literal_action_re.match(action):
+            self.actions[action] = view_name
+        elif self.group.add(action) == len(self.pattern_views):
+            self.pattern_views.append(view_name)
+        return view_name
+
+    def __call__(self, context, request):
+        matchdict = request.matchdict or {}
+        action = matchdict.get(self.action_name)
+        if action is not None:
+            view_name = self.actions.get(action)
+            if view_name is not None:
+                return self.call_view(view_name, context, request)
+            mismatch = None
+            for index in self.group.matching(action):
+                try:
+                    return self.call_view(self.pattern_views[index],
+                                          context, request)
+                except PredicateMismatch as why:
+                    mismatch = why
+            if mismatch is not None:
+                raise mismatch
+        raise PredicateMismatch(
+            'no action %r for route %r' % (action, self.route_name))
+
+    def call_view(self, view_name, context, request):
+        request_iface = getattr(request, 'request_iface', IRequest)
+        view = request.registry.adapters.lookup(
+            (IViewClassifier, request_iface, providedBy(context)),
+            IView, name=view_name)
+        if view is None:
+            raise PredicateMismatch(view_name)
+        return view(context, request)
+
+
+class ActionPatternGroup(object):
+    """ The action names of one handler route which are regular
+    expressions.
+
+    Rather than evaluating each pattern in turn, the patterns are compiled
+    into a single alternation with a named group per pattern, so one match
+    finds the first pattern (in registration order) that matches an action.
+    The result is remembered for recently seen actions."""
+    group_name = '_action%d'
+    backref_re = re.compile(r'\\[1-9]|\(\?P=')
+    memo_size = 256
+
+    def __init__(self):
+        self.patterns = []
+        # the ActionPredicate of each pattern
+        self.predicates = {}
+        self.memo = {}
+        self.action_re = None
+        self.indexes = None
+
+    def add(self, action):
+        """ Add the pattern ``action`` (if it isn't already part of the
+        group) and return its index."""
+        if action in self.patterns:
+            return self.patterns.index(action)
+        self.patterns.append(action)
+        self.memo = {}
+        self.action_re = None
+        return len(self.patterns) - 1
+
+    def compile(self):
+        """ Compile the alternation.  If the patterns can't be combined
+        (they use backreferences or clashing group names), they are matched
+        one by one instead."""
+        alternatives = []
+        for index, pattern in enumerate(self.patterns):
+            if self.backref_re.search(pattern):
+                # group numbers would shift in the alternation
+                alternatives = None
+                break
+            alternatives.append(
+                '(?P<%s>%s$)' % (self.group_name % index, pattern))
+        if alternatives is not None:
+            try:
+                action_re = re.compile('|'.join(alternatives))
+            except re.error:
+                pass
+            else:
+                self.indexes = dict(
+                    (action_re.groupindex[self.group_name % index], index)
+                    for index in range(len(self.patterns)))
+                self.action_re = action_re
+                return
+        self.indexes = None
+        self.action_re = False
+
+    def first(self, action):
+        """ Return the index of the first pattern which matches ``action``
+        or ``None`` if no pattern does."""
+        if not self.patterns:
+            return None
+        try:
+            return self.memo[action]
+        except KeyError:
+            pass
+        if self.action_re is None:
+            self.compile()
+        index = None
+        if self.action_re:
+            match = self.action_re.match(action)
+            if match is not None:
+                index = self.indexes[match.lastindex]
+        else:
+            for i, pattern in enumerate(self.patterns):
+                if compile_action(pattern).match(action):
+                    index = i
+                    break
+        memo = self.memo
+        if len(memo) >= self.memo_size:
+            memo.clear()
+        memo[action] = index
+        return index
+
+    def matches(self, index, action):
+        """ Return true if the pattern at ``index`` matches ``action``."""
+        first = self.first(action)
+        if first is None or first > index:
+            return False
+        if first == index:
+            return True
+        # an earlier pattern won; this one may match too
+        return bool(compile_action(self.patterns[index]).match(action))
+
+    def matching(self, action):
+        """ Yield the index of every pattern that matches ``action``, in
+        registration order."""
+        first = self.first(action)
+        if first is None:
+            return
+        yield first
+        for index in range(first + 1, len(self.patterns)):
+            if compile_action(self.patterns[index]).match(action):
+                yield index
+
+
+class LazyHandler(ActionDispatcher):
+    """ The placeholder view registered for a route when
+    :func:`~pyramid_handlers.add_handler` is passed ``lazy=True`` and the
+    dotted name of a handler.
+
+    When the route is first matched, the handler is imported and its views
+    are registered (as they would be for ``single_view=True``); the
+    placeholder then dispatches to them."""
+    def __init__(self, route_name, handler_name, package, action, scan,
+                 default_view_args):
+        ActionDispatcher.__init__(self, route_name)
+        self.handler_name = handler_name
+        self.package = package
+        self.action = action
+        self.scan = scan
+        self.default_view_args = default_view_args
+        self.handler = None
+        self.lock = threading.Lock()
+
+    def load(self, registry):
+        """ Import the handler and register its views in ``registry``,
+        unless that has already been done."""
+        with self.lock:
+            if self.handler is not None:
+                return
+            config = Configurator(registry=registry, package=self.package,
+                                  autocommit=True)
+            handler = config.maybe_dotted(self.handler_name)
+            add_handler_views(config, handler, self.route_name, self.action,
+                              self.scan, self, self.default_view_args)
+            self.handler = handler
+
+    def __call__(self, context, request):
+        if self.handler is None:
+            self.load(request.registry)
+        if not self.scan:
+            return self.call_view(self.view_name_prefix, context, request)
+        return ActionDispatcher.__call__(self, context, request)
+
+
+_action_res = {}
+
+def compile_action(action):
+    """ Return the compiled regular expression which matches the action
+    name (or action pattern) ``action``.  Compiled patterns are shared by
+    every predicate in the process which uses the same action."""
+    action_re = _action_res.get(action)
+    if action_re is None:
+        action_re = _action_res.setdefault(action, re.compile(action + '$'))
+    return action_re
+
+
+_autoexpose_res = {}
+
+def compile_autoexpose(autoexpose):
+    """ Return the compiled form of the ``__autoexpose__`` regular
+    expression ``autoexpose``, shared by every handler which uses it."""
+    autoexpose_re = _autoexpose_res.get(autoexpose)
+    if autoexpose_re is None:
+        autoexpose_re = _autoexpose_res.setdefault(
+            autoexpose, re.compile(autoexpose))
+    return autoexpose_re
+
+
 class action(object):
     """Decorate a method for registration by 
     :func:`~pyramid_handlers.add_handler`.
@@ -190,7 +1020,64 @@ class action(object):
         Designate an alternate action name, rather than the default behavior
         of registering a view with the action name being set to the methods
         name.
-    
+
+    The following arguments are handled by ``pyramid_handlers`` itself
+    rather than passed to ``add_view``:
+
+    ``timing``
+        Whether to count the latency of the action in a histogram (see
+        :mod:`pyramid_handlers.timing`); by default, the ``timing`` argument
+        of ``add_handler``.
+
+    ``profile``
+        Whether to profile a sample of the requests of the action when the
+        ``pyramid_handlers.profile.rate`` setting enables it (see
+        :mod:`pyramid_handlers.profiling`); true by default.
+
+    ``allocations``
+        Whether to trace the memory allocated by a sample of the calls of
+        the action when the ``pyramid_handlers.allocations.rate`` setting
+        enables it (see :mod:`pyramid_handlers.allocations`); true by
+        default.
+
+    ``offload``, ``pool``
+        Run the action on a thread of the named pool (see
+        :mod:`pyramid_handlers.pools`).
+
+    ``stream``, ``content_type``
+        Stream the chunks of the iterable the action returns as the body of
+        a response of type ``content_type`` (see
+        :mod:`pyramid_handlers.streaming`).
+
+    ``etag``, ``last_modified``
+        Functions of the request computing the validators of the response,
+        which answer ``304 Not Modified`` to conditional requests for a
+        version the client has without calling the action (see
+        :mod:`pyramid_handlers.conditional`).
+
+    ``cache_ttl``, ``cache_vary``
+        Cache the responses of the action for ``cache_ttl`` seconds, varying
+        on the named query string parameters and headers (see
+        :mod:`pyramid_handlers.cache`).
+
+    ``max_concurrency``, ``max_queued``, ``queue_timeout``
+        Let at most ``max_concurrency`` requests run the action at once, and
+        at most ``max_queued`` more wait for at most ``queue_timeout``
+        seconds, answering ``503 Service Unavailable`` to the others (see
+        :mod:`pyramid_handlers.limits`).
+
+    ``coalesce``, ``coalesce_key``, ``coalesce_timeout``
+        Make identical concurrent ``GET`` requests (according to the
+        ``coalesce_key`` function of the request, if any) share the
+        response of the first one, waiting for it for at most
+        ``coalesce_timeout`` seconds (see :mod:`pyramid_handlers.coalesce`).
+
+    ``warmup``
+        Send a synthetic request to the action when the application is
+        created, if the ``pyramid_handlers.warmup`` setting is true; a dict
+        gives elements of the URL of the route (see
+        :mod:`pyramid_handlers.warmup`).
+
     """
     def __init__(self, **kw):
         self.kw = kw
@@ -202,14 +1089,59 @@ class action(object):
             wrapped.__exposed__ = [self.kw]
         return wrapped
 
+_method_info_cache = weakref.WeakKeyDictionary()
+
 def get_method_info(cls):
-    if PY3: # pragma: no cover
-        # no unbound methods in Py3
-        method_info = inspect.getmembers(cls, inspect.isfunction)
-    else:
-        method_info = inspect.getmembers(cls, inspect.ismethod)
+    """ Return a list of ``(name, function)`` pairs, sorted by name, of the
+    methods of ``cls`` (including inherited methods and static methods).
+
+    The class and its bases are examined through their ``__dict__`` so that
+    no descriptor is triggered.  The result is cached per class; the cache
+    is invalidated when an attribute of the class or one of its bases is
+    added, removed or replaced."""
+    if not PY3: # pragma: no cover
+        return inspect.getmembers(cls, inspect.ismethod)
+    dicts = [vars(klass) for klass in cls.__mro__ if klass is not object]
+    signature = tuple((tuple(d), tuple(map(id, d.values()))) for d in dicts)
+    cached = _method_info_cache.get(cls)
+    if cached is not None and cached[0] == signature:
+        # only weak references are cached; a method using super() refers
+        # to its class, which would keep the class alive
+        method_info = [(name, ref()) for name, ref in cached[1]]
+        if None not in [method for name, method in method_info]:
+            return method_info
+    methods = {}
+    for d in reversed(dicts):
+        for name, value in d.items():
+            if isinstance(value, staticmethod):
+                value = value.__func__
+            if inspect.isfunction(value):
+                methods[name] = value
+            else:
+                # shadowed by something which isn't a function
+                methods.pop(name, None)
+    method_info = sorted(methods.items())
+    refs = [(name, weakref.ref(method)) for name, method in method_info]
+    _method_info_cache[cls] = (signature, refs)
     return method_info
 
 def includeme(config):
     config.add_directive('add_handler', add_handler)
+    config.add_renderer('json_stream', JSONStream())
+    settings = config.registry.settings or {}
+    path = settings.get('pyramid_handlers.manifest')
+    if path:
+        xformer = xformer_id(settings.get(
+            'pyramid_handlers.method_name_xformer'))
+        config.registry.registerUtility(
+            HandlerManifest.from_file(path, xformer), IHandlerManifest)
+    if asbool(settings.get('pyramid_handlers.warmup')):
+        from pyramid.events import ApplicationCreated
+        from pyramid_handlers.warmup import warm_up_subscriber
+        # before freeze, so that what the warm-up creates is frozen too
+        config.add_subscriber(warm_up_subscriber, ApplicationCreated)
+    if asbool(settings.get('pyramid_handlers.preload')):
+        from pyramid.events import ApplicationCreated
+        from pyramid_handlers.preload import freeze
+        config.add_subscriber(freeze, ApplicationCreated)
     
@@ -0,0 +1,84 @@
+""" Support for handler actions written as ``async def`` coroutine
+functions.
+
+A WSGI worker thread can't ``await``, so the coroutine of such an action
+is run on an event loop running in a separate thread, one per process (it
+is started the first time it is needed, and again in a process forked from
+one which had started it), while the worker thread waits for its result.
+Coroutines of requests served concurrently by different worker threads
+share the loop, and a coroutine may ``await`` several I/O calls at once
+(e.g. with ``asyncio.gather``).
+"""
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+from pyramid.httpexceptions import HTTPGatewayTimeout
+
+class EventLoopThread(object):
+    """ An asyncio event loop running forever in a daemon thread."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.pid = None
+
+    def get_loop(self):
+        """ Return the running loop, starting it if needed."""
+        loop = self.loop
+        if loop is not None and self.pid == os.getpid():
+            return loop
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                # a forked process inherits the loop, but not its thread
+                self.start()
+            return self.loop
+
+    def start(self):
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+        thread = threading.Thread(target=run,
+                                  name='pyramid_handlers event loop')
+        thread.daemon = True
+        thread.start()
+        started.wait()
+        self.loop, self.thread, self.pid = loop, thread, os.getpid()
+
+    def stop(self):
+        """ Stop the loop and wait for its thread to exit."""
+        with self.lock:
+            loop, thread = self.loop, self.thread
+            self.loop = self.thread = self.pid = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def run(self, coro, timeout=None):
+        """ Run the coroutine ``coro`` on the loop and return its result.
+        If it takes more than ``timeout`` seconds, it is cancelled and
+        :class:`pyramid.httpexceptions.HTTPGatewayTimeout` is raised."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise HTTPGatewayTimeout()
+
+event_loop = EventLoopThread()
+
+
+def coroutine_view(view, run=event_loop.run):
+    """ Return a view callable calling ``view`` and passing the coroutines
+    it returns to ``run``, which returns their result."""
+    def coroutine_view(context, request):
+        result = view(context, request)
+        if asyncio.iscoroutine(result):
+            result = run(result)
+        return result
+    return coroutine_view
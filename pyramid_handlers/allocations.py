@@ -0,0 +1,211 @@
+""" Sampling of the memory allocated by handler actions.
+
+When the ``pyramid_handlers.allocations.rate`` setting is a fraction above
+0, that fraction of the calls of every handler method registered by
+:func:`pyramid_handlers.add_handler` is traced with :mod:`tracemalloc`.
+For each sampled call, the memory allocated at the peak of the call and
+still allocated after it (retained) are recorded, along with the call
+sites which allocated the most of the retained memory, in an
+:class:`ActionAllocations` utility of the registry::
+
+  from pyramid_handlers.allocations import dump_allocations
+  print(dump_allocations(registry))
+
+The other settings are ``pyramid_handlers.allocations.frames``, the number
+of frames of the tracebacks of call sites (1 by default), and
+``pyramid_handlers.allocations.top``, the number of call sites kept per
+action (10 by default).
+
+Only the call of the handler method (and its instantiation) is traced, not
+the rendering of its result.  :mod:`tracemalloc` traces a whole process, so
+one call is sampled at a time, and the allocations of other threads made
+during that call are counted too: sampled numbers are most telling on a
+lightly loaded process, or summed over many requests.  Tracing slows the
+process down while a call is sampled, and :mod:`tracemalloc` is only
+started for sampled calls (and stopped after them) unless it was already
+running.
+"""
+import random
+import threading
+import tracemalloc
+
+from pyramid.exceptions import ConfigurationError
+
+from zope.interface import implementer
+
+from pyramid_handlers.interfaces import IActionAllocations
+from pyramid_handlers.manifest import qualified_name
+
+DEFAULT_FRAMES = 1
+DEFAULT_TOP = 10
+
+class Allocations(object):
+    """ The allocations of the sampled calls of one action: ``count``
+    calls, the largest and total ``peak`` and ``retained`` bytes, and the
+    bytes allocated by each of the top ``sites``."""
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.lock = threading.Lock()
+        self.count = 0
+        self.peak_max = 0
+        self.peak_total = 0
+        self.retained_max = 0
+        self.retained_total = 0
+        self.sites = {}
+
+    def record(self, peak, retained, sites):
+        """ Count a call which allocated ``peak`` bytes at most and
+        ``retained`` bytes for good; ``sites`` are ``(site, size)`` pairs
+        of the bytes allocated by call sites."""
+        with self.lock:
+            self.count += 1
+            self.peak_total += peak
+            self.peak_max = max(self.peak_max, peak)
+            self.retained_total += retained
+            self.retained_max = max(self.retained_max, retained)
+            for site, size in sites:
+                self.sites[site] = self.sites.get(site, 0) + size
+            if len(self.sites) > self.top * 10:
+                # forget the call sites which allocate the least
+                self.sites = dict(self.top_sites(self.top * 5))
+
+    def top_sites(self, top=None):
+        """ Return ``(site, size)`` pairs of the call sites which allocated
+        the most bytes over all calls, largest first."""
+        sites = sorted(self.sites.items(), key=lambda item: -item[1])
+        return sites[:top or self.top]
+
+
+@implementer(IActionAllocations)
+class ActionAllocations(object):
+    """ The :class:`Allocations` of every sampled action, keyed by
+    ``(route_name, handler_name, action)``."""
+    def __init__(self, rate, frames=DEFAULT_FRAMES, top=DEFAULT_TOP):
+        self.rate = rate
+        self.frames = frames
+        self.top = top
+        self.allocations = {}
+        # tracemalloc traces the whole process
+        self.tracing = threading.Lock()
+
+    def sample(self):
+        """ Return true if a call should be traced."""
+        return random.random() < self.rate
+
+    def get(self, route_name, handler_name, action):
+        key = (route_name, handler_name, action)
+        allocations = self.allocations.get(key)
+        if allocations is None:
+            allocations = self.allocations[key] = Allocations(self.top)
+        return allocations
+
+    def __iter__(self):
+        return iter(sorted(self.allocations.items()))
+
+    def dump(self):
+        """ Return the allocations as text: a summary line per action,
+        followed by its top call sites."""
+        lines = []
+        for (route_name, handler_name, action), allocations in self:
+            count = allocations.count
+            if not count:
+                continue
+            lines.append(
+                '%s %s %s count=%d peak_mean=%s peak_max=%s '
+                'retained_mean=%s retained_max=%s' % (
+                    route_name, handler_name, action, count,
+                    _kib(allocations.peak_total / count),
+                    _kib(allocations.peak_max),
+                    _kib(allocations.retained_total / count),
+                    _kib(allocations.retained_max)))
+            for site, size in allocations.top_sites():
+                lines.append('  %10s %s' % (_kib(size), site))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _kib(size):
+    return '%.1fKiB' % (size / 1024.0)
+
+
+def get_allocations(registry):
+    """ Return the :class:`ActionAllocations` of ``registry``, creating it
+    from the settings if allocation sampling is enabled, or ``None``."""
+    allocations = registry.queryUtility(IActionAllocations)
+    if allocations is None:
+        settings = registry.settings or {}
+        prefix = 'pyramid_handlers.allocations.'
+        try:
+            rate = float(settings.get(prefix + 'rate') or 0)
+            frames = int(settings.get(prefix + 'frames') or DEFAULT_FRAMES)
+            top = int(settings.get(prefix + 'top') or DEFAULT_TOP)
+        except ValueError:
+            rate = frames = top = -1
+        if not 0 <= rate <= 1 or frames < 1 or top < 1:
+            raise ConfigurationError(
+                'bad value for a %s{rate,frames,top} setting' % prefix)
+        if not rate:
+            return None
+        allocations = ActionAllocations(rate, frames, top)
+        registry.registerUtility(allocations, IActionAllocations)
+    return allocations
+
+
+def dump_allocations(registry):
+    """ Return the sampled allocations of ``registry`` as text."""
+    allocations = registry.queryUtility(IActionAllocations)
+    if allocations is None:
+        return ''
+    return allocations.dump()
+
+
+def allocations_wrapper(allocations, route_name, handler, action):
+    """ Return a function wrapping a view callable so that a sample of its
+    calls is traced into the allocations of ``action`` of ``handler`` on
+    the route named ``route_name`` in ``allocations``."""
+    record = allocations.get(
+        route_name, qualified_name(handler), action).record
+    def wrapper(view):
+        def traced_view(context, request):
+            if (not allocations.sample() or
+                not allocations.tracing.acquire(False)):
+                return view(context, request)
+            try:
+                started = not tracemalloc.is_tracing()
+                if started:
+                    tracemalloc.start(allocations.frames)
+                try:
+                    return _trace(view, context, request, record)
+                finally:
+                    if started:
+                        tracemalloc.stop()
+            finally:
+                allocations.tracing.release()
+        return traced_view
+    return wrapper
+
+
+def _trace(view, context, request, record):
+    reset_peak = getattr(tracemalloc, 'reset_peak', None)
+    if reset_peak is not None:
+        reset_peak()
+    before = _snapshot()
+    start = tracemalloc.get_traced_memory()[0]
+    try:
+        return view(context, request)
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        after = _snapshot()
+        sites = [(_site(stat.traceback), stat.size_diff)
+                 for stat in after.compare_to(before, 'traceback')
+                 if stat.size_diff > 0]
+        record(max(peak - start, 0), max(current - start, 0), sites)
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),))
+
+
+def _site(traceback):
+    # most recent frame first
+    return ' <- '.join(str(frame) for frame in reversed(traceback))
@@ -0,0 +1,263 @@
+""" Batches of calls to the actions of a handler.
+
+``config.add_handler('users', '/users/{action}', Users,
+batch='/users/_batch')`` adds, next to the ``users`` route, a route named
+``users.batch`` accepting ``POST`` requests whose JSON body is a list of
+calls to actions of the handler::
+
+  [{"action": "profile", "params": {"id": "42"}},
+   {"action": "friends", "params": {"id": "42", "page": "2"}}]
+
+The response is a JSON list of the result of each call, in the same order::
+
+  [{"action": "profile", "status": 200,
+    "content_type": "application/json", "body": {"name": "..."}},
+   ...]
+
+The ``body`` of a call is decoded if it is JSON, and text otherwise.  The
+calls are made in-process: the request is authenticated once, the
+permission of every action is checked against it before any action runs,
+and the actions are called one after the other on a single instance of the
+handler, each with ``params`` as the query string of the request and a
+fresh ``request.response``.  If ``batch_pool`` names a pool (see
+:mod:`pyramid_handlers.pools`), the calls run concurrently on its threads
+instead, each with its own handler instance and a copy of the request.
+A handler with a ``__handler_scope__`` gets its instances the way its
+views do, and its actions are called with the request.
+
+The views registered for the actions aren't involved: view predicates,
+``__action_decorator__`` and the options of :class:`~pyramid_handlers.action`
+other than ``renderer``, ``permission`` and the concurrency limits of
+:mod:`pyramid_handlers.limits` don't apply to batched calls.  A batched
+call of a limited action takes a turn like a request to it does, and gets a
+``503`` result when the action is too busy.
+Batches longer than the ``pyramid_handlers.batch.max_calls`` setting (20
+by default) get a ``400 Bad Request`` response.
+"""
+import inspect
+import io
+import json
+import sys
+
+from pyramid.httpexceptions import HTTPBadRequest
+from pyramid.httpexceptions import HTTPException
+from pyramid.httpexceptions import HTTPForbidden
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.interfaces import IDefaultPermission
+from pyramid.interfaces import IResponse
+from pyramid.renderers import render_to_response
+from pyramid.response import Response
+from pyramid.security import NO_PERMISSION_REQUIRED
+
+try:
+    from urllib.parse import urlencode
+except ImportError: # pragma: no cover (Python 2)
+    from urllib import urlencode
+
+from pyramid_handlers import ActionPatternGroup
+from pyramid_handlers import handler_instances
+from pyramid_handlers import literal_action_re
+
+DEFAULT_MAX_CALLS = 20
+
+class HandlerBatch(object):
+    """ The view of the batch route of a handler.  Relative renderer names
+    are resolved against ``package`` (by default, the module of the
+    handler), as those of the views are against the package of the
+    configurator; coroutines are given at most ``async_timeout`` seconds.
+    """
+    def __init__(self, handler, permission=None, pool=None,
+                 max_calls=DEFAULT_MAX_CALLS, package=None,
+                 async_timeout=None):
+        self.handler = handler
+        if package is None:
+            package = sys.modules.get(handler.__module__)
+        self.package = package
+        self.async_timeout = async_timeout
+        self.permission = permission
+        self.pool = pool
+        self.max_calls = max_calls
+        self.actions = {}
+        self.group = ActionPatternGroup()
+        self.pattern_calls = []
+        scope = getattr(handler, '__handler_scope__', 'request')
+        self.instances = None
+        if scope != 'request':
+            self.instances = handler_instances(handler, scope)
+
+    def instance(self, request):
+        """ Return the instance of the handler whose methods are called,
+        or ``None`` if the handler has a ``__handler_scope__``."""
+        if self.instances is not None:
+            return None
+        return self.handler(request)
+
+    def add(self, action, attr, view_args, limit=None):
+        """ Make ``action`` call the method ``attr`` of the handler, with
+        the view configuration ``view_args``, and within the
+        :class:`~pyramid_handlers.limits.ActionLimit` ``limit`` if it isn't
+        ``None``.  Only the first view configuration of an action which
+        accepts ``GET`` requests is used."""
+        methods = view_args.get('request_method')
+        if methods is not None and 'GET' not in methods:
+            return
+        if literal_action_re.match(action):
+            self.actions.setdefault(action, (attr, view_args, limit))
+        elif self.group.add(action) == len(self.pattern_calls):
+            self.pattern_calls.append((attr, view_args, limit))
+
+    def find(self, action):
+        """ Return the ``(attr, view_args, limit)`` triple of ``action``, or
+        ``None``."""
+        found = self.actions.get(action)
+        if found is None:
+            index = self.group.first(action)
+            if index is not None:
+                found = self.pattern_calls[index]
+        return found
+
+    def __call__(self, context, request):
+        try:
+            calls = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            raise HTTPBadRequest('The body of a batch must be JSON')
+        if (not isinstance(calls, list) or len(calls) > self.max_calls or
+            not all(isinstance(call, dict) and
+                    isinstance(call.get('action'), str) and
+                    isinstance(call.get('params', {}), dict)
+                    for call in calls)):
+            raise HTTPBadRequest(
+                'A batch must be a list of at most %d {"action": ..., '
+                '"params": {...}} objects' % self.max_calls)
+        results = []
+        pending = []
+        for call in calls:
+            action = call['action']
+            found = self.find(action)
+            if found is None:
+                results.append(HTTPNotFound())
+                continue
+            attr, view_args, limit = found
+            permission = view_args.get('permission', self.permission)
+            if permission is None:
+                permission = request.registry.queryUtility(
+                    IDefaultPermission)
+            if (permission is not None and
+                permission != NO_PERMISSION_REQUIRED and
+                not request.has_permission(permission, context)):
+                results.append(HTTPForbidden())
+                continue
+            results.append(None)
+            pending.append((len(results) - 1, action, attr, view_args,
+                            limit, call.get('params', {})))
+        if self.pool is None:
+            self.call_in_turn(request, results, pending)
+        else:
+            self.call_concurrently(request, results, pending)
+        body = [_result(call['action'], response)
+                for call, response in zip(calls, results)]
+        return Response(json.dumps(body), content_type='application/json',
+                        charset='UTF-8')
+
+    def call_in_turn(self, request, results, pending):
+        if not pending:
+            return
+        environ = request.environ
+        saved = (environ['REQUEST_METHOD'], environ.get('QUERY_STRING', ''),
+                 request.matchdict)
+        inst = self.instance(request)
+        try:
+            for index, action, attr, view_args, limit, params in pending:
+                environ['REQUEST_METHOD'] = 'GET'
+                environ['QUERY_STRING'] = urlencode(params, doseq=True)
+                request.matchdict = dict(saved[2] or {}, action=action)
+                request.__dict__.pop('response', None)
+                results[index] = self.call(inst, attr, view_args, request,
+                                           limit)
+        finally:
+            environ['REQUEST_METHOD'], environ['QUERY_STRING'] = saved[:2]
+            request.matchdict = saved[2]
+            request.__dict__.pop('response', None)
+
+    def call_concurrently(self, request, results, pending):
+        from pyramid_handlers.pools import _call_view
+        futures = []
+        for index, action, attr, view_args, limit, params in pending:
+            subrequest = _subrequest(request, action, params)
+            def view(context, subrequest, attr=attr, view_args=view_args,
+                     limit=limit):
+                inst = self.instance(subrequest)
+                return self.call(inst, attr, view_args, subrequest, limit)
+            try:
+                future = self.pool.submit(_call_view, view, None, subrequest)
+            except HTTPException as why:
+                results[index] = why
+            else:
+                futures.append((index, future))
+        for index, future in futures:
+            try:
+                results[index] = self.pool.result(future)
+            except HTTPException as why:
+                results[index] = why
+
+    def call(self, inst, attr, view_args, request, limit=None):
+        """ Call the method ``attr`` of ``inst`` (or of an instance of a
+        handler with a ``__handler_scope__``), within ``limit`` if it isn't
+        ``None``, and return its response."""
+        try:
+            if limit is None:
+                return self.respond(inst, attr, view_args, request)
+            limit.acquire()
+            try:
+                return self.respond(inst, attr, view_args, request)
+            finally:
+                limit.release()
+        except HTTPException as why:
+            return why
+
+    def respond(self, inst, attr, view_args, request):
+        """ Call the method ``attr`` and return its response, rendering its
+        result if needed."""
+        if self.instances is not None:
+            value = self.instances.view(attr)(None, request)
+        else:
+            value = getattr(inst, attr)()
+        if _iscoroutine(value):
+            from pyramid_handlers.aio import event_loop
+            value = event_loop.run(value, self.async_timeout)
+        if IResponse.providedBy(value):
+            return value
+        renderer = view_args.get('renderer')
+        if renderer is None:
+            raise ValueError(
+                'The %r method of %r returned %r, which is not a response, '
+                'and has no renderer' % (attr, self.handler, value))
+        return render_to_response(renderer, value, request,
+                                  package=self.package,
+                                  response=request.response)
+
+
+_iscoroutine = getattr(inspect, 'iscoroutine', lambda value: False)
+
+
+def _subrequest(request, action, params):
+    environ = request.environ.copy()
+    environ['REQUEST_METHOD'] = 'GET'
+    environ['QUERY_STRING'] = urlencode(params, doseq=True)
+    environ['CONTENT_LENGTH'] = '0'
+    environ['wsgi.input'] = io.BytesIO()
+    subrequest = request.__class__(environ)
+    subrequest.registry = request.registry
+    subrequest.matched_route = request.matched_route
+    subrequest.matchdict = dict(request.matchdict or {}, action=action)
+    return subrequest
+
+
+def _result(action, response):
+    content_type = response.content_type
+    if content_type == 'application/json':
+        body = json.loads(response.body.decode(response.charset or 'UTF-8'))
+    else:
+        body = response.body.decode(response.charset or 'UTF-8', 'replace')
+    return {'action': action, 'status': response.status_int,
+            'content_type': content_type, 'body': body}
@@ -0,0 +1,211 @@
+""" Benchmarks of handler registration and dispatch.
+
+Builds synthetic handler classes exposing from one to thousands of actions,
+registers them with :func:`pyramid_handlers.add_handler` and measures:
+
+- the time it takes to register (and commit) the handler's views;
+
+- the latency of dispatching a request to the first, middle and last
+  action through a real Pyramid router;
+
+- the memory allocated per registered action, with the handler mounted
+  on one route or (``--routes``) on many;
+
+- the extra registration time a ``pyramid_handlers.method_name_xformer``
+  costs.
+
+Results are written as JSON so that two runs can be compared::
+
+  $ phandlersbench --output before.json
+  ... change something ...
+  $ phandlersbench --output after.json --compare before.json
+"""
+import gc
+import json
+import optparse
+import platform
+import sys
+import time
+import tracemalloc
+
+from pyramid.config import Configurator
+from pyramid.request import Request
+from pyramid.response import Response
+
+import pyramid_handlers
+
+DEFAULT_SIZES = (1, 10, 100, 1000, 5000)
+DEFAULT_MODES = ('predicates', 'single_view')
+
+def make_handler(size):
+    """ Return a handler class exposing ``size`` actions named
+    ``action_0`` through ``action_<size - 1>``."""
+    attrs = {'__init__': _init}
+    for i in range(size):
+        attrs['action_%d' % i] = _make_action(i)
+    return type('BenchmarkHandler%d' % size, (object,), attrs)
+
+def _init(self, request):
+    self.request = request
+
+def _make_action(i):
+    body = ('action %d' % i).encode('ascii')
+    def action(self):
+        return Response(body)
+    return action
+
+def _xformer(name):
+    return name.replace('_', '-')
+
+def _configure(handler, mode, xformer=None, routes=1):
+    settings = {}
+    if xformer is not None:
+        settings['pyramid_handlers.method_name_xformer'] = xformer
+    config = Configurator(settings=settings)
+    config.include(pyramid_handlers)
+    config.add_handler('bench', '/bench/{action}', handler,
+                       single_view=(mode == 'single_view'))
+    for i in range(1, routes):
+        config.add_handler('bench%d' % i, '/bench%d/{action}' % i, handler,
+                           single_view=(mode == 'single_view'))
+    config.commit()
+    return config
+
+def time_registration(handler, mode, xformer=None, repeat=3):
+    """ Return the best time, in seconds, of registering ``handler``."""
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        _configure(handler, mode, xformer)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def measure_memory(handler, mode, routes=1):
+    """ Return the number of bytes allocated (and still alive) by
+    registering ``handler`` on ``routes`` routes, and the configurator
+    holding on to them."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        config = _configure(handler, mode, routes=routes)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, config
+
+def time_dispatch(app, path, requests):
+    """ Return the mean latency, in seconds, of ``requests`` requests for
+    ``path`` made to the WSGI application ``app``."""
+    environ = Request.blank(path).environ
+    statuses = []
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+    for i in range(min(requests, 10)):
+        b''.join(app(environ.copy(), start_response))
+    if not statuses[-1].startswith('200'):
+        raise RuntimeError('%s returned %s' % (path, statuses[-1]))
+    start = time.perf_counter()
+    for i in range(requests):
+        b''.join(app(environ.copy(), start_response))
+    return (time.perf_counter() - start) / requests
+
+def run(sizes=DEFAULT_SIZES, modes=DEFAULT_MODES, requests=1000, routes=1):
+    """ Run the benchmarks and return the results as a dictionary."""
+    results = []
+    for size in sizes:
+        handler = make_handler(size)
+        for mode in modes:
+            registration = time_registration(handler, mode)
+            with_xformer = time_registration(handler, mode, _xformer)
+            memory, config = measure_memory(handler, mode, routes)
+            app = config.make_wsgi_app()
+            dispatch = {}
+            for position, i in (('first', 0), ('middle', size // 2),
+                                ('last', size - 1)):
+                dispatch[position] = time_dispatch(
+                    app, '/bench/action_%d' % i, requests)
+            results.append({
+                'size': size,
+                'mode': mode,
+                'registration': registration,
+                'registration_per_action': registration / size,
+                'xformer_overhead_per_action': (
+                    with_xformer - registration) / size,
+                'memory_per_action': memory / float(size * routes),
+                'dispatch': dispatch,
+                })
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'requests': requests,
+        'routes': routes,
+        'results': results,
+        }
+
+def compare(current, baseline):
+    """ Yield lines comparing the ``current`` results to ``baseline``
+    results (as returned by :func:`run`); ratios above 1 are slowdowns."""
+    old = dict(((r['size'], r['mode']), r) for r in baseline['results'])
+    for result in current['results']:
+        before = old.get((result['size'], result['mode']))
+        if before is None:
+            continue
+        values = [('registration', result['registration'],
+                   before['registration']),
+                  ('memory_per_action', result['memory_per_action'],
+                   before['memory_per_action'])]
+        for position in sorted(result['dispatch']):
+            values.append(('dispatch_' + position,
+                           result['dispatch'][position],
+                           before['dispatch'][position]))
+        for name, now, then in values:
+            ratio = now / then if then else float('nan')
+            yield '%6d %-12s %-22s %12.6g %12.6g %7.2fx' % (
+                result['size'], result['mode'], name, then, now, ratio)
+
+def main(argv=sys.argv, out=sys.stdout):
+    parser = optparse.OptionParser(
+        usage='%prog [options]',
+        description='Benchmark pyramid_handlers registration and dispatch.')
+    parser.add_option('-s', '--sizes', default=','.join(
+        str(size) for size in DEFAULT_SIZES),
+        help='comma-separated numbers of actions per handler')
+    parser.add_option('-m', '--modes', default=','.join(DEFAULT_MODES),
+        help='comma-separated dispatch modes (predicates, single_view)')
+    parser.add_option('-n', '--requests', type='int', default=1000,
+        help='requests per dispatch measurement')
+    parser.add_option('-r', '--routes', type='int', default=1,
+        help='routes each handler is mounted on for the memory measurement')
+    parser.add_option('-o', '--output',
+        help='write the JSON results to this file instead of stdout')
+    parser.add_option('-c', '--compare',
+        help='compare the results to those in this JSON file')
+    options, args = parser.parse_args(list(argv[1:]))
+    sizes = [int(size) for size in options.sizes.split(',')]
+    modes = options.modes.split(',')
+    for mode in modes:
+        if mode not in DEFAULT_MODES:
+            parser.error('unknown mode %r' % mode)
+    results = run(sizes, modes, options.requests, options.routes)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    else:
+        json.dump(results, out, indent=1, sort_keys=True)
+        out.write('\n')
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        out.write('%6s %-12s %-22s %12s %12s %8s\n' % (
+            'size', 'mode', 'measure', 'baseline', 'current', 'ratio'))
+        for line in compare(results, baseline):
+            out.write(line + '\n')
+    return 0
+
+if __name__ == '__main__': # pragma: no cover
+    sys.exit(main())
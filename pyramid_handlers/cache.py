@@ -0,0 +1,162 @@
+""" Caching of handler action responses.
+
+An action decorated with ``@action(cache_ttl=60)`` has the responses it
+returns to ``GET`` requests kept for 60 seconds in a :class:`ResponseCache`
+of the registry.  The cache key is made of the route name, the handler,
+the action, the ``matchdict`` and by default the query string; if
+``cache_vary`` is a list of names, the values of those query string
+parameters, and of the request headers named ``header:<name>``, are used
+instead of the query string.
+
+A request whose response is in the cache gets a copy of it straight away:
+the handler isn't instantiated, and the action isn't called.  Only ``200
+OK`` responses whose body isn't streamed and which don't set a cookie are
+cached.  Entries are dropped when they expire, when the cache holds more
+than the ``pyramid_handlers.cache.max_entries`` setting (1024 by default),
+least recently used first, or when :func:`invalidate` is called.
+Warm-up requests (see :mod:`pyramid_handlers.warmup`) bypass the cache.
+"""
+import collections
+import threading
+import time
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.response import Response
+
+from zope.interface import implementer
+
+from pyramid_handlers.interfaces import IResponseCache
+from pyramid_handlers.manifest import qualified_name
+from pyramid_handlers.warmup import ENVIRON_KEY
+
+DEFAULT_MAX_ENTRIES = 1024
+
+@implementer(IResponseCache)
+class ResponseCache(object):
+    """ A thread-safe map of cache keys to ``(status, headerlist, body)``
+    triples, holding at most ``max_entries`` entries.  The first two items
+    of each key are the handler name and the action."""
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl):
+        expires = self.clock() + ttl
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (expires, value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, handler_name, action=None):
+        with self.lock:
+            keys = [key for key in self.entries if key[0] == handler_name and
+                    (action is None or key[1] == action)]
+            for key in keys:
+                del self.entries[key]
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def get_response_cache(registry):
+    """ Return the response cache of ``registry``, creating a
+    :class:`ResponseCache` if it has none."""
+    cache = registry.queryUtility(IResponseCache)
+    if cache is None:
+        settings = registry.settings or {}
+        max_entries = settings.get('pyramid_handlers.cache.max_entries')
+        cache = ResponseCache(int(max_entries or DEFAULT_MAX_ENTRIES))
+        registry.registerUtility(cache, IResponseCache)
+    return cache
+
+
+def invalidate(registry, handler, action=None):
+    """ Drop the cached responses of ``action`` of ``handler`` (a handler
+    class, or its :func:`~pyramid_handlers.manifest.qualified_name`), or of
+    all its actions if ``action`` is ``None``, from every response cache of
+    ``registry`` (including the shared one of
+    :mod:`pyramid_handlers.sharedcache`), and return how many there
+    were."""
+    if not isinstance(handler, str):
+        handler = qualified_name(handler)
+    count = 0
+    for name, cache in registry.getUtilitiesFor(IResponseCache):
+        count += cache.invalidate(handler, action)
+    return count
+
+
+def cache_key(request, route_name, handler_name, action, vary=None):
+    """ Return the key of the cached response of ``action`` of the handler
+    named ``handler_name`` to ``request``."""
+    matchdict = request.matchdict or {}
+    key = [handler_name, action, route_name, tuple(sorted(matchdict.items()))]
+    if vary is None:
+        key.append(request.query_string)
+    else:
+        for name in vary:
+            if name.startswith('header:'):
+                key.append(request.headers.get(name[7:]))
+            else:
+                key.append(tuple(request.GET.getall(name)))
+    return tuple(key)
+
+
+def cache_decorator(registry, route_name, handler, action, ttl, vary=None,
+                    cache=None):
+    """ Return a view decorator caching the responses of ``action`` of
+    ``handler`` for ``ttl`` seconds in ``cache`` (by default, the response
+    cache of ``registry``)."""
+    if not ttl or ttl < 0:
+        raise ConfigurationError(
+            'cache_ttl of the %r action of %r must be a positive number of '
+            'seconds, not %r' % (action, handler, ttl))
+    if isinstance(vary, str):
+        vary = [vary]
+    if vary is not None:
+        vary = tuple(vary)
+    if cache is None:
+        cache = get_response_cache(registry)
+    handler_name = qualified_name(handler)
+    def decorator(view):
+        def cached_view(context, request):
+            if request.method != 'GET' or request.environ.get(ENVIRON_KEY):
+                return view(context, request)
+            key = cache_key(request, route_name, handler_name, action, vary)
+            entry = cache.get(key)
+            if entry is not None:
+                status, headerlist, body = entry
+                return Response(body=body, status=status,
+                                headerlist=list(headerlist))
+            response = view(context, request)
+            if _cacheable(response):
+                cache.set(key, (response.status, tuple(response.headerlist),
+                                response.body), ttl)
+            return response
+        return cached_view
+    return decorator
+
+
+def _cacheable(response):
+    return (response.status_int == 200 and
+            isinstance(response.app_iter, (list, tuple)) and
+            'Set-Cookie' not in response.headers)
@@ -0,0 +1,104 @@
+""" Coalescing of identical concurrent requests to handler actions.
+
+An action decorated with ``@action(coalesce=True)`` is called once for a
+group of identical ``GET`` requests arriving while it runs: the first
+request calls the action, and the others wait for it to finish and get a
+copy of its response, without the handler being instantiated.  Requests
+are identical when they have the same ``matchdict`` and the same query
+string parameters, in any order, or the same result of the
+``coalesce_key`` function (which is called with the request) if there is
+one.
+
+A request waits for at most ``coalesce_timeout`` seconds (by default, as
+long as it takes), then gets a ``504 Gateway Timeout`` response.  When the
+first request fails, or its response is streamed or sets a cookie, the
+waiting requests call the action themselves.  Warm-up requests (see
+:mod:`pyramid_handlers.warmup`) are never coalesced.
+"""
+import threading
+
+from pyramid.httpexceptions import HTTPGatewayTimeout
+from pyramid.response import Response
+
+from pyramid_handlers.warmup import ENVIRON_KEY
+
+class Flight(object):
+    """ A call of an action that other requests may wait for; ``result``
+    is the ``(status, headerlist, body)`` triple of its response once
+    ``done`` is set, or ``None`` if it can't be shared."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight(object):
+    """ The calls of one action in progress, keyed by request key."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.coalesced = 0
+
+    def join(self, key):
+        """ Return a ``(flight, first)`` pair: the call in progress for
+        ``key``, and whether it was just started, which makes the caller
+        responsible for calling :meth:`land` once it is done."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self.flights[key] = Flight()
+            return flight, True
+
+    def land(self, key, flight, result):
+        """ Share ``result`` with the requests waiting for ``flight``."""
+        with self.lock:
+            del self.flights[key]
+        flight.result = result
+        flight.done.set()
+
+
+def request_key(request):
+    """ Return the default coalescing key of ``request``: its ``matchdict``
+    and query string parameters, sorted."""
+    return (tuple(sorted((request.matchdict or {}).items())),
+            tuple(sorted(request.GET.items())))
+
+
+def coalesce_decorator(key=None, timeout=None):
+    """ Return a view decorator making concurrent ``GET`` requests with the
+    same ``key`` (by default, :func:`request_key`) share the response of
+    the first one."""
+    if key is None:
+        key = request_key
+    flights = SingleFlight()
+    def decorator(view):
+        def coalesced_view(context, request):
+            if request.method != 'GET' or request.environ.get(ENVIRON_KEY):
+                return view(context, request)
+            request_key = key(request)
+            flight, first = flights.join(request_key)
+            if first:
+                result = None
+                try:
+                    response = view(context, request)
+                    if _shareable(response):
+                        result = (response.status,
+                                  tuple(response.headerlist), response.body)
+                    return response
+                finally:
+                    flights.land(request_key, flight, result)
+            if not flight.done.wait(timeout):
+                raise HTTPGatewayTimeout()
+            if flight.result is None:
+                return view(context, request)
+            status, headerlist, body = flight.result
+            return Response(body=body, status=status,
+                            headerlist=list(headerlist))
+        return coalesced_view
+    return decorator
+
+
+def _shareable(response):
+    return (isinstance(response.app_iter, (list, tuple)) and
+            'Set-Cookie' not in response.headers)
@@ -0,0 +1,67 @@
+""" Conditional responses to handler actions.
+
+An action decorated with ``@action(etag=func)`` or
+``@action(last_modified=func)`` has ``func`` called with the request before
+anything else.  ``etag`` functions return an entity tag (a string) and
+``last_modified`` functions a :class:`datetime.datetime` or a POSIX
+timestamp, or ``None`` when they can't tell.  If the ``If-None-Match`` (or,
+when there is none, the ``If-Modified-Since``) header of a ``GET`` or
+``HEAD`` request shows that the client already has that version, the
+request gets a ``304 Not Modified`` response without the handler being
+instantiated.  Otherwise, the ``ETag`` and ``Last-Modified`` headers of the
+response are set from the values computed.
+"""
+import datetime
+
+from pyramid.httpexceptions import HTTPNotModified
+
+try:
+    from datetime import timezone
+    UTC = timezone.utc
+except ImportError: # pragma: no cover (Python 2)
+    from webob.datetime_utils import UTC
+
+def conditional_decorator(etag=None, last_modified=None):
+    """ Return a view decorator answering ``304 Not Modified`` when the
+    validators computed by ``etag`` and ``last_modified`` (callables taking
+    the request) match the request."""
+    def decorator(view):
+        def conditional_view(context, request):
+            tag = etag(request) if etag is not None else None
+            modified = None
+            if last_modified is not None:
+                modified = _as_datetime(last_modified(request))
+            if (request.method in ('GET', 'HEAD') and
+                not_modified(request, tag, modified)):
+                response = HTTPNotModified()
+            else:
+                response = view(context, request)
+            if tag is not None and response.etag is None:
+                response.etag = tag
+            if modified is not None and response.last_modified is None:
+                response.last_modified = modified
+            return response
+        return conditional_view
+    return decorator
+
+
+def not_modified(request, etag, last_modified):
+    """ Return true if the client making ``request`` holds the version of
+    the resource identified by ``etag`` and ``last_modified`` (either of
+    which may be ``None``)."""
+    if 'If-None-Match' in request.headers:
+        return etag is not None and etag in request.if_none_match
+    since = request.if_modified_since
+    if last_modified is None or since is None:
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+
+def _as_datetime(value):
+    if value is None:
+        return None
+    if not isinstance(value, datetime.datetime):
+        return datetime.datetime.fromtimestamp(value, UTC)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value
@@ -0,0 +1,86 @@
+from zope.interface import Interface
+
+class IHandlerManifest(Interface):
+    """ A record of the views found by introspecting handler classes, used
+    to skip that introspection in later processes (see
+    :class:`pyramid_handlers.manifest.HandlerManifest`)."""
+    def get(handler, key):
+        """ Return the recorded plan for ``handler`` and ``key``, or ``None``
+        if there is none or the handler's source files have changed."""
+
+    def record(handler, key, plan):
+        """ Record the plan found by introspecting ``handler``."""
+
+    def record_route(route_name, pattern, handler, action):
+        """ Record the arguments of a call to ``add_handler``."""
+
+class IActionTimings(Interface):
+    """ The latency histograms of timed handler actions (see
+    :class:`pyramid_handlers.timing.ActionTimings`)."""
+    def histogram(route_name, handler_name, action):
+        """ Return the histogram of an action, creating it if needed."""
+
+    def dump():
+        """ Return the histograms as text."""
+
+class IActionPools(Interface):
+    """ The thread pools handler actions are offloaded to (see
+    :class:`pyramid_handlers.pools.ActionPools`)."""
+    def get(name):
+        """ Return the pool named ``name``, creating it if needed."""
+
+class IResponseCache(Interface):
+    """ The cached responses of handler actions (see
+    :class:`pyramid_handlers.cache.ResponseCache`)."""
+    def get(key):
+        """ Return the ``(status, headerlist, body)`` triple cached under
+        ``key``, or ``None``."""
+
+    def set(key, value, ttl):
+        """ Cache ``value`` under ``key`` for ``ttl`` seconds."""
+
+    def invalidate(handler_name, action=None):
+        """ Drop the cached responses of an action of a handler, or of all
+        its actions if ``action`` is ``None``."""
+
+class IHandlerRoutes(Interface):
+    """ The routes added for each handler and action (see
+    :class:`pyramid_handlers.HandlerRoutes`)."""
+    def add(handler, route_name, action=None, in_path=False):
+        """ Record that ``route_name`` leads to ``action`` of ``handler``."""
+
+    def lookup(handler, action=None):
+        """ Return the ``(route_name, in_path)`` pair for ``action`` of
+        ``handler``, or ``None``."""
+
+class IActionLimits(Interface):
+    """ The concurrency limits of handler actions (see
+    :class:`pyramid_handlers.limits.ActionLimits`)."""
+    def limit(route_name, handler_name, action, max_concurrency,
+              max_queued=None, queue_timeout=None):
+        """ Return the limit of an action, creating it if needed."""
+
+class IActionProfiles(Interface):
+    """ The profiles of sampled requests to handler actions (see
+    :class:`pyramid_handlers.profiling.ActionProfiles`)."""
+    def sample():
+        """ Return true if a request should be profiled."""
+
+    def record(key, profiler):
+        """ Merge the statistics of ``profiler`` into those of ``key``."""
+
+class IActionAllocations(Interface):
+    """ The memory allocated by sampled calls of handler actions (see
+    :class:`pyramid_handlers.allocations.ActionAllocations`)."""
+    def get(route_name, handler_name, action):
+        """ Return the allocations of an action, creating them if
+        needed."""
+
+    def dump():
+        """ Return the allocations as text."""
+
+class IActionWarmups(Interface):
+    """ The handler actions to send synthetic requests to before serving
+    requests (see :class:`pyramid_handlers.warmup.ActionWarmups`)."""
+    def add(route_name, action, elements=True):
+        """ Add the action ``action`` of the route named ``route_name``."""
@@ -0,0 +1,165 @@
+""" Per-action concurrency limits.
+
+An action decorated with ``@action(max_concurrency=2)`` is run by at most
+two requests at once.  Up to ``max_queued`` more requests (by default, as
+many as ``max_concurrency``) wait for their turn, for at most
+``queue_timeout`` seconds (by default, as long as it takes); the other
+requests get a ``503 Service Unavailable`` response with a ``Retry-After``
+header straight away, without the handler being instantiated.  The calls
+of the action made by the batch route of its handler (see
+:mod:`pyramid_handlers.batch`) share the limit of the action, a call which
+isn't admitted getting a ``503`` result.  The turn of a request whose
+response body is streamed (see :mod:`pyramid_handlers.streaming`) lasts
+until the server closes the body.  One expensive action can then
+only ever hold ``max_concurrency + max_queued`` worker or pool threads,
+and the other actions of the application keep the rest.
+
+One :class:`ActionLimit` is kept per route, handler and action, in an
+:class:`ActionLimits` utility of the registry, with counters of the
+requests it admitted, queued and rejected::
+
+  from pyramid_handlers.limits import get_limits
+  for (route_name, handler, action), limit in get_limits(registry):
+      print(route_name, action, limit.admitted, limit.rejected)
+"""
+import math
+import threading
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.httpexceptions import HTTPServiceUnavailable
+
+from zope.interface import implementer
+
+from pyramid_handlers.interfaces import IActionLimits
+from pyramid_handlers.manifest import qualified_name
+
+class ActionLimit(object):
+    """ Admits at most ``max_concurrency`` callers at once, and makes at
+    most ``max_queued`` more wait for at most ``queue_timeout`` seconds."""
+    def __init__(self, max_concurrency, max_queued=None, queue_timeout=None):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_concurrency if max_queued is None else max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = str(int(math.ceil(queue_timeout or 1)))
+        self.running = threading.Semaphore(max_concurrency)
+        self.slots = threading.Semaphore(max_concurrency + self.max_queued)
+        self.lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """ Wait for the turn of the caller, or raise
+        :class:`~pyramid.httpexceptions.HTTPServiceUnavailable` if there are
+        too many callers or the wait is too long.  Each successful call must
+        be followed by a call to :meth:`release`."""
+        if not self.slots.acquire(False):
+            self.count('rejected')
+            raise self.unavailable()
+        if not self.running.acquire(False):
+            self.count('queued')
+            if self.queue_timeout is None:
+                self.running.acquire()
+            elif not self.running.acquire(True, self.queue_timeout):
+                self.slots.release()
+                self.count('rejected')
+                raise self.unavailable()
+        self.count('admitted')
+
+    def release(self):
+        self.running.release()
+        self.slots.release()
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def unavailable(self):
+        return HTTPServiceUnavailable(headers={
+            'Retry-After': self.retry_after})
+
+
+@implementer(IActionLimits)
+class ActionLimits(object):
+    """ The :class:`ActionLimit` of every limited action, keyed by
+    ``(route_name, handler_name, action)``."""
+    def __init__(self):
+        self.limits = {}
+
+    def limit(self, route_name, handler_name, action, max_concurrency,
+              max_queued=None, queue_timeout=None):
+        key = (route_name, handler_name, action)
+        limit = self.limits.get(key)
+        if limit is None:
+            limit = self.limits[key] = ActionLimit(
+                max_concurrency, max_queued, queue_timeout)
+        return limit
+
+    def __iter__(self):
+        return iter(sorted(self.limits.items()))
+
+
+def get_limits(registry):
+    """ Return the :class:`ActionLimits` of ``registry``, or ``None`` if no
+    action is limited."""
+    return registry.queryUtility(IActionLimits)
+
+
+def limit_decorator(registry, route_name, handler, action, max_concurrency,
+                    max_queued=None, queue_timeout=None):
+    """ Return a view decorator letting at most ``max_concurrency``
+    requests call the view it wraps at once (see :class:`ActionLimit`).
+    The views of one action of ``handler`` on the route named
+    ``route_name`` share the same limit."""
+    for name, value in (('max_concurrency', max_concurrency),
+                        ('max_queued', max_queued),
+                        ('queue_timeout', queue_timeout)):
+        if value is not None and (value < 0 or value == 0 and
+                                  name == 'max_concurrency'):
+            raise ConfigurationError(
+                'bad %s for the %r action of %r: %r' % (
+                    name, action, handler, value))
+    limits = registry.queryUtility(IActionLimits)
+    if limits is None:
+        limits = ActionLimits()
+        registry.registerUtility(limits, IActionLimits)
+    limit = limits.limit(route_name, qualified_name(handler), action,
+                         max_concurrency, max_queued, queue_timeout)
+    def decorator(view):
+        def limited_view(context, request):
+            limit.acquire()
+            try:
+                response = view(context, request)
+            except:
+                limit.release()
+                raise
+            if isinstance(response.app_iter, (list, tuple)):
+                limit.release()
+            else:
+                # the body is produced while the server sends it
+                response.app_iter = ReleasingIterator(
+                    response.app_iter, limit.release)
+            return response
+        return limited_view
+    return decorator
+
+
+class ReleasingIterator(object):
+    """ An ``app_iter`` iterating ``app_iter`` and calling ``release`` once
+    it is closed."""
+    def __init__(self, app_iter, release):
+        self.app_iter = app_iter
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        release, self.release = self.release, None
+        try:
+            close = getattr(self.app_iter, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            if release is not None:
+                release()
@@ -0,0 +1,234 @@
+""" Handler manifests.
+
+Every time :func:`pyramid_handlers.add_handler` is called, the handler class
+is introspected to find the methods it exposes and the view configuration
+each of them carries.  A manifest records the result of that introspection
+(see :func:`pyramid_handlers.handler_plan`) in a file, so that later
+processes can register the same views without introspecting the handlers
+again, as long as the source files of the handlers haven't changed.
+
+To use a manifest, name the file in the ``pyramid_handlers.manifest``
+setting before ``pyramid_handlers`` is included, and call
+:func:`write_manifest` once the configuration is complete (e.g. from a build
+step, or the first time an application starts).
+"""
+import hashlib
+import json
+import os
+import sys
+
+from pyramid.exceptions import ConfigurationError
+
+from pyramid_handlers.interfaces import IHandlerManifest
+
+from zope.interface import implementer
+
+MANIFEST_VERSION = 1
+
+@implementer(IHandlerManifest)
+class HandlerManifest(object):
+    """ The plans found by introspecting handler classes, keyed by the
+    dotted name of each handler, along with the size, modification time and
+    SHA-1 hash of every source file which defines the handler or one of its
+    base classes.
+
+    ``xformer`` identifies the ``pyramid_handlers.method_name_xformer`` in
+    use; the plans of a manifest written with a different method name
+    transformer are ignored."""
+    def __init__(self, path=None, xformer=None):
+        self.path = path
+        self.xformer = xformer
+        self.handlers = {}
+        self.routes = {}
+        self.checked = {}
+
+    @classmethod
+    def from_file(cls, path, xformer=None):
+        """ Return a manifest holding the plans recorded in the file at
+        ``path``, or an empty manifest if the file doesn't exist or was
+        written for another method name transformer."""
+        manifest = cls(path, xformer)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return manifest
+        if (data.get('version') == MANIFEST_VERSION and
+            data.get('xformer') == xformer):
+            for name, entry in data.get('handlers', {}).items():
+                plans = {}
+                for key, views in entry['plans'].items():
+                    plans[key] = [tuple(view[:3]) for view in views]
+                manifest.handlers[name] = {'sources': entry['sources'],
+                                           'plans': plans}
+        return manifest
+
+    def get(self, handler, key):
+        name = handler_name(handler)
+        entry = self.handlers.get(name)
+        if entry is None:
+            return None
+        if not self.sources_match(entry['sources']):
+            del self.handlers[name]
+            return None
+        return entry['plans'].get(key)
+
+    def record(self, handler, key, plan):
+        name = handler_name(handler)
+        if name is None:
+            return
+        entry = self.handlers.get(name)
+        if entry is None:
+            sources = handler_sources(handler)
+            if sources is None:
+                return
+            entry = self.handlers[name] = {'sources': sources, 'plans': {}}
+        entry['plans'][key] = plan
+
+    def record_route(self, route_name, pattern, handler, action):
+        """ Record the arguments of an ``add_handler`` call; they are
+        written to the manifest for reference only."""
+        if isinstance(handler, type):
+            handler = handler_name(handler)
+        self.routes[route_name] = {'pattern': pattern, 'handler': handler,
+                                   'action': action}
+
+    def sources_match(self, sources):
+        for path, (mtime, size, sha1) in sources.items():
+            match = self.checked.get(path)
+            if match is None:
+                match = self.checked[path] = _source_matches(
+                    path, mtime, size, sha1)
+            if not match:
+                return False
+        return True
+
+    def dump(self):
+        """ Return the manifest as a JSON-compatible dictionary.  Each view
+        of a plan is written with a summary of its view configuration,
+        which is only there to be read by people."""
+        handlers = {}
+        for name, entry in self.handlers.items():
+            handler = _resolve(name)
+            plans = {}
+            for key, plan in entry['plans'].items():
+                plans[key] = [list(view) + [_view_summary(handler, view)]
+                              for view in plan]
+            handlers[name] = {'sources': entry['sources'], 'plans': plans}
+        return {'version': MANIFEST_VERSION, 'xformer': self.xformer,
+                'routes': self.routes, 'handlers': handlers}
+
+    def write(self, path=None):
+        """ Write the manifest to ``path`` (by default, the path it was
+        loaded from).  The file is replaced atomically."""
+        path = path or self.path
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.dump(), f, indent=1, sort_keys=True)
+        getattr(os, 'replace', os.rename)(tmp, path)
+
+
+def write_manifest(registry, path=None):
+    """ Write the handler manifest of ``registry`` to ``path`` (by default,
+    the ``pyramid_handlers.manifest`` setting)."""
+    manifest = registry.queryUtility(IHandlerManifest)
+    if manifest is None:
+        raise ConfigurationError(
+            'no handler manifest: the pyramid_handlers.manifest setting '
+            'must be set when pyramid_handlers is included')
+    manifest.write(path)
+
+
+def xformer_id(xformer):
+    """ Return a string identifying the method name transformer
+    ``xformer`` (a dotted name or a callable), or ``None``."""
+    if not callable(xformer):
+        return xformer
+    return '%s.%s' % (xformer.__module__, xformer.__name__)
+
+
+def handler_name(handler):
+    """ Return the dotted name of the handler class ``handler``, or ``None``
+    if it can't be named (e.g. it was defined in a function)."""
+    name = qualified_name(handler)
+    if '<' in name:
+        return None
+    return name
+
+
+def qualified_name(handler):
+    """ Return the module and qualified name of ``handler``, which may not
+    be importable."""
+    qualname = getattr(handler, '__qualname__', handler.__name__)
+    return '%s.%s' % (handler.__module__, qualname)
+
+
+def handler_sources(handler):
+    """ Return the fingerprints of the source files of ``handler`` and its
+    base classes, or ``None`` if one of them isn't known."""
+    sources = {}
+    for klass in handler.__mro__:
+        module = sys.modules.get(klass.__module__)
+        if klass is object or module is sys.modules.get(object.__module__):
+            continue
+        path = getattr(module, '__file__', None)
+        if path is None:
+            return None
+        if path.endswith(('.pyc', '.pyo')):
+            path = path[:-1]
+        if path not in sources:
+            try:
+                sources[path] = _fingerprint(path)
+            except (IOError, OSError):
+                return None
+    return sources
+
+
+def _fingerprint(path):
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        sha1 = hashlib.sha1(f.read()).hexdigest()
+    return [st.st_mtime, st.st_size, sha1]
+
+
+def _source_matches(path, mtime, size, sha1):
+    try:
+        st = os.stat(path)
+        if st.st_size != size:
+            return False
+        if st.st_mtime == mtime:
+            return True
+        # e.g. the files were copied; only trust the contents
+        return _fingerprint(path)[2] == sha1
+    except (IOError, OSError):
+        return False
+
+
+def _resolve(name):
+    module_name, attr = name, []
+    while module_name not in sys.modules:
+        if '.' not in module_name:
+            return None
+        module_name, part = module_name.rsplit('.', 1)
+        attr.insert(0, part)
+    obj = sys.modules[module_name]
+    for part in attr:
+        obj = getattr(obj, part, None)
+    return obj
+
+
+def _view_summary(handler, view):
+    attr, index = view[0], view[1]
+    if handler is None or index is None:
+        return {}
+    method = getattr(handler, attr or '__call__', None)
+    try:
+        expose_config = method.__exposed__[index]
+    except (AttributeError, IndexError, TypeError):
+        return {}
+    summary = {}
+    for name, value in expose_config.items():
+        if not isinstance(value, (str, int, float, bool, type(None))):
+            value = repr(value)
+        summary[name] = value
+    return summary
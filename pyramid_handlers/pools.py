@@ -0,0 +1,275 @@
+""" Bounded thread pools to offload blocking handler actions to.
+
+An action decorated with ``@action(offload=True, pool='reports')`` is run on
+a thread of the pool named ``reports`` instead of the worker thread which
+received the request.  The worker thread waits for the action to finish for
+at most the pool's timeout, and the number of actions a pool runs or queues
+at once is bounded, so one slow backend can only ever hold as many threads
+as its pool has.  Pools are configured with settings:
+
+``pyramid_handlers.pool.<name>.workers``
+  The number of threads of the pool (default: 4).
+
+``pyramid_handlers.pool.<name>.queue``
+  The number of actions which may wait for a thread of the pool (default:
+  the number of threads).  When the pool is full, the request gets a ``503
+  Service Unavailable`` response straight away.
+
+``pyramid_handlers.pool.<name>.timeout``
+  The number of seconds a worker thread waits for an action (default: no
+  limit).  When the action takes longer, the request gets a ``504 Gateway
+  Timeout`` response; the action keeps its thread of the pool until it
+  returns.
+
+When the action returns a generator, or a response whose body is streamed
+(see :mod:`pyramid_handlers.streaming`), the generator is run on the pool
+too: a thread of the pool produces the chunks of the body, at most
+``PooledIterator.buffered`` chunks ahead of the server sending them, and
+keeps the thread until the body is sent or closed.  The server waits for
+each chunk for at most the pool's timeout, after which the body is cut
+short.
+"""
+import concurrent.futures
+import inspect
+import os
+import threading
+
+try:
+    import queue
+except ImportError: # pragma: no cover (Python 2)
+    import Queue as queue
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.httpexceptions import HTTPGatewayTimeout
+from pyramid.httpexceptions import HTTPServiceUnavailable
+from pyramid.interfaces import IResponse
+from pyramid.threadlocal import manager
+
+from zope.interface import implementer
+
+from pyramid_handlers.interfaces import IActionPools
+
+DEFAULT_POOL = 'default'
+DEFAULT_WORKERS = 4
+
+class ActionPool(object):
+    """ A thread pool running at most ``workers`` actions at once, with at
+    most ``queue`` more waiting."""
+    def __init__(self, name, workers=DEFAULT_WORKERS, queue=None,
+                 timeout=None):
+        self.name = name
+        self.workers = workers
+        self.queue = workers if queue is None else queue
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+        self.slots = None
+        self.rejected = 0
+        self.timed_out = 0
+
+    def get_executor(self):
+        executor = self.executor
+        if executor is not None and self.pid == os.getpid():
+            return executor
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                # a forked process inherits the pool, but not its threads
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    self.workers,
+                    thread_name_prefix='pyramid_handlers pool %s' % self.name)
+                self.slots = threading.BoundedSemaphore(
+                    self.workers + self.queue)
+                self.pid = os.getpid()
+            return self.executor
+
+    def run(self, func, *args):
+        """ Call ``func`` with ``args`` on a thread of the pool and return
+        its result."""
+        return self.result(self.submit(func, *args))
+
+    def submit(self, func, *args):
+        """ Schedule a call of ``func`` with ``args`` on a thread of the
+        pool and return its :class:`concurrent.futures.Future`."""
+        executor = self.get_executor()
+        slots = self.slots
+        if not slots.acquire(False):
+            self.rejected += 1
+            raise HTTPServiceUnavailable(
+                'Too many requests are waiting for the %s pool' % self.name)
+        try:
+            future = executor.submit(func, *args)
+        except:
+            slots.release()
+            raise
+        future.add_done_callback(lambda future: slots.release())
+        return future
+
+    def result(self, future):
+        """ Wait for ``future`` for at most the timeout of the pool and
+        return its result."""
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            # only an action still waiting for a thread can be cancelled
+            future.cancel()
+            self.timed_out += 1
+            raise HTTPGatewayTimeout()
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+@implementer(IActionPools)
+class ActionPools(object):
+    """ The :class:`ActionPool` objects of an application, created from its
+    settings when first asked for."""
+    def __init__(self, settings=None):
+        self.settings = settings or {}
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        pool = self.pools.get(name)
+        if pool is None:
+            with self.lock:
+                pool = self.pools.get(name)
+                if pool is None:
+                    pool = self.pools[name] = self.create(name)
+        return pool
+
+    def create(self, name):
+        prefix = 'pyramid_handlers.pool.%s.' % name
+        def setting(key, convert, default):
+            value = self.settings.get(prefix + key)
+            if value in (None, ''):
+                return default
+            try:
+                value = convert(value)
+            except ValueError:
+                value = -1
+            if value < 0 or (key == 'workers' and value == 0):
+                raise ConfigurationError(
+                    'bad value for the %s%s setting: %r' % (
+                        prefix, key, self.settings[prefix + key]))
+            return value
+        return ActionPool(name, setting('workers', int, DEFAULT_WORKERS),
+                          setting('queue', int, None),
+                          setting('timeout', float, None))
+
+
+def get_pool(registry, name=DEFAULT_POOL):
+    """ Return the :class:`ActionPool` named ``name`` of ``registry``."""
+    pools = registry.queryUtility(IActionPools)
+    if pools is None:
+        pools = ActionPools(registry.settings)
+        registry.registerUtility(pools, IActionPools)
+    return pools.get(name)
+
+
+def offload_wrapper(pool):
+    """ Return a function wrapping a view callable so that it is called on
+    a thread of ``pool``, with the request as the current request."""
+    def wrapper(view):
+        def offloaded_view(context, request):
+            result = pool.run(_call_view, view, context, request)
+            if IResponse.providedBy(result):
+                if not isinstance(result.app_iter, (list, tuple)):
+                    result.app_iter = PooledIterator(
+                        pool, result.app_iter, request)
+            elif inspect.isgenerator(result):
+                # e.g. rows for the json_stream renderer
+                result = PooledIterator(pool, result, request)
+            return result
+        return offloaded_view
+    return wrapper
+
+
+class PooledIterator(object):
+    """ An iterator over the items of ``iterable``, which are produced on a
+    thread of ``pool`` with ``request`` as the current request, at most
+    ``buffered`` items ahead of the consumer.  The thread is held until
+    ``iterable`` is exhausted or the iterator is closed."""
+    buffered = 8
+    # how often a producer which can't queue an item checks for close()
+    poll_interval = 0.1
+
+    def __init__(self, pool, iterable, request):
+        self.pool = pool
+        self.iterable = iterable
+        self.request = request
+        self.items = queue.Queue(self.buffered)
+        self.closed = threading.Event()
+        self.done = False
+        try:
+            pool.submit(self.produce)
+        except:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+            raise
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.done:
+            raise StopIteration
+        try:
+            item, error = self.items.get(True, self.pool.timeout)
+        except queue.Empty:
+            self.pool.timed_out += 1
+            self.close()
+            raise HTTPGatewayTimeout()
+        if error is not None or item is _end:
+            self.done = True
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    next = __next__ # Python 2
+
+    def close(self):
+        self.done = True
+        self.closed.set()
+
+    def produce(self):
+        manager.push({'request': self.request,
+                      'registry': self.request.registry})
+        try:
+            for item in self.iterable:
+                if not self.put(item, None):
+                    return
+            self.put(_end, None)
+        except Exception as e:
+            self.put(None, e)
+        finally:
+            try:
+                close = getattr(self.iterable, 'close', None)
+                if close is not None:
+                    close()
+            finally:
+                manager.pop()
+
+    def put(self, item, error):
+        while not self.closed.is_set():
+            try:
+                self.items.put((item, error), True, self.poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+_end = object()
+
+
+def _call_view(view, context, request):
+    manager.push({'request': request, 'registry': request.registry})
+    try:
+        return view(context, request)
+    finally:
+        manager.pop()
@@ -0,0 +1,70 @@
+""" Preloading handlers before a server forks its workers.
+
+When the ``pyramid_handlers.preload`` setting is true, including
+``pyramid_handlers``:
+
+- imports and scans every handler when it is added, even with
+  ``lazy=True`` (as the ``pyramid_handlers.eager`` setting does);
+
+- when the application is created (see
+  :class:`pyramid.events.ApplicationCreated`), builds the dispatch
+  structures which are otherwise built by the first requests: the
+  alternations of the action patterns of every handler route, and the
+  views of handlers which are still to be loaded;
+
+- then collects garbage and calls :func:`gc.freeze`, which moves every
+  object left to a generation the garbage collector never visits again.
+
+With a server which loads the application before forking its workers
+(``gunicorn --preload``, for instance), the workers then share the memory
+pages holding the handlers and their dispatch tables, rather than each
+getting a copy of the pages a garbage collection or a late import writes
+to.  :func:`gc.freeze` needs Python 3.7; on older versions, only the
+collection is done.  The dispatch structures are found through the
+introspector of the registry, which is on unless the application turns it
+off.
+"""
+import gc
+
+from pyramid_handlers import ActionDispatcher
+from pyramid_handlers import ActionPredicate
+from pyramid_handlers import LazyHandler
+
+def prebuild(registry):
+    """ Load the handlers added with ``lazy=True`` and compile the action
+    patterns of the handler routes of ``registry``; return the number of
+    :class:`~pyramid_handlers.ActionPatternGroup` objects compiled."""
+    introspector = getattr(registry, 'introspector', None)
+    if introspector is None:
+        return 0
+    groups = []
+    for item in introspector.get_category('views'):
+        intr = item['introspectable']
+        view = intr['callable']
+        if isinstance(view, LazyHandler) and view.handler is None:
+            view.load(registry)
+        if isinstance(view, ActionDispatcher):
+            groups.append(view.group)
+        for predicate in intr.get('predicates') or ():
+            func = getattr(predicate, 'func', None)
+            if isinstance(func, ActionPredicate) and func.group is not None:
+                groups.append(func.group)
+    compiled = 0
+    seen = set()
+    for group in groups:
+        if id(group) not in seen and group.patterns:
+            seen.add(id(group))
+            group.compile()
+            compiled += 1
+    return compiled
+
+
+def freeze(event):
+    """ An :class:`~pyramid.events.ApplicationCreated` subscriber which
+    prebuilds the dispatch structures of the application (see
+    :func:`prebuild`) and freezes the objects created so far."""
+    prebuild(event.app.registry)
+    gc.collect()
+    freeze = getattr(gc, 'freeze', None)
+    if freeze is not None:
+        freeze()
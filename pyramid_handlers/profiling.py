@@ -0,0 +1,145 @@
+""" Sampling profiler of handler actions.
+
+When the ``pyramid_handlers.profile.rate`` setting is a fraction above 0,
+every view registered by :func:`pyramid_handlers.add_handler` profiles that
+fraction of its requests with :mod:`cProfile`.  The statistics are merged
+per route, handler and action in an :class:`ActionProfiles` utility of the
+registry, and, if the ``pyramid_handlers.profile.directory`` setting names
+a directory, written there as :mod:`pstats` files every
+``pyramid_handlers.profile.interval`` seconds (60 by default)::
+
+  $ python -m pstats profiles/users.mypackage.handlers.Users.index.1234.pstats
+
+Files are named after the route, the handler, the action and the process
+id, so the workers of a preforking server don't overwrite each other's
+files; ``pstats.Stats(*filenames)`` merges them.
+
+A process profiles one request at a time: a sampled request arriving while
+another is profiled isn't.  Only the thread which received the request is
+profiled, so the code of actions offloaded to a pool (see
+:mod:`pyramid_handlers.pools`) or run on the event loop (see
+:mod:`pyramid_handlers.aio`) shows up as time spent waiting.
+"""
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+from pyramid.exceptions import ConfigurationError
+
+from zope.interface import implementer
+
+from pyramid_handlers.interfaces import IActionProfiles
+from pyramid_handlers.manifest import qualified_name
+
+DEFAULT_INTERVAL = 60
+
+_unsafe_re = re.compile(r'[^A-Za-z0-9_.-]+')
+
+@implementer(IActionProfiles)
+class ActionProfiles(object):
+    """ The merged :class:`pstats.Stats` of the profiled requests of every
+    action, keyed by ``(route_name, handler_name, action)``."""
+    def __init__(self, rate, directory=None, interval=DEFAULT_INTERVAL,
+                 clock=time.time):
+        self.rate = rate
+        self.directory = directory
+        self.interval = interval
+        self.clock = clock
+        self.stats = {}
+        self.lock = threading.Lock()
+        # cProfile can't profile two threads of a process at once
+        self.profiling = threading.Lock()
+        self.written = clock()
+
+    def sample(self):
+        """ Return true if a request should be profiled."""
+        return random.random() < self.rate
+
+    def record(self, key, profiler):
+        """ Merge the statistics of ``profiler`` into those of ``key``, and
+        write the statistics out if they haven't been for ``interval``
+        seconds."""
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                self.stats[key] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+            if (self.directory is None or
+                self.clock() - self.written < self.interval):
+                return
+            self.written = self.clock()
+        self.write()
+
+    def write(self):
+        """ Write the statistics of each action to a file of
+        ``directory``, and return the names of the files."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        filenames = []
+        with self.lock:
+            for key, stats in sorted(self.stats.items()):
+                name = '.'.join(_unsafe_re.sub('_', part) for part in key)
+                filename = os.path.join(self.directory, '%s.%d.pstats' % (
+                    name, os.getpid()))
+                stats.dump_stats(filename + '.tmp')
+                os.replace(filename + '.tmp', filename)
+                filenames.append(filename)
+        return filenames
+
+
+def get_profiles(registry):
+    """ Return the :class:`ActionProfiles` of ``registry``, creating it
+    from the settings if profiling is enabled, or ``None``."""
+    profiles = registry.queryUtility(IActionProfiles)
+    if profiles is None:
+        settings = registry.settings or {}
+        prefix = 'pyramid_handlers.profile.'
+        try:
+            rate = float(settings.get(prefix + 'rate') or 0)
+            interval = float(settings.get(prefix + 'interval') or
+                             DEFAULT_INTERVAL)
+        except ValueError:
+            rate = interval = -1
+        if not 0 <= rate <= 1 or interval < 0:
+            raise ConfigurationError(
+                'bad value for the %srate (a fraction between 0 and 1) or '
+                '%sinterval setting: %r, %r' % (
+                    prefix, prefix, settings.get(prefix + 'rate'),
+                    settings.get(prefix + 'interval')))
+        if not rate:
+            return None
+        profiles = ActionProfiles(rate, settings.get(prefix + 'directory'),
+                                  interval)
+        registry.registerUtility(profiles, IActionProfiles)
+    return profiles
+
+
+def profile_decorator(profiles, route_name, handler, action):
+    """ Return a view decorator profiling a sample of the calls of the view
+    it wraps into the statistics of ``action`` of ``handler`` on the route
+    named ``route_name`` in ``profiles``."""
+    key = (route_name, qualified_name(handler), action)
+    def decorator(view):
+        def profiled_view(context, request):
+            if not profiles.sample() or not profiles.profiling.acquire(False):
+                return view(context, request)
+            try:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError: # another profiler is active
+                    return view(context, request)
+                try:
+                    return view(context, request)
+                finally:
+                    profiler.disable()
+                    profiles.record(key, profiler)
+            finally:
+                profiles.profiling.release()
+        return profiled_view
+    return decorator
@@ -0,0 +1,255 @@
+""" Reports of the views :func:`pyramid_handlers.add_handler` registered.
+
+The ``phandlers`` script loads an application, the way ``proutes`` does,
+and describes each route added by ``add_handler``, in the order routes are
+matched::
+
+  $ phandlers development.ini
+  users /users/{action} mypackage.handlers.Users (predicates)
+    views=5 predicates=7 literal=3 regex=1 worst_case=7
+    action        kind     views predicates methods
+    index         literal      1          1 index
+    edit          literal      2          4 edit, update
+    page-1        literal      1          1 first_page
+    page-\\d+      regex        1          1 page
+    ambiguous: page-1 also matches page-\\d+
+
+For each route, it shows how the action of a request is found (``predicates``
+when each view is guarded by an ``ActionPredicate``, ``single_view``,
+``lazy`` when the handler isn't loaded yet, or ``action`` when the pattern
+has no ``{action}``), the number of views and view predicates, and the
+estimated worst-case number of view predicates evaluated to dispatch a
+request.  Then comes the action table, and the actions which are:
+
+``ambiguous``
+  literal actions which a regular expression action matches too, so that
+  more than one view may match a request;
+
+``unreachable``
+  actions whose URL is matched by an earlier route (without predicates),
+  so that their views are never called.
+
+``phandlers --sort cost`` lists the most expensive routes first.
+"""
+import collections
+import optparse
+import sys
+
+from pyramid.interfaces import IRoutesMapper
+
+from pyramid_handlers import ActionDispatcher
+from pyramid_handlers import ActionPredicate
+from pyramid_handlers import LazyHandler
+from pyramid_handlers import compile_action
+from pyramid_handlers import literal_action_re
+from pyramid_handlers import string_types
+from pyramid_handlers.interfaces import IHandlerRoutes
+from pyramid_handlers.manifest import qualified_name
+
+class ActionReport(object):
+    """ The views registered for one action of a route."""
+    def __init__(self, action):
+        self.action = action
+        self.literal = bool(literal_action_re.match(action))
+        self.methods = []
+        self.views = 0
+        self.predicates = 0
+
+    def add(self, method, predicates):
+        if method not in self.methods:
+            self.methods.append(method)
+        self.views += 1
+        self.predicates += predicates
+
+
+class RouteReport(object):
+    """ The views registered for one route added by
+    :func:`~pyramid_handlers.add_handler`."""
+    def __init__(self, route, handler, mode):
+        self.route = route
+        self.name = route.name
+        self.pattern = route.pattern
+        self.handler = handler
+        self.mode = mode
+        self.actions = collections.OrderedDict()
+        self.shadowed = {}
+
+    def action(self, action):
+        report = self.actions.get(action)
+        if report is None:
+            report = self.actions[action] = ActionReport(action)
+        return report
+
+    @property
+    def views(self):
+        return sum(report.views for report in self.actions.values())
+
+    @property
+    def predicates(self):
+        return sum(report.predicates for report in self.actions.values())
+
+    @property
+    def worst_case(self):
+        """ The number of view predicates evaluated to dispatch a request
+        which matches none of the views, or ``None`` if it isn't known
+        yet."""
+        if self.mode == 'lazy':
+            return None
+        if self.mode == 'single_view':
+            # one lookup, then the views of a single action
+            return 1 + max([report.predicates
+                            for report in self.actions.values()] or [0])
+        return self.predicates
+
+    def ambiguous(self):
+        """ Return ``(literal, pattern)`` pairs of actions which both match
+        the same action name."""
+        patterns = [action for action, report in self.actions.items()
+                    if not report.literal]
+        return [(action, pattern)
+                for action, report in self.actions.items() if report.literal
+                for pattern in patterns
+                if compile_action(pattern).match(action)]
+
+    def unreachable(self):
+        """ Return ``(action, route_name)`` pairs of actions whose URL is
+        matched by the earlier route named ``route_name``."""
+        return [(action, self.shadowed[action]) for action in self.actions
+                if action in self.shadowed]
+
+
+def handler_reports(registry):
+    """ Return a :class:`RouteReport` for each route of ``registry`` which
+    :func:`~pyramid_handlers.add_handler` added, in the order routes are
+    matched."""
+    handler_routes = registry.queryUtility(IHandlerRoutes)
+    mapper = registry.queryUtility(IRoutesMapper)
+    if handler_routes is None or mapper is None:
+        return []
+    fixed_actions = {}
+    for (handler, action), (route_name, in_path) in sorted(
+            handler_routes.actions.items(), key=repr):
+        if not in_path:
+            fixed_actions.setdefault(route_name, action)
+    views = collections.defaultdict(list)
+    introspector = getattr(registry, 'introspector', None)
+    if introspector is not None:
+        for item in introspector.get_category('views'):
+            intr = item['introspectable']
+            if intr.get('route_name') is not None:
+                views[intr['route_name']].append(intr)
+    reports = []
+    routes = mapper.get_routes()
+    for index, route in enumerate(routes):
+        handler = handler_routes.handlers.get(route.name)
+        if handler is None:
+            continue
+        if not isinstance(handler, string_types):
+            handler = qualified_name(handler)
+        report = RouteReport(route, handler, 'action')
+        for intr in views[route.name]:
+            _add_view(report, intr, fixed_actions.get(route.name))
+        for action in report.actions:
+            earlier = _matched_by(routes[:index], route, action)
+            if earlier is not None:
+                report.shadowed[action] = earlier
+        reports.append(report)
+    return reports
+
+
+def _add_view(report, intr, fixed_action):
+    view = intr['callable']
+    if isinstance(view, LazyHandler):
+        if view.handler is None:
+            report.mode = 'lazy'
+        elif view.scan:
+            report.mode = 'single_view'
+        return
+    if isinstance(view, ActionDispatcher):
+        report.mode = 'single_view'
+        return
+    predicates = intr.get('predicates') or []
+    method = intr.get('attr') or getattr(view, '__name__', '__call__')
+    action = None
+    for predicate in predicates:
+        func = getattr(predicate, 'func', None)
+        if isinstance(func, ActionPredicate):
+            action = func.action
+            report.mode = 'predicates'
+    name = intr.get('name') or ''
+    if action is None and name.startswith(ActionDispatcher.view_name_prefix):
+        action = name[len(ActionDispatcher.view_name_prefix):]
+    if not action:
+        action = fixed_action or method
+    report.action(action).add(method, len(predicates))
+
+
+def _matched_by(routes, route, action):
+    try:
+        path = route.generate({'action': action})
+    except (KeyError, TypeError):
+        return None
+    for earlier in routes:
+        if not earlier.predicates and earlier.match(path) is not None:
+            return earlier.name
+    return None
+
+
+def format_reports(reports):
+    """ Yield the lines describing ``reports``."""
+    for report in reports:
+        worst_case = report.worst_case
+        yield '%s %s %s (%s)' % (report.name, report.pattern, report.handler,
+                                 report.mode)
+        literal = sum(1 for action in report.actions.values()
+                      if action.literal)
+        yield '  views=%d predicates=%d literal=%d regex=%d worst_case=%s' % (
+            report.views, report.predicates, literal,
+            len(report.actions) - literal,
+            '?' if worst_case is None else worst_case)
+        if not report.actions:
+            continue
+        width = max(len(action) for action in report.actions)
+        yield '  %-*s %-8s %5s %10s %s' % (
+            width, 'action', 'kind', 'views', 'predicates', 'methods')
+        for action, action_report in report.actions.items():
+            yield '  %-*s %-8s %5d %10d %s' % (
+                width, action,
+                'literal' if action_report.literal else 'regex',
+                action_report.views, action_report.predicates,
+                ', '.join(action_report.methods))
+        for literal, pattern in report.ambiguous():
+            yield '  ambiguous: %s also matches %s' % (literal, pattern)
+        for action, route_name in report.unreachable():
+            yield '  unreachable: %s (matched by the route %s)' % (
+                action, route_name)
+
+
+def main(argv=sys.argv, out=sys.stdout, bootstrap=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] config_uri',
+        description='Show the views pyramid_handlers registered for each '
+        'handler route of an application, and the cost of dispatching to '
+        'them.')
+    parser.add_option('-s', '--sort', choices=('order', 'cost'),
+        default='order',
+        help='list routes in matching order (order) or the most expensive '
+        'to dispatch first (cost)')
+    options, args = parser.parse_args(list(argv[1:]))
+    if len(args) != 1:
+        parser.error('a config file (e.g. development.ini) is required')
+    if bootstrap is None: # pragma: no cover
+        from pyramid.paster import bootstrap
+    env = bootstrap(args[0])
+    try:
+        reports = handler_reports(env['registry'])
+    finally:
+        env['closer']()
+    if options.sort == 'cost':
+        reports.sort(key=lambda report: -(report.worst_case or 0))
+    for line in format_reports(reports):
+        out.write(line + '\n')
+    return 0
+
+if __name__ == '__main__': # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,294 @@
+""" A response cache shared by all the processes of a host.
+
+A preforking server whose workers each use a
+:class:`~pyramid_handlers.cache.ResponseCache` keeps a copy of every cached
+response per worker, and a response cached by one worker is a miss in all
+the others.  A :class:`SharedResponseCache` keeps the responses in a file
+which every worker maps into memory instead, so a host holds a single copy
+of each, and a response cached by one worker is a hit for all of them.
+
+Decorate a handler method with :func:`shared_cache` (alongside
+:class:`~pyramid_handlers.action`) to cache its responses there::
+
+  class Catalog(object):
+      @shared_cache(ttl=300)
+      @action(renderer='json')
+      def categories(self):
+          ...
+
+The file is named by the ``pyramid_handlers.shared_cache.path`` setting.
+It is made of ``pyramid_handlers.shared_cache.slots`` slots (1024 by
+default) of ``pyramid_handlers.shared_cache.slot_size`` bytes (64 KiB by
+default); a response which doesn't fit in a slot isn't cached.  A key may
+only be stored in one of a set of four slots; when those are all in use,
+the least recently used one is replaced.
+
+Reads don't take any lock: each slot starts with a sequence number which a
+writer makes odd while it changes the slot, and a reader retries if the
+number was odd or changed while it copied the slot.  Writers take an
+exclusive ``flock`` of the file; as a process forked after the cache was
+opened (by ``gunicorn --preload``, say) shares its parent's lock, it opens
+the file again before its first write.  An entry which can't be decoded
+anyway is a miss.  This module is only available on systems which have
+``fcntl``.
+"""
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from zope.interface import implementer
+
+from pyramid.exceptions import ConfigurationError
+
+from pyramid_handlers.interfaces import IResponseCache
+
+DEFAULT_SLOTS = 1024
+DEFAULT_SLOT_SIZE = 64 * 1024
+WAYS = 4
+MAGIC = b'PHCACHE1'
+
+# magic, number of slots, size of a slot
+FILE_HEADER = struct.Struct('<8sII')
+# sequence number, key hash, handler hash, action hash, expiry time, last
+# use time, size of the entry
+SLOT_HEADER = struct.Struct('<Q20s8s8sddI')
+SEQ = struct.Struct('<Q')
+# the last use time of a slot, and where it is in the slot header
+USED = struct.Struct('<d')
+USED_OFFSET = 52
+# size of the metadata (JSON status and headers) at the start of an entry
+ENTRY_HEADER = struct.Struct('<I')
+HEADER_SIZE = 64
+READ_ATTEMPTS = 4
+EMPTY = b'\0' * 20
+
+# held while a forked process opens the file of a cache again
+_reopening = threading.Lock()
+
+@implementer(IResponseCache)
+class SharedResponseCache(object):
+    """ A response cache kept in the memory-mapped file at ``path``, of
+    ``slots`` slots of ``slot_size`` bytes each.  The file is created, or
+    reinitialized if it was laid out differently."""
+    def __init__(self, path, slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE,
+                 clock=time.time):
+        if slots < WAYS or slot_size <= SLOT_HEADER.size:
+            raise ConfigurationError(
+                'a shared cache needs at least %d slots of more than %d '
+                'bytes' % (WAYS, SLOT_HEADER.size))
+        self.path = path
+        self.slots = slots - slots % WAYS
+        self.slot_size = slot_size
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.too_large = 0
+        self.pid = os.getpid()
+        size = HEADER_SIZE + self.slots * slot_size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            header = FILE_HEADER.pack(MAGIC, self.slots, slot_size)
+            if os.read(self.fd, FILE_HEADER.size) != header:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.write(self.fd, header)
+            self.map = mmap.mmap(self.fd, size)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def get(self, key):
+        digest = _digest(key)
+        now = self.clock()
+        for offset in self._slots(digest):
+            entry = self._read(offset, digest)
+            if entry is not None:
+                expires, data = entry
+                if expires > now:
+                    # racy, but a lost update only makes eviction less exact
+                    USED.pack_into(self.map, offset + USED_OFFSET, now)
+                    try:
+                        value = _decode(data)
+                    except (ValueError, struct.error):
+                        break
+                    self.hits += 1
+                    return value
+                break
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl):
+        data = _encode(value)
+        if len(data) > self.slot_size - SLOT_HEADER.size:
+            self.too_large += 1
+            return
+        digest = _digest(key)
+        now = self.clock()
+        with self._locked():
+            victim = None
+            for offset in self._slots(digest):
+                (seq, slot_digest, handler, action, expires, used,
+                 size) = SLOT_HEADER.unpack_from(self.map, offset)
+                if slot_digest == digest:
+                    victim = offset
+                    break
+                if slot_digest == EMPTY or expires <= now:
+                    used = -1
+                if victim is None or used < victim_used:
+                    victim, victim_used = offset, used
+            self._write(victim, digest, _hash(key[0]), _hash(key[1]),
+                        now + ttl, now, data)
+
+    def invalidate(self, handler_name, action=None):
+        handler = _hash(handler_name)
+        if action is not None:
+            action = _hash(action)
+        count = 0
+        with self._locked():
+            for offset in range(HEADER_SIZE, len(self.map), self.slot_size):
+                (seq, digest, slot_handler, slot_action, expires, used,
+                 size) = SLOT_HEADER.unpack_from(self.map, offset)
+                if (digest != EMPTY and slot_handler == handler and
+                    (action is None or slot_action == action)):
+                    self._write(offset, EMPTY, b'', b'', 0, 0, b'')
+                    count += 1
+        return count
+
+    def clear(self):
+        with self._locked():
+            for offset in range(HEADER_SIZE, len(self.map), self.slot_size):
+                self._write(offset, EMPTY, b'', b'', 0, 0, b'')
+
+    def _slots(self, digest):
+        index = int.from_bytes(digest[:8], 'little') % (self.slots // WAYS)
+        first = HEADER_SIZE + index * WAYS * self.slot_size
+        return range(first, first + WAYS * self.slot_size, self.slot_size)
+
+    def _read(self, offset, digest):
+        """ Return the ``(expires, data)`` of the slot at ``offset`` if it
+        holds the key whose digest is ``digest``."""
+        for attempt in range(READ_ATTEMPTS):
+            header = self.map[offset:offset + SLOT_HEADER.size]
+            (seq, slot_digest, handler, action, expires, used,
+             size) = SLOT_HEADER.unpack(header)
+            if seq % 2:
+                continue
+            if slot_digest != digest:
+                return None
+            start = offset + SLOT_HEADER.size
+            # a torn header may have any size
+            size = min(size, self.slot_size - SLOT_HEADER.size)
+            data = self.map[start:start + size]
+            if self.map[offset:offset + SEQ.size] == header[:SEQ.size]:
+                return expires, data
+        return None
+
+    def _write(self, offset, digest, handler, action, expires, used, data):
+        # readers ignore the slot while its sequence number is odd
+        seq = SEQ.unpack_from(self.map, offset)[0] | 1
+        SEQ.pack_into(self.map, offset, seq)
+        start = offset + SLOT_HEADER.size
+        self.map[start:start + len(data)] = data
+        SLOT_HEADER.pack_into(self.map, offset, seq, digest, handler,
+                              action, expires, used, len(data))
+        SEQ.pack_into(self.map, offset, seq + 1)
+
+    def _locked(self):
+        if self.pid != os.getpid():
+            with _reopening:
+                if self.pid != os.getpid():
+                    # a flock() belongs to the open file description, which
+                    # a forked process shares with its parent (the mapping
+                    # is shared anyway), and the thread lock may have been
+                    # held by a thread of the parent
+                    self.lock = threading.Lock()
+                    os.close(self.fd)
+                    self.fd = os.open(self.path, os.O_RDWR)
+                    self.pid = os.getpid()
+        return _FileLock(self.lock, self.fd)
+
+
+class _FileLock(object):
+    # flock() doesn't exclude the threads of a process from each other
+    def __init__(self, lock, fd):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except:
+            self.lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+
+
+def _digest(key):
+    return hashlib.sha1(repr(key).encode('utf-8')).digest()
+
+
+def _hash(name):
+    return hashlib.sha1(name.encode('utf-8')).digest()[:8]
+
+
+def _encode(value):
+    status, headerlist, body = value
+    meta = json.dumps([status, headerlist]).encode('utf-8')
+    return ENTRY_HEADER.pack(len(meta)) + meta + body
+
+
+def _decode(data):
+    size = ENTRY_HEADER.unpack_from(data)[0]
+    start = ENTRY_HEADER.size
+    status, headerlist = json.loads(data[start:start + size].decode('utf-8'))
+    return status, [tuple(header) for header in headerlist], (
+        data[start + size:])
+
+
+def get_shared_cache(registry):
+    """ Return the :class:`SharedResponseCache` of ``registry``, opening it
+    if needed."""
+    cache = registry.queryUtility(IResponseCache, name='shared')
+    if cache is None:
+        settings = registry.settings or {}
+        path = settings.get('pyramid_handlers.shared_cache.path')
+        if not path:
+            raise ConfigurationError(
+                'the pyramid_handlers.shared_cache.path setting must name '
+                'the file of the shared response cache')
+        cache = SharedResponseCache(
+            path,
+            int(settings.get('pyramid_handlers.shared_cache.slots') or
+                DEFAULT_SLOTS),
+            int(settings.get('pyramid_handlers.shared_cache.slot_size') or
+                DEFAULT_SLOT_SIZE))
+        registry.registerUtility(cache, IResponseCache, name='shared')
+    return cache
+
+
+def shared_cache(ttl, vary=None):
+    """ Decorate a handler method so that the responses of the views
+    :func:`~pyramid_handlers.add_handler` registers for it are cached for
+    ``ttl`` seconds in the shared response cache.  ``vary`` is the same as
+    the ``cache_vary`` argument of :class:`~pyramid_handlers.action`."""
+    def decorator(wrapped):
+        wrapped.__shared_cache__ = (ttl, vary)
+        return wrapped
+    return decorator
@@ -0,0 +1,97 @@
+""" Streaming responses from generator actions.
+
+An action decorated with ``@action(stream=True, content_type='text/csv')``
+may return (or be) a generator of chunks of the body, as bytes or text; the
+chunks are sent as they are produced, through the ``app_iter`` of
+``request.response``, instead of being joined into a body first.
+
+The ``json_stream`` renderer, registered when ``pyramid_handlers`` is
+included, renders an iterable of rows as a JSON array, encoding the rows
+one at a time::
+
+  @action(renderer='json_stream')
+  def export(self):
+      for row in self.request.db.query(Order).yield_per(1000):
+          yield {'id': row.id, 'total': row.total}
+
+Either way, the memory used doesn't grow with the size of the response.
+"""
+import json
+
+from pyramid.interfaces import IResponse
+
+DEFAULT_CONTENT_TYPE = 'text/plain'
+
+def stream_wrapper(content_type=DEFAULT_CONTENT_TYPE):
+    """ Return a function wrapping a view callable so that the iterables it
+    returns (rather than responses) are streamed as the body of
+    ``request.response``, with a type of ``content_type``."""
+    def wrapper(view):
+        def streaming_view(context, request):
+            result = view(context, request)
+            if IResponse.providedBy(result):
+                return result
+            response = request.response
+            response.content_type = content_type
+            response.app_iter = encoded(result, response.charset or 'UTF-8')
+            return response
+        return streaming_view
+    return wrapper
+
+
+def encoded(chunks, charset='UTF-8'):
+    """ Yield each of ``chunks``, encoded with ``charset`` if it is text;
+    ``chunks`` is closed when the result is."""
+    try:
+        for chunk in chunks:
+            if not isinstance(chunk, bytes):
+                chunk = chunk.encode(charset)
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class JSONStream(object):
+    """ A renderer factory rendering an iterable as a JSON array, in chunks
+    of about ``chunk_size`` bytes.  Keyword arguments are passed to
+    :func:`json.dumps` for each row."""
+    def __init__(self, chunk_size=8192, **kw):
+        self.chunk_size = chunk_size
+        self.kw = kw
+
+    def __call__(self, info):
+        def _render(value, system):
+            request = system.get('request')
+            if request is not None:
+                response = request.response
+                if response.content_type == response.default_content_type:
+                    response.content_type = 'application/json'
+            return json_array(value, self.chunk_size, **self.kw)
+        return _render
+
+
+def json_array(rows, chunk_size=8192, **kw):
+    """ Yield the JSON array of ``rows`` as UTF-8 encoded chunks of about
+    ``chunk_size`` bytes."""
+    try:
+        buf = ['[']
+        size = 1
+        separator = ''
+        for row in rows:
+            encoded_row = json.dumps(row, **kw)
+            buf.append(separator)
+            buf.append(encoded_row)
+            separator = ','
+            size += len(encoded_row) + 1
+            if size >= chunk_size:
+                yield ''.join(buf).encode('utf-8')
+                buf = []
+                size = 0
+        buf.append(']')
+        yield ''.join(buf).encode('utf-8')
+    finally:
+        close = getattr(rows, 'close', None)
+        if close is not None:
+            close()
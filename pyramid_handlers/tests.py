@@ -118,6 +118,13 @@ class Test_add_handler(unittest.TestCase):
         self.assertRaises(ConfigurationError, config.add_handler,
                           'name', '/{action}', MyView)
 
+    def test_add_handler_autoexpose_compiled_once(self):
+        from pyramid_handlers import compile_autoexpose
+        class MyView(DummyHandler):
+            __autoexpose__ = 'action[0-9]'
+        self.assertTrue(compile_autoexpose(MyView.__autoexpose__) is
+                        compile_autoexpose('action[0-9]'))
+
     def test_add_handler_with_view_method_has_expose_config(self):
         config = self._makeOne()
         views = []
@@ -189,6 +196,24 @@ class Test_add_handler(unittest.TestCase):
         self.assertEqual(view['attr'], 'action')
         self.assertEqual(view['view'], MyView)
 
+    def test_add_handler_regex_actions_share_group(self):
+        from pyramid_handlers import action
+        config = self._makeOne()
+        views = []
+        def dummy_add_view(**kw):
+            views.append(kw)
+        config.add_view = dummy_add_view
+        class MyView(object):
+            @action(name='^a[0-9]+$')
+            def one(self): pass
+            @action(name='^b[0-9]+$')
+            def two(self): pass
+        config.add_handler('name', '/{action}', MyView)
+        pred1 = views[0]['custom_predicates'][-1]
+        pred2 = views[1]['custom_predicates'][-1]
+        self.assertTrue(pred1.group is pred2.group)
+        self.assertEqual(pred1.group.patterns, ['^a[0-9]+$', '^b[0-9]+$'])
+
     def test_add_handler_with_action_decorator(self):
         config = self._makeOne()
         views = []
@@ -382,6 +407,1073 @@ class Test_add_handler(unittest.TestCase):
             elif view['attr'] == 'index2':
                 self.assertEqual(view['permission'], 'different_perm')
 
+    def test_add_handler_single_view(self):
+        config = self._makeOne()
+        views = []
+        def dummy_add_view(**kw):
+            views.append(kw)
+        config.add_view = dummy_add_view
+        config.add_handler('name', '/{action}', DummyHandler, single_view=True)
+        self._assertRoute(config, 'name', '/{action}', 0)
+        self.assertEqual(len(views), 3)
+        dispatcher = views[0]['view']
+        self.assertEqual(views[0]['route_name'], 'name')
+        self.assertEqual(sorted(dispatcher.actions), ['action1', 'action2'])
+        for view in views[1:]:
+            self.assertFalse('custom_predicates' in view)
+            self.assertEqual(view['name'],
+                             dispatcher.actions[view['attr']])
+
+    def test_add_handler_single_view_dispatches(self):
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.method_name_xformer'] = (
+            lambda name: name.replace('_', '-'))
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            def an_action(self):
+                return Response('literal')
+            @action(name='num[0-9]+')
+            def numbered(self):
+                return Response('regex')
+        config.add_handler('name', '/{action}', MyHandler, single_view=True)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/an-action').body, b'literal')
+        self.assertEqual(_get(app, '/num42').body, b'regex')
+        self.assertEqual(_get(app, '/an_action').status_int, 404)
+        self.assertEqual(_get(app, '/num').status_int, 404)
+
+    def test_add_handler_single_view_with_view_predicates(self):
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        config = self._makeOne()
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(name='index', request_method='POST')
+            def create(self):
+                return Response('create')
+            @action(request_method='GET')
+            def index(self):
+                return Response('index')
+        config.add_handler('name', '/{action}', MyHandler, single_view=True)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/index').body, b'index')
+        self.assertEqual(_get(app, '/index', method='POST').body, b'create')
+        self.assertEqual(_get(app, '/index', method='PUT').status_int, 404)
+
+    def test_add_handler_process_scope(self):
+        from pyramid.response import Response
+        config = self._makeOne()
+        created = []
+        class MyHandler(object):
+            __handler_scope__ = 'process'
+            def __init__(self):
+                created.append(self)
+            def index(self, request):
+                return Response(request.matchdict['action'])
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/index').body, b'index')
+        self.assertEqual(_get(app, '/index').body, b'index')
+        self.assertEqual(len(created), 1)
+
+    def test_add_handler_thread_scope(self):
+        import threading
+        from pyramid.response import Response
+        config = self._makeOne()
+        created = []
+        class MyHandler(object):
+            __handler_scope__ = 'thread'
+            def __init__(self):
+                created.append(self)
+            def __call__(self, request):
+                return Response('called')
+        config.add_handler('name', '/', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/').body, b'called')
+        self.assertEqual(_get(app, '/').body, b'called')
+        thread = threading.Thread(target=_get, args=(app, '/'))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(created), 2)
+
+    def test_add_handler_scope_refused_when_stateful(self):
+        import warnings
+        from pyramid.response import Response
+        config = self._makeOne()
+        created = []
+        class MyHandler(object):
+            __handler_scope__ = 'process'
+            def __init__(self):
+                created.append(self)
+            def index(self, request):
+                self.request = request
+                return Response('index')
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            self.assertEqual(_get(app, '/index').body, b'index')
+            self.assertEqual(_get(app, '/index').body, b'index')
+            self.assertEqual(_get(app, '/index').body, b'index')
+        self.assertEqual(len(w), 1)
+        self.assertTrue(issubclass(w[0].category, RuntimeWarning))
+        self.assertEqual(len(created), 3)
+
+    def test_add_handler_bad_scope(self):
+        from pyramid.exceptions import ConfigurationError
+        config = self._makeOne()
+        class MyHandler(object):
+            __handler_scope__ = 'session'
+            def index(self, request): pass
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', MyHandler)
+
+    def test_add_handler_lazy(self):
+        config = self._makeOne()
+        config.add_handler('name', '/{action}',
+                           'pyramid_handlers.tests.LazyHandler', lazy=True)
+        config.add_handler('fixed', '/fixed/',
+                           'pyramid_handlers.tests.LazyHandler',
+                           action='index', lazy=True)
+        app = config.make_wsgi_app()
+        lazy = self._getView(config, 'name')
+        self.assertEqual(lazy.handler, None)
+        self.assertEqual(_get(app, '/index').body, b'index')
+        self.assertEqual(_get(app, '/other').body, b'other')
+        self.assertEqual(_get(app, '/missing').status_int, 404)
+        self.assertTrue(lazy.handler is LazyHandler)
+        self.assertEqual(self._getView(config, 'fixed').handler, None)
+        self.assertEqual(_get(app, '/fixed/').body, b'index')
+
+    def test_add_handler_lazy_eager_setting(self):
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.eager'] = 'true'
+        views = []
+        def dummy_add_view(**kw):
+            views.append(kw)
+        config.add_view = dummy_add_view
+        config.add_handler('name', '/{action}',
+                           'pyramid_handlers.tests.LazyHandler', lazy=True)
+        self.assertEqual([view['attr'] for view in views], ['index', 'other'])
+
+    def test_add_handler_preload(self):
+        import gc
+        from pyramid_handlers import includeme
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.preload'] = 'true'
+        config.include(includeme)
+        config.add_handler('name', '/{action}',
+                           'pyramid_handlers.tests.LazyHandler', lazy=True)
+        from pyramid_handlers import LazyHandler as LazyView
+        self.assertFalse([intr for intr in
+                          config.registry.introspector.get_category('views')
+                          if isinstance(intr['introspectable']['callable'],
+                                        LazyView)])
+        frozen = getattr(gc, 'get_freeze_count', lambda: 0)()
+        unfreeze = getattr(gc, 'unfreeze', None)
+        if unfreeze is not None:
+            self.addCleanup(unfreeze)
+        app = config.make_wsgi_app()
+        if unfreeze is not None:
+            self.assertTrue(gc.get_freeze_count() > frozen)
+        self.assertEqual(_get(app, '/other').body, b'other')
+
+    def test_add_handler_warmup(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        from pyramid_handlers.warmup import warm_up
+        calls = []
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(warmup={'id': '1'}, renderer='string')
+            def index(self):
+                calls.append((self.request.path, self.request.environ.get(
+                    'pyramid_handlers.warmup')))
+                return 'index'
+            @action(name=r'page-\d+', warmup={'id': '1', 'action': 'page-1'})
+            def page(self):
+                calls.append((self.request.path, None))
+                return Response('page')
+            @action(warmup={'id': '1'})
+            def broken(self):
+                raise ValueError('broken')
+            def other(self): # pragma: no cover
+                calls.append((self.request.path, None))
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.warmup'] = 'true'
+        config.include(includeme)
+        config.add_handler('lazy', '/lazy/{action}',
+                           'pyramid_handlers.tests:WarmHandler', lazy=True)
+        config.add_handler('name', '/{id}/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertEqual(calls, [('/1/index', True), ('/1/page-1', None)])
+        self.assertEqual(WarmHandler.calls, 1)
+        results = warm_up(app)
+        self.assertEqual([result[:2] for result in results], [
+            ('name', 'broken'), ('name', 'index'), ('name', 'page-\\d+'),
+            ('lazy', 'index')])
+        self.assertTrue(isinstance(results[0][2], ValueError))
+        self.assertEqual(results[1][2], '200 OK')
+        self.assertEqual(_get(app, '/1/index').body, b'index')
+        config.registry.settings['pyramid_handlers.warmup.strict'] = 'true'
+        self.assertRaises(ConfigurationError, config.make_wsgi_app)
+
+    def test_add_handler_warmup_bypasses_caches(self):
+        import os
+        import shutil
+        import tempfile
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        from pyramid_handlers.interfaces import IResponseCache
+        from pyramid_handlers.sharedcache import shared_cache
+        from pyramid_handlers.timing import get_timings
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string', cache_ttl=60, coalesce=True,
+                    warmup=True)
+            def home(self):
+                return self.request.route_url('h', action='home')
+            @shared_cache(60)
+            @action(renderer='string', warmup=True)
+            def shared(self):
+                return self.request.route_url('h', action='shared')
+        config = self._makeOne()
+        settings = config.registry.settings
+        settings['pyramid_handlers.warmup'] = 'true'
+        settings['pyramid_handlers.shared_cache.path'] = os.path.join(
+            tmpdir, 'cache')
+        config.include(includeme)
+        config.add_handler('h', '/h/{action}', MyHandler, timing=True)
+        app = config.make_wsgi_app()
+        self.addCleanup(app.registry.getUtility(
+            IResponseCache, name='shared').close)
+        for (route_name, handler, action), histogram in get_timings(
+                app.registry):
+            self.assertEqual(histogram.count, 0)
+        for action in ('home', 'shared'):
+            response = _get(app, 'https://example.com/h/%s' % action)
+            self.assertEqual(response.text,
+                             'https://example.com/h/%s' % action)
+
+    def test_add_handler_timing(self):
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        from pyramid_handlers.timing import dump_timings
+        from pyramid_handlers.timing import get_timings
+        config = self._makeOne()
+        calls = []
+        def decorator(view):
+            def wrapper(context, request):
+                calls.append(request.path)
+                return view(context, request)
+            return wrapper
+        class MyHandler(object):
+            __action_decorator__ = decorator
+            def __init__(self, request):
+                self.request = request
+            def index(self):
+                return Response('index')
+            @action(timing=False)
+            def untimed(self):
+                return Response('untimed')
+        config.add_handler('name', '/{action}', MyHandler, timing=True)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/index').body, b'index')
+        self.assertEqual(_get(app, '/index').body, b'index')
+        self.assertEqual(_get(app, '/untimed').body, b'untimed')
+        self.assertEqual(calls, ['/index', '/index', '/untimed'])
+        timings = get_timings(config.registry)
+        keys = [key for key, histogram in timings]
+        name = MyHandler.__module__ + '.' + getattr(
+            MyHandler, '__qualname__', MyHandler.__name__)
+        self.assertEqual(keys, [('name', name, 'index')])
+        self.assertEqual(timings.histograms[keys[0]].count, 2)
+        self.assertTrue(dump_timings(config.registry).startswith(
+            'name %s index count=2 ' % name))
+
+    def test_add_handler_timing_setting(self):
+        from pyramid_handlers.timing import get_timings
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.timing'] = 'true'
+        config.add_handler('name', '/{action}', DummyHandler)
+        config.add_handler('other', '/other', DummyHandler, action='action1',
+                           timing=False)
+        timings = get_timings(config.registry)
+        self.assertEqual([key[2] for key, histogram in timings],
+                         ['action1', 'action2'])
+
+    def test_add_handler_no_timing(self):
+        from pyramid_handlers.timing import dump_timings
+        config = self._makeOne()
+        config.add_handler('name', '/{action}', DummyHandler)
+        self.assertEqual(dump_timings(config.registry), '')
+
+    def test_add_handler_coroutine_actions(self):
+        import asyncio
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        config = self._makeOne()
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            async def _fetch(self, value):
+                await asyncio.sleep(0.01)
+                return value
+            @action(renderer='string')
+            async def gathered(self):
+                values = await asyncio.gather(
+                    self._fetch('a'), self._fetch('b'))
+                return ''.join(values)
+            def plain(self):
+                return Response('plain')
+        config.add_handler('name', '/{action}', MyHandler)
+        config.add_handler('single', '/single/{action}', MyHandler,
+                           single_view=True)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/gathered').body, b'ab')
+        self.assertEqual(_get(app, '/single/gathered').body, b'ab')
+        self.assertEqual(_get(app, '/plain').body, b'plain')
+
+    def test_add_handler_coroutine_action_timeout(self):
+        import asyncio
+        from pyramid_handlers import action
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.async_timeout'] = '0.01'
+        class MyHandler(object):
+            __handler_scope__ = 'process'
+            @action(renderer='string')
+            async def slow(self, request):
+                await asyncio.sleep(1)
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/slow').status_int, 504)
+
+    def test_add_handler_offload_stream(self):
+        import threading
+        from pyramid.request import Request
+        from pyramid.threadlocal import get_current_request
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        config = self._makeOne()
+        config.include(includeme)
+        closed = []
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(stream=True, offload=True)
+            def export(self):
+                try:
+                    for n in range(20):
+                        if get_current_request() is not self.request:
+                            raise AssertionError # pragma: no cover
+                        yield '%s\n' % threading.current_thread().name
+                finally:
+                    closed.append(threading.current_thread().name)
+            @action(renderer='json_stream', offload=True)
+            def rows(self):
+                yield threading.current_thread().name
+            @action(stream=True, offload=True)
+            def broken(self):
+                yield 'a'
+                raise ValueError('broken')
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        lines = _get(app, '/export').text.splitlines()
+        self.assertEqual(len(lines), 20)
+        for name in lines + closed:
+            self.assertTrue(name.startswith('pyramid_handlers pool default'))
+        self.assertTrue(_get(app, '/rows').json[0].startswith(
+            'pyramid_handlers pool default'))
+        # closed early: the generator is closed on the pool
+        del closed[:]
+        status, headers, app_iter = Request.blank(
+            '/export').call_application(app)
+        next(iter(app_iter))
+        app_iter.close()
+        from pyramid_handlers.pools import get_pool
+        get_pool(config.registry).shutdown()
+        self.assertEqual(len(closed), 1)
+        self.assertTrue(closed[0].startswith('pyramid_handlers pool'))
+        status, headers, app_iter = Request.blank(
+            '/broken').call_application(app)
+        self.assertRaises(ValueError, list, app_iter)
+
+    def test_add_handler_offload(self):
+        import threading
+        from pyramid.threadlocal import get_current_request
+        from pyramid_handlers import action
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.pool.reports.workers'] = 2
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string', offload=True, pool='reports')
+            def report(self):
+                self.assertCurrent()
+                return threading.current_thread().name
+            @action(renderer='string', offload=True)
+            def default(self):
+                self.assertCurrent()
+                return threading.current_thread().name
+            def assertCurrent(self):
+                if get_current_request() is not self.request:
+                    raise AssertionError # pragma: no cover
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertTrue(_get(app, '/report').text.startswith(
+            'pyramid_handlers pool reports'))
+        self.assertTrue(_get(app, '/default').text.startswith(
+            'pyramid_handlers pool default'))
+        from pyramid_handlers.pools import get_pool
+        self.assertEqual(get_pool(config.registry, 'reports').workers, 2)
+
+    def test_add_handler_offload_thread_scope(self):
+        import threading
+        from pyramid_handlers import action
+        config = self._makeOne()
+        class MyHandler(object):
+            __handler_scope__ = 'thread'
+            @action(renderer='string', pool='reports')
+            def report(self, request):
+                return threading.current_thread().name
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertTrue(_get(app, '/report').text.startswith(
+            'pyramid_handlers pool reports'))
+
+    def test_add_handler_offload_pool_full_and_timeout(self):
+        import threading
+        from pyramid_handlers import action
+        config = self._makeOne()
+        settings = config.registry.settings
+        settings['pyramid_handlers.pool.slow.workers'] = '1'
+        settings['pyramid_handlers.pool.slow.queue'] = '0'
+        settings['pyramid_handlers.pool.slow.timeout'] = '0.05'
+        event = threading.Event()
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string', pool='slow')
+            def slow(self):
+                event.wait(5)
+                return 'done'
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        try:
+            self.assertEqual(_get(app, '/slow').status_int, 504)
+            # the action still holds the only thread of the pool
+            self.assertEqual(_get(app, '/slow').status_int, 503)
+        finally:
+            event.set()
+        from pyramid_handlers.pools import get_pool
+        pool = get_pool(config.registry, 'slow')
+        pool.shutdown()
+        self.assertEqual((pool.timed_out, pool.rejected), (1, 1))
+        self.assertEqual(_get(app, '/slow').text, 'done')
+
+    def test_add_handler_offload_bad_pool_setting(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid_handlers import action
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.pool.bad.workers'] = '0'
+        class MyHandler(object):
+            @action(pool='bad')
+            def index(self): pass
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', MyHandler)
+
+    def test_add_handler_cache(self):
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        from pyramid_handlers.cache import invalidate
+        config = self._makeOne()
+        created = []
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+                created.append(request.path_qs)
+            @action(renderer='string', cache_ttl=60)
+            def listing(self):
+                return 'listing %d' % len(created)
+            @action(renderer='string', cache_ttl=60,
+                    cache_vary=['page', 'header:Accept-Language'])
+            def paged(self):
+                return 'paged %d' % len(created)
+            @action(cache_ttl=60)
+            def cookie(self):
+                response = Response('cookie')
+                response.set_cookie('a', 'b')
+                return response
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/listing').text, 'listing 1')
+        self.assertEqual(_get(app, '/listing').text, 'listing 1')
+        self.assertEqual(_get(app, '/listing?a=1').text, 'listing 2')
+        self.assertEqual(_get(app, '/listing', 'POST').text, 'listing 3')
+        self.assertEqual(_get(app, '/paged?page=1&a=1').text, 'paged 4')
+        self.assertEqual(_get(app, '/paged?a=2&page=1').text, 'paged 4')
+        self.assertEqual(_get(app, '/paged?page=2').text, 'paged 5')
+        self.assertEqual(len(created), 5)
+        self.assertEqual(invalidate(config.registry, MyHandler, 'paged'), 2)
+        self.assertEqual(_get(app, '/listing').text, 'listing 1')
+        self.assertEqual(_get(app, '/paged?page=1').text, 'paged 6')
+        self.assertEqual(invalidate(config.registry, MyHandler), 3)
+        _get(app, '/cookie')
+        _get(app, '/cookie')
+        self.assertEqual(len(created), 8)
+
+    def test_add_handler_conditional(self):
+        import datetime
+        from pyramid.request import Request
+        from pyramid_handlers import action
+        config = self._makeOne()
+        created = []
+        class MyHandler(object):
+            def __init__(self, request):
+                created.append(request)
+            @action(renderer='string', etag=lambda request: 'v1')
+            def tagged(self):
+                return 'tagged'
+            @action(renderer='string',
+                    last_modified=lambda request: 1445412480.5)
+            def dated(self):
+                return 'dated'
+            @action(renderer='string', etag=lambda request: None)
+            def unknown(self):
+                return 'unknown'
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        def get(path, **headers):
+            return Request.blank(path, headers=headers).get_response(app)
+        response = get('/tagged')
+        self.assertEqual((response.status_int, response.etag), (200, 'v1'))
+        response = get('/tagged', **{'If-None-Match': '"v0", "v1"'})
+        self.assertEqual((response.status_int, response.etag), (304, 'v1'))
+        response = get('/tagged', **{'If-None-Match': '"v0"'})
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(len(created), 2)
+        response = get('/dated')
+        self.assertEqual(response.last_modified, datetime.datetime(
+            2015, 10, 21, 7, 28, tzinfo=response.last_modified.tzinfo))
+        since = {'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        self.assertEqual(get('/dated', **since).status_int, 304)
+        since = {'If-Modified-Since': 'Wed, 21 Oct 2015 07:27:59 GMT'}
+        self.assertEqual(get('/dated', **since).status_int, 200)
+        self.assertEqual(get('/unknown', **{'If-None-Match': '*'}).status_int,
+                         200)
+        self.assertEqual(len(created), 5)
+
+    def test_add_handler_stream(self):
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        config = self._makeOne()
+        config.include(includeme)
+        closed = []
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(stream=True, content_type='text/csv')
+            def export(self):
+                self.request.response.content_disposition = 'attachment'
+                def rows():
+                    try:
+                        yield 'a,b\n'
+                        yield b'1,\xc3\xa9\n'
+                    finally:
+                        closed.append(True)
+                return rows()
+            @action(stream=True)
+            def response(self):
+                return Response('response')
+            @action(renderer='json_stream')
+            def rows(self):
+                return iter([{'a': 1}, [2], 'x' * 10])
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        response = _get(app, '/export')
+        self.assertEqual(response.content_type, 'text/csv')
+        self.assertEqual(response.content_disposition, 'attachment')
+        self.assertEqual(response.body, b'a,b\n1,\xc3\xa9\n')
+        self.assertEqual(closed, [True])
+        self.assertEqual(_get(app, '/response').body, b'response')
+        response = _get(app, '/rows')
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(response.json, [{'a': 1}, [2], 'x' * 10])
+
+    def test_add_handler_content_type_without_stream(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid_handlers import action
+        config = self._makeOne()
+        class MyHandler(object):
+            @action(content_type='text/csv')
+            def index(self): pass
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', MyHandler)
+
+    def test_add_handler_cache_bad_ttl(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid_handlers import action
+        config = self._makeOne()
+        class MyHandler(object):
+            @action(cache_ttl=0)
+            def index(self): pass
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', MyHandler)
+
+    def test_add_handler_max_concurrency(self):
+        import threading
+        from pyramid_handlers import action
+        from pyramid_handlers.limits import get_limits
+        config = self._makeOne()
+        started = threading.Event()
+        event = threading.Event()
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string', max_concurrency=1, max_queued=0)
+            def report(self):
+                started.set()
+                event.wait(5)
+                return 'report'
+            @action(renderer='string')
+            def cheap(self):
+                return 'cheap'
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        responses = []
+        thread = threading.Thread(
+            target=lambda: responses.append(_get(app, '/report')))
+        thread.start()
+        try:
+            started.wait(5)
+            response = _get(app, '/report')
+            self.assertEqual(response.status_int, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            self.assertEqual(_get(app, '/cheap').body, b'cheap')
+        finally:
+            event.set()
+            thread.join()
+        self.assertEqual(responses[0].body, b'report')
+        self.assertEqual(_get(app, '/report').body, b'report')
+        [(key, limit)] = list(get_limits(config.registry))
+        self.assertEqual(key[0], 'name')
+        self.assertEqual(key[2], 'report')
+        self.assertEqual((limit.admitted, limit.queued, limit.rejected),
+                         (2, 0, 1))
+
+    def test_add_handler_max_concurrency_streamed(self):
+        from pyramid.request import Request
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        from pyramid_handlers.limits import get_limits
+        config = self._makeOne()
+        config.include(includeme)
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(stream=True, max_concurrency=1, max_queued=0)
+            def export(self):
+                yield 'a'
+                yield 'b'
+            @action(renderer='json_stream', max_concurrency=1, max_queued=0)
+            def rows(self):
+                yield 1
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        for path, body in (('/export', b'ab'), ('/rows', b'[1]')):
+            status, headers, app_iter = Request.blank(
+                path).call_application(app)
+            self.assertEqual(status, '200 OK')
+            self.assertEqual(_get(app, path).status_int, 503)
+            self.assertEqual(b''.join(app_iter), body)
+            app_iter.close()
+            self.assertEqual(_get(app, path).body, body)
+        for key, limit in get_limits(app.registry):
+            self.assertEqual((limit.admitted, limit.rejected), (2, 1))
+
+    def test_add_handler_max_concurrency_bad_options(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid_handlers import action
+        for kw in ({'max_concurrency': 0}, {'max_queued': 1},
+                   {'max_concurrency': 1, 'queue_timeout': -1}):
+            config = self._makeOne()
+            class MyHandler(object):
+                @action(**kw)
+                def index(self): pass
+            self.assertRaises(ConfigurationError, config.add_handler,
+                              'name', '/{action}', MyHandler)
+
+    def test_add_handler_coalesce(self):
+        import threading
+        import time
+        from pyramid.response import Response
+        from pyramid_handlers import action
+        config = self._makeOne()
+        created = []
+        keys = []
+        event = threading.Event()
+        def key(request):
+            keys.append(request.path_qs)
+            return request.path
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+                created.append(request.path_qs)
+            @action(renderer='string', coalesce=True)
+            def popular(self):
+                event.wait(5)
+                return 'popular %d' % len(created)
+            @action(renderer='string', coalesce=True, coalesce_key=key,
+                    coalesce_timeout=0.01)
+            def keyed(self):
+                event.wait(5)
+                return 'keyed'
+            @action(coalesce=True)
+            def cookie(self):
+                event.wait(5)
+                response = Response('cookie %d' % len(created))
+                response.set_cookie('a', 'b')
+                return response
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        def concurrently(*paths):
+            event.clear()
+            responses = [None] * len(paths)
+            def get(i, path):
+                responses[i] = _get(app, path)
+            threads = [threading.Thread(target=get, args=(i, path))
+                       for i, path in enumerate(paths)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.02)
+            event.set()
+            for thread in threads:
+                thread.join()
+            return [response.text for response in responses]
+        self.assertEqual(concurrently('/popular?a=1&b=2', '/popular?b=2&a=1',
+                                      '/popular?a=2'),
+                         ['popular 2', 'popular 2', 'popular 2'])
+        self.assertEqual(created, ['/popular?a=1&b=2', '/popular?a=2'])
+        del created[:]
+        self.assertEqual(concurrently('/cookie', '/cookie'),
+                         ['cookie 1', 'cookie 2'])
+        del created[:]
+        texts = concurrently('/keyed?a=1', '/keyed?a=2')
+        self.assertEqual(texts[0], 'keyed')
+        self.assertTrue(texts[1].startswith('504 Gateway Timeout'))
+        self.assertEqual(keys, ['/keyed?a=1', '/keyed?a=2'])
+        self.assertEqual(_get(app, '/popular', 'POST').text, 'popular 2')
+
+    def test_add_handler_coalesce_without_coalesce(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid_handlers import action
+        config = self._makeOne()
+        class MyHandler(object):
+            @action(coalesce_timeout=1)
+            def index(self): pass
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', MyHandler)
+
+    def test_add_handler_profile(self):
+        import os
+        import pstats
+        import shutil
+        import tempfile
+        from pyramid_handlers import action
+        from pyramid_handlers.interfaces import IActionProfiles
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        config = self._makeOne()
+        settings = config.registry.settings
+        settings['pyramid_handlers.profile.rate'] = '1'
+        settings['pyramid_handlers.profile.interval'] = '0'
+        settings['pyramid_handlers.profile.directory'] = os.path.join(
+            directory, 'profiles')
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string')
+            def report(self):
+                return 'report'
+            @action(renderer='string', profile=False)
+            def quiet(self):
+                return 'quiet'
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/report').body, b'report')
+        self.assertEqual(_get(app, '/quiet').body, b'quiet')
+        profiles = config.registry.getUtility(IActionProfiles)
+        self.assertEqual([key[2] for key in profiles.stats], ['report'])
+        [filename] = os.listdir(os.path.join(directory, 'profiles'))
+        self.assertTrue(filename.startswith('name.'))
+        self.assertTrue(filename.endswith(
+            '.MyHandler.report.%d.pstats' % os.getpid()))
+        stats = pstats.Stats(os.path.join(directory, 'profiles', filename))
+        self.assertTrue([func for func in stats.stats
+                         if func[2] == 'report'])
+
+    def test_add_handler_profile_bad_rate(self):
+        from pyramid.exceptions import ConfigurationError
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.profile.rate'] = '2'
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', DummyHandler)
+
+    def test_add_handler_allocations(self):
+        import tracemalloc
+        from pyramid_handlers import action
+        from pyramid_handlers.allocations import dump_allocations
+        from pyramid_handlers.allocations import get_allocations
+        config = self._makeOne()
+        settings = config.registry.settings
+        settings['pyramid_handlers.allocations.rate'] = '1'
+        settings['pyramid_handlers.allocations.top'] = '2'
+        kept = []
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string')
+            def hungry(self):
+                kept.append(bytearray(200000))
+                scratch = [bytearray(100000) for i in range(5)]
+                return str(len(scratch))
+            @action(renderer='string', allocations=False)
+            def quiet(self):
+                return 'quiet'
+        config.add_handler('name', '/{action}', MyHandler)
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/hungry').body, b'5')
+        self.assertEqual(_get(app, '/quiet').body, b'quiet')
+        self.assertFalse(tracemalloc.is_tracing())
+        [(key, allocations)] = list(get_allocations(config.registry))
+        self.assertEqual(key[2], 'hungry')
+        self.assertEqual(allocations.count, 1)
+        self.assertTrue(allocations.retained_max >= 200000)
+        self.assertTrue(allocations.peak_max >= 700000)
+        [(site, size)] = allocations.top_sites(1)
+        self.assertTrue('tests.py' in site)
+        self.assertTrue(size >= 200000)
+        lines = dump_allocations(config.registry).splitlines()
+        self.assertTrue(lines[0].startswith('name '))
+        self.assertTrue(' hungry count=1 peak_mean=' in lines[0])
+        self.assertTrue(len(lines) <= 3)
+
+    def test_add_handler_allocations_bad_setting(self):
+        from pyramid.exceptions import ConfigurationError
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.allocations.rate'] = '1'
+        config.registry.settings['pyramid_handlers.allocations.frames'] = '0'
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', DummyHandler)
+
+    def test_add_handler_batch(self):
+        from pyramid.httpexceptions import HTTPFound
+        from pyramid_handlers import action
+        config = self._makeOne()
+        config.testing_securitypolicy(userid='fred', permissive=False)
+        instances = []
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+                instances.append(self)
+            @action(renderer='json')
+            def profile(self):
+                return {'id': self.request.GET['id'],
+                        'action': self.request.matchdict['action'],
+                        'method': self.request.method}
+            @action(renderer='string')
+            def greet(self):
+                self.request.response.status_int = 201
+                return 'hello %s' % self.request.GET.getall('name')
+            @action(name=r'page-\d+', renderer='string')
+            def page(self):
+                return self.request.matchdict['action']
+            @action(renderer='string', permission='edit')
+            def edit(self): # pragma: no cover
+                return 'edited'
+            @action(renderer='string', request_method='POST')
+            def post(self): # pragma: no cover
+                return 'posted'
+            @action()
+            def moved(self):
+                raise HTTPFound('/elsewhere')
+        config.add_handler('users', '/users/{action}', MyHandler,
+                           batch='/users/_batch')
+        app = config.make_wsgi_app()
+        request = self._batchRequest([
+            {'action': 'profile', 'params': {'id': '42'}},
+            {'action': 'greet', 'params': {'name': ['a', 'b']}},
+            {'action': 'page-2'},
+            {'action': 'edit'},
+            {'action': 'post'},
+            {'action': 'moved'},
+            ])
+        response = request.get_response(app)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(response.json, [
+            {'action': 'profile', 'status': 200,
+             'content_type': 'application/json',
+             'body': {'id': '42', 'action': 'profile', 'method': 'GET'}},
+            {'action': 'greet', 'status': 201, 'content_type': 'text/plain',
+             'body': "hello ['a', 'b']"},
+            {'action': 'page-2', 'status': 200, 'content_type': 'text/plain',
+             'body': 'page-2'},
+            {'action': 'edit', 'status': 403, 'content_type': 'text/html',
+             'body': ''},
+            {'action': 'post', 'status': 404, 'content_type': 'text/html',
+             'body': ''},
+            {'action': 'moved', 'status': 302, 'content_type': 'text/html',
+             'body': ''},
+            ])
+        self.assertEqual(len(instances), 1)
+        self.assertEqual(self._batchRequest([], 'GET').get_response(
+            app).status_int, 404)
+        self.assertEqual(self._batchRequest(
+            [{'action': 'profile'}] * 21).get_response(app).status_int, 400)
+        self.assertEqual(self._batchRequest(
+            [{'params': {}}]).get_response(app).status_int, 400)
+        request = self._batchRequest(None)
+        request.body = b'{'
+        self.assertEqual(request.get_response(app).status_int, 400)
+
+    def test_add_handler_batch_pool(self):
+        import threading
+        from pyramid.threadlocal import get_current_request
+        from pyramid_handlers import action
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.batch.max_calls'] = '3'
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string')
+            def name(self):
+                if get_current_request() is not self.request:
+                    raise AssertionError # pragma: no cover
+                return '%s %s' % (self.request.GET['n'],
+                                  threading.current_thread().name)
+        config.add_handler('name', '/{action}', MyHandler, batch='/_batch',
+                           batch_pool='batch')
+        app = config.make_wsgi_app()
+        calls = [{'action': 'name', 'params': {'n': str(n)}}
+                 for n in range(3)]
+        request = self._batchRequest(calls, path='/_batch')
+        bodies = [result['body'] for result in
+                  request.get_response(app).json]
+        for n, body in enumerate(bodies):
+            self.assertTrue(body.startswith(
+                '%d pyramid_handlers pool batch' % n))
+        request = self._batchRequest(calls * 2, path='/_batch')
+        self.assertEqual(request.get_response(app).status_int, 400)
+
+    def test_add_handler_batch_limited_action(self):
+        from pyramid_handlers import action
+        from pyramid_handlers.limits import get_limits
+        config = self._makeOne()
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string', max_concurrency=1, max_queued=0)
+            def slow(self):
+                return 'slow'
+        config.add_handler('users', '/users/{action}', MyHandler,
+                           batch='/users/_batch')
+        app = config.make_wsgi_app()
+        (key, limit), = get_limits(app.registry)
+        self.assertEqual(key[0], 'users')
+        request = self._batchRequest([{'action': 'slow'}] * 2)
+        self.assertEqual([result['status'] for result in
+                          request.get_response(app).json], [200, 200])
+        limit.acquire()
+        try:
+            request = self._batchRequest([{'action': 'slow'}])
+            self.assertEqual(request.get_response(app).json[0]['status'],
+                             503)
+        finally:
+            limit.release()
+        self.assertEqual((limit.admitted, limit.rejected), (3, 1))
+
+    def test_add_handler_batch_scoped_handler(self):
+        from pyramid_handlers import action
+        config = self._makeOne()
+        created = []
+        class MyHandler(object):
+            __handler_scope__ = 'thread'
+            def __init__(self):
+                created.append(self)
+            @action(renderer='string')
+            def a(self, request):
+                return 'a %s' % request.GET.get('n')
+        config.add_handler('name', '/s/{action}', MyHandler,
+                           batch='/s/_batch')
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/s/a').body, b'a None')
+        request = self._batchRequest(
+            [{'action': 'a'}, {'action': 'a', 'params': {'n': '1'}}],
+            path='/s/_batch')
+        response = request.get_response(app)
+        self.assertEqual([result['body'] for result in response.json],
+                         ['a None', 'a 1'])
+        self.assertEqual(len(created), 1)
+
+    def test_add_handler_batch_package_and_async_timeout(self):
+        import asyncio
+        import pyramid_handlers
+        from pyramid_handlers import action
+        config = self._makeOne()
+        config.registry.settings['pyramid_handlers.async_timeout'] = '0.01'
+        class MyHandler(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string')
+            async def slow(self):
+                await asyncio.sleep(1)
+        config.add_handler('name', '/{action}', MyHandler, batch='/_batch')
+        app = config.make_wsgi_app()
+        view, = [intr['introspectable']['callable'] for intr in
+                 config.registry.introspector.get_category('views')
+                 if intr['introspectable']['route_name'] == 'name.batch']
+        self.assertTrue(view.package is pyramid_handlers)
+        request = self._batchRequest([{'action': 'slow'}], path='/_batch')
+        self.assertEqual(request.get_response(app).json[0]['status'], 504)
+
+    def test_add_handler_batch_without_action(self):
+        from pyramid.exceptions import ConfigurationError
+        config = self._makeOne()
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/index', DummyHandler, action='action1',
+                          batch='/_batch')
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', DummyHandler, lazy=True,
+                          batch='/_batch')
+
+    def _batchRequest(self, calls, method='POST', path='/users/_batch'):
+        import json
+        from pyramid.request import Request
+        request = Request.blank(path, method=method)
+        request.body = json.dumps(calls).encode('utf-8')
+        return request
+
+    def _getView(self, config, route_name):
+        from zope.interface import Interface
+        from pyramid.interfaces import IRouteRequest
+        from pyramid.interfaces import IView
+        from pyramid.interfaces import IViewClassifier
+        request_iface = config.registry.getUtility(IRouteRequest, route_name)
+        view = config.registry.adapters.lookup(
+            (IViewClassifier, request_iface, Interface), IView, name='')
+        return view.__original_view__
+
     def _assertRoute(self, config, name, path, num_predicates=0):
         from pyramid.interfaces import IRoutesMapper
         mapper = config.registry.getUtility(IRoutesMapper)
@@ -418,6 +1510,627 @@ class Test_add_handler(unittest.TestCase):
                 except TypeError:
                     yield confinst.function
 
+class TestEventLoopThread(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid_handlers.aio import EventLoopThread
+        return EventLoopThread()
+
+    def test_run(self):
+        import asyncio
+        import threading
+        loop_thread = self._makeOne()
+        async def coro():
+            await asyncio.sleep(0)
+            return threading.current_thread()
+        try:
+            thread = loop_thread.run(coro())
+            self.assertTrue(thread is loop_thread.thread)
+            self.assertFalse(thread is threading.current_thread())
+        finally:
+            loop_thread.stop()
+        self.assertEqual(loop_thread.loop, None)
+        self.assertFalse(thread.is_alive())
+
+    def test_restarted_after_fork(self):
+        loop_thread = self._makeOne()
+        try:
+            loop = loop_thread.get_loop()
+            self.assertTrue(loop_thread.get_loop() is loop)
+            loop_thread.pid = -1
+            self.assertFalse(loop_thread.get_loop() is loop)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.stop()
+
+class TestActionLimit(unittest.TestCase):
+    def _makeOne(self, max_concurrency=1, max_queued=1, queue_timeout=None):
+        from pyramid_handlers.limits import ActionLimit
+        return ActionLimit(max_concurrency, max_queued, queue_timeout)
+
+    def test_queue_and_reject(self):
+        import threading
+        from pyramid.httpexceptions import HTTPServiceUnavailable
+        limit = self._makeOne()
+        limit.acquire()
+        acquired = threading.Event()
+        def wait():
+            limit.acquire()
+            acquired.set()
+        thread = threading.Thread(target=wait)
+        thread.start()
+        while not limit.queued:
+            acquired.wait(0.001)
+        self.assertRaises(HTTPServiceUnavailable, limit.acquire)
+        limit.release()
+        thread.join()
+        self.assertTrue(acquired.is_set())
+        limit.release()
+        self.assertEqual((limit.admitted, limit.queued, limit.rejected),
+                         (2, 1, 1))
+
+    def test_queue_timeout(self):
+        from pyramid.httpexceptions import HTTPServiceUnavailable
+        limit = self._makeOne(queue_timeout=0.01)
+        limit.acquire()
+        try:
+            limit.acquire()
+        except HTTPServiceUnavailable as why:
+            self.assertEqual(why.headers['Retry-After'], '1')
+        else: # pragma: no cover
+            raise AssertionError
+        limit.release()
+        limit.acquire()
+        self.assertEqual((limit.admitted, limit.queued, limit.rejected),
+                         (2, 1, 1))
+
+class TestSingleFlight(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid_handlers.coalesce import SingleFlight
+        return SingleFlight()
+
+    def test_join_and_land(self):
+        flights = self._makeOne()
+        flight, first = flights.join('key')
+        self.assertTrue(first)
+        self.assertEqual(flights.join('key'), (flight, False))
+        self.assertEqual(flights.join('other')[1], True)
+        self.assertEqual(flights.coalesced, 1)
+        flights.land('key', flight, 'result')
+        self.assertTrue(flight.done.is_set())
+        self.assertEqual(flight.result, 'result')
+        self.assertNotEqual(flights.join('key')[0], flight)
+
+class TestActionProfiles(unittest.TestCase):
+    def _makeOne(self, rate=1, directory=None, interval=10):
+        from pyramid_handlers.profiling import ActionProfiles
+        self.now = 0
+        return ActionProfiles(rate, directory, interval, lambda: self.now)
+
+    def _profile(self):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(sorted, [2, 1])
+        return profiler
+
+    def test_record_merges(self):
+        profiles = self._makeOne()
+        profiles.record(('route', 'handler', 'action'), self._profile())
+        profiles.record(('route', 'handler', 'action'), self._profile())
+        stats = profiles.stats[('route', 'handler', 'action')]
+        [calls] = [value[1] for func, value in stats.stats.items()
+                   if 'sorted' in func[2]]
+        self.assertEqual(calls, 2)
+
+    def test_record_writes_every_interval(self):
+        import os
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        profiles = self._makeOne(directory=directory)
+        key = ('route', 'handler', r'page-\d+')
+        profiles.record(key, self._profile())
+        self.assertEqual(os.listdir(directory), [])
+        self.now = 10
+        profiles.record(key, self._profile())
+        self.assertEqual(os.listdir(directory), [
+            'route.handler.page-_d_.%d.pstats' % os.getpid()])
+
+    def test_sample(self):
+        self.assertTrue(self._makeOne(rate=1).sample())
+        self.assertFalse(self._makeOne(rate=0).sample())
+
+class TestAllocations(unittest.TestCase):
+    def _makeOne(self, top=2):
+        from pyramid_handlers.allocations import Allocations
+        return Allocations(top)
+
+    def test_record(self):
+        allocations = self._makeOne()
+        allocations.record(100, 10, [('a.py:1', 10)])
+        allocations.record(300, 0, [('a.py:1', 5), ('b.py:2', 20),
+                                    ('c.py:3', 1)])
+        self.assertEqual(allocations.count, 2)
+        self.assertEqual((allocations.peak_max, allocations.peak_total),
+                         (300, 400))
+        self.assertEqual((allocations.retained_max,
+                          allocations.retained_total), (10, 10))
+        self.assertEqual(allocations.top_sites(),
+                         [('b.py:2', 20), ('a.py:1', 15)])
+
+    def test_record_forgets_small_sites(self):
+        allocations = self._makeOne(top=1)
+        allocations.record(0, 0, [('%d' % i, i) for i in range(11)])
+        self.assertEqual(sorted(allocations.sites),
+                         ['10', '6', '7', '8', '9'])
+
+class Test_prebuild(unittest.TestCase):
+    def _callFUT(self, registry):
+        from pyramid_handlers.preload import prebuild
+        return prebuild(registry)
+
+    def test_it(self):
+        from pyramid.config import Configurator
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        class MyHandler(object):
+            @action(name=r'page-\d+')
+            def page(self): pass
+            @action(name='literal')
+            def literal(self): pass
+        config = Configurator(autocommit=True)
+        config.include(includeme)
+        config.add_handler('predicates', '/p/{action}', MyHandler)
+        config.add_handler('single', '/s/{action}', MyHandler,
+                           single_view=True)
+        config.add_handler('lazy', '/lazy/{action}',
+                           'pyramid_handlers.tests:LazyHandler', lazy=True)
+        self.assertEqual(self._callFUT(config.registry), 2)
+        views = dict(
+            (intr['introspectable']['route_name'],
+             intr['introspectable']['callable'])
+            for intr in config.registry.introspector.get_category('views')
+            if not intr['introspectable']['name'])
+        self.assertTrue(views['lazy'].handler is LazyHandler)
+        self.assertTrue(views['single'].group.action_re)
+
+    def test_no_introspector(self):
+        class DummyRegistry(object):
+            introspector = None
+        self.assertEqual(self._callFUT(DummyRegistry()), 0)
+
+class TestActionWarmups(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid_handlers.warmup import ActionWarmups
+        return ActionWarmups()
+
+    def test_add(self):
+        warmups = self._makeOne()
+        warmups.add('name', 'index')
+        warmups.add('name', 'index', {})
+        warmups.add('name', r'page-\d+', {'action': 'page-1'})
+        self.assertEqual(warmups.targets, [
+            ('name', 'index', {}),
+            ('name', r'page-\d+', {'action': 'page-1'})])
+
+    def test_add_bad_elements(self):
+        from pyramid.exceptions import ConfigurationError
+        warmups = self._makeOne()
+        self.assertRaises(ConfigurationError, warmups.add, 'name', 'index',
+                          'index')
+        self.assertRaises(ConfigurationError, warmups.add, 'name',
+                          r'page-\d+')
+
+class TestResponseCache(unittest.TestCase):
+    def _makeOne(self, max_entries=2):
+        from pyramid_handlers.cache import ResponseCache
+        self.now = 0
+        return ResponseCache(max_entries, clock=lambda: self.now)
+
+    def test_ttl(self):
+        cache = self._makeOne()
+        cache.set(('h', 'a'), 'value', 10)
+        self.now = 9
+        self.assertEqual(cache.get(('h', 'a')), 'value')
+        self.now = 10
+        self.assertEqual(cache.get(('h', 'a')), None)
+        self.assertEqual(len(cache.entries), 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru(self):
+        cache = self._makeOne()
+        cache.set(('h', 'a'), 'a', 10)
+        cache.set(('h', 'b'), 'b', 10)
+        cache.get(('h', 'a'))
+        cache.set(('h', 'c'), 'c', 10)
+        self.assertEqual(list(cache.entries), [('h', 'a'), ('h', 'c')])
+
+    def test_invalidate(self):
+        cache = self._makeOne(10)
+        cache.set(('h', 'a', 1), 'a', 10)
+        cache.set(('h', 'a', 2), 'a', 10)
+        cache.set(('h', 'b'), 'b', 10)
+        cache.set(('g', 'a'), 'a', 10)
+        self.assertEqual(cache.invalidate('h', 'a'), 2)
+        self.assertEqual(cache.invalidate('h'), 1)
+        self.assertEqual(list(cache.entries), [('g', 'a')])
+        cache.clear()
+        self.assertEqual(len(cache.entries), 0)
+
+class TestHandlerInstances(unittest.TestCase):
+    def _makeOne(self, scope):
+        from pyramid_handlers import HandlerInstances
+        class MyHandler(object):
+            pass
+        return HandlerInstances(MyHandler, scope)
+
+    def test_reused(self):
+        for scope in ('thread', 'process'):
+            instances = self._makeOne(scope)
+            self.assertTrue(instances.acquire()[0] is
+                            instances.acquire()[0])
+
+    def test_forked_process_creates_its_own(self):
+        import os
+        if not hasattr(os, 'fork'): # pragma: no cover
+            return
+        for scope in ('thread', 'process'):
+            instances = self._makeOne(scope)
+            inst = instances.acquire()[0]
+            pid = os.fork()
+            if not pid: # pragma: no cover
+                status = 1
+                try:
+                    child = instances.acquire()[0]
+                    if child is not inst and instances.acquire()[0] is child:
+                        status = 0
+                finally:
+                    os._exit(status)
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+            self.assertTrue(instances.acquire()[0] is inst)
+
+class TestSharedResponseCache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.now = 0
+        self.caches = []
+
+    def tearDown(self):
+        import shutil
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, slots=4, slot_size=256):
+        import os
+        from pyramid_handlers.sharedcache import SharedResponseCache
+        cache = SharedResponseCache(
+            os.path.join(self.tmpdir, 'cache'), slots, slot_size,
+            clock=lambda: self.now)
+        self.caches.append(cache)
+        return cache
+
+    def _value(self, body=b'body'):
+        return ('200 OK', [('Content-Type', 'text/plain')], body)
+
+    def test_shared_between_instances(self):
+        cache = self._makeOne()
+        other = self._makeOne()
+        self.assertEqual(other.get(('h', 'a')), None)
+        cache.set(('h', 'a'), self._value(), 10)
+        self.assertEqual(other.get(('h', 'a')), self._value())
+        self.now = 10
+        self.assertEqual(other.get(('h', 'a')), None)
+        self.assertEqual((other.hits, other.misses), (1, 2))
+
+    def test_replace_least_recently_used(self):
+        cache = self._makeOne()
+        for i in range(4):
+            self.now = i
+            cache.set(('h', 'a', i), self._value(), 100)
+        self.now = 4
+        cache.get(('h', 'a', 0))
+        cache.set(('h', 'a', 4), self._value(), 100)
+        self.assertEqual(cache.get(('h', 'a', 1)), None)
+        for i in (0, 2, 3, 4):
+            self.assertEqual(cache.get(('h', 'a', i)), self._value())
+        cache.set(('h', 'a', 4), self._value(b'new'), 100)
+        self.assertEqual(cache.get(('h', 'a', 4))[2], b'new')
+
+    def test_too_large(self):
+        cache = self._makeOne()
+        cache.set(('h', 'a'), self._value(b'x' * 256), 10)
+        self.assertEqual(cache.get(('h', 'a')), None)
+        self.assertEqual(cache.too_large, 1)
+
+    def test_slot_being_written(self):
+        from pyramid_handlers.sharedcache import SEQ
+        cache = self._makeOne()
+        cache.set(('h', 'a'), self._value(), 10)
+        for offset in range(64, len(cache.map), cache.slot_size):
+            seq = SEQ.unpack_from(cache.map, offset)[0]
+            SEQ.pack_into(cache.map, offset, seq | 1)
+        self.assertEqual(cache.get(('h', 'a')), None)
+
+    def test_undecodable_entry(self):
+        from pyramid_handlers.sharedcache import SLOT_HEADER
+        cache = self._makeOne()
+        cache.set(('h', 'a'), self._value(), 10)
+        for offset in range(64, len(cache.map), cache.slot_size):
+            start = offset + SLOT_HEADER.size
+            cache.map[start:start + 8] = b'\xff' * 8
+        self.assertEqual(cache.get(('h', 'a')), None)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_forked_writers_exclude_each_other(self):
+        import fcntl
+        import os
+        if not hasattr(os, 'fork'): # pragma: no cover
+            return
+        cache = self._makeOne()
+        with cache._locked():
+            pid = os.fork()
+            if not pid: # pragma: no cover
+                # the lock a writer of this process would take
+                status = 1
+                try:
+                    fcntl.flock(cache._locked().fd,
+                                fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    status = 0
+                os._exit(status)
+            status = os.waitpid(pid, 0)[1]
+        self.assertEqual(status, 0)
+
+    def test_invalidate_and_clear(self):
+        cache = self._makeOne(8)
+        cache.set(('h', 'a', 1), self._value(), 10)
+        cache.set(('h', 'a', 2), self._value(), 10)
+        cache.set(('h', 'b'), self._value(), 10)
+        cache.set(('g', 'a'), self._value(), 10)
+        self.assertEqual(cache.invalidate('h', 'a'), 2)
+        self.assertEqual(cache.invalidate('h'), 1)
+        self.assertEqual(cache.get(('g', 'a')), self._value())
+        cache.clear()
+        self.assertEqual(cache.get(('g', 'a')), None)
+
+    def test_reinitialized_with_other_layout(self):
+        cache = self._makeOne()
+        cache.set(('h', 'a'), self._value(), 10)
+        other = self._makeOne(slot_size=512)
+        self.assertEqual(other.get(('h', 'a')), None)
+        self.assertEqual(len(other.map), 64 + 4 * 512)
+
+    def test_add_handler(self):
+        import os
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        from pyramid_handlers.cache import invalidate
+        from pyramid_handlers.sharedcache import shared_cache
+        settings = {'pyramid_handlers.shared_cache.path': os.path.join(
+            self.tmpdir, 'cache')}
+        created = []
+        class MyHandler(object):
+            def __init__(self, request):
+                created.append(request)
+            @shared_cache(60)
+            @action(renderer='string')
+            def index(self):
+                return 'index %d' % len(created)
+        def make_app():
+            config = Configurator(autocommit=True, settings=settings)
+            config.include(includeme)
+            config.add_handler('name', '/{action}', MyHandler)
+            return config.make_wsgi_app()
+        app, other = make_app(), make_app()
+        from pyramid_handlers.interfaces import IResponseCache
+        self.caches.extend(
+            app.registry.getUtility(IResponseCache, name='shared')
+            for app in (app, other))
+        self.assertEqual(_get(app, '/index').text, 'index 1')
+        self.assertEqual(_get(other, '/index').text, 'index 1')
+        self.assertEqual(invalidate(other.registry, MyHandler), 1)
+        self.assertEqual(_get(app, '/index').text, 'index 2')
+
+    def test_add_handler_without_path(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid_handlers import add_handler
+        from pyramid_handlers.sharedcache import shared_cache
+        class MyHandler(object):
+            @shared_cache(60)
+            def index(self): pass
+        config = Configurator(autocommit=True)
+        config.add_directive('add_handler', add_handler)
+        self.assertRaises(ConfigurationError, config.add_handler,
+                          'name', '/{action}', MyHandler)
+
+class Test_url_for(unittest.TestCase):
+    def _callFUT(self, request, handler, action=None, *elements, **kw):
+        from pyramid_handlers import url_for
+        return url_for(request, handler, action, *elements, **kw)
+
+    def _makeRequest(self, config):
+        request = testing.DummyRequest()
+        request.registry = config.registry
+        return request
+
+    def _makeConfig(self):
+        from pyramid_handlers import includeme
+        config = Configurator(autocommit=True)
+        config.include(includeme)
+        return config
+
+    def test_action_in_path_and_fixed(self):
+        from pyramid_handlers import action
+        class MyHandler(object):
+            def index(self): pass
+            @action(name='num[0-9]+')
+            def numbered(self): pass
+        config = self._makeConfig()
+        config.add_handler('home', '/', MyHandler, action='index')
+        config.add_handler('name', '/name/{action}', MyHandler)
+        config.add_handler('other', '/other/{action}', MyHandler)
+        request = self._makeRequest(config)
+        self.assertEqual(self._callFUT(request, MyHandler, 'index'),
+                         'http://example.com/')
+        self.assertEqual(self._callFUT(request, MyHandler, 'num42', 'a',
+                                       _query={'b': 1}),
+                         'http://example.com/name/num42/a?b=1')
+
+    def test_implicit_action(self):
+        class MyHandler(object):
+            def __call__(self): pass
+        config = self._makeConfig()
+        config.add_handler('name', '/name/{id}', MyHandler)
+        request = self._makeRequest(config)
+        self.assertEqual(self._callFUT(request, MyHandler, id='1'),
+                         'http://example.com/name/1')
+
+    def test_lazy(self):
+        config = self._makeConfig()
+        config.add_handler('name', '/{action}',
+                           'pyramid_handlers.tests:LazyHandler', lazy=True)
+        config.add_handler('fixed', '/fixed/index',
+                           '.tests.LazyHandler', action='index', lazy=True)
+        request = self._makeRequest(config)
+        self.assertEqual(self._callFUT(request, LazyHandler, 'other'),
+                         'http://example.com/other')
+        self.assertEqual(
+            self._callFUT(request, 'pyramid_handlers.tests.LazyHandler',
+                          'index'),
+            'http://example.com/fixed/index')
+
+    def test_no_route(self):
+        config = self._makeConfig()
+        request = self._makeRequest(config)
+        self.assertRaises(KeyError, self._callFUT, request, LazyHandler,
+                          'index')
+        config.add_handler('fixed', '/fixed', LazyHandler, action='index')
+        self.assertRaises(KeyError, self._callFUT, request, LazyHandler,
+                          'other')
+
+class Test_json_array(unittest.TestCase):
+    def _callFUT(self, rows, chunk_size=8192, **kw):
+        from pyramid_handlers.streaming import json_array
+        return list(json_array(rows, chunk_size, **kw))
+
+    def test_empty(self):
+        self.assertEqual(self._callFUT([]), [b'[]'])
+
+    def test_chunked(self):
+        import json
+        rows = [{'n': i} for i in range(10)]
+        chunks = self._callFUT(iter(rows), chunk_size=20)
+        self.assertTrue(len(chunks) > 3)
+        self.assertEqual(json.loads(b''.join(chunks).decode('utf-8')), rows)
+
+    def test_closes_rows(self):
+        closed = []
+        def rows():
+            try:
+                yield 1
+                yield 2
+            finally:
+                closed.append(True)
+        chunks = self._callFUT(rows(), chunk_size=1)
+        self.assertEqual(b''.join(chunks), b'[1,2]')
+        self.assertEqual(closed, [True])
+
+class TestActionDispatcher(unittest.TestCase):
+    def _makeOne(self, route_name='name'):
+        from pyramid_handlers import ActionDispatcher
+        return ActionDispatcher(route_name)
+
+    def test_add_literal(self):
+        dispatcher = self._makeOne()
+        view_name = dispatcher.add('index')
+        self.assertEqual(dispatcher.actions, {'index':view_name})
+        self.assertEqual(dispatcher.pattern_views, [])
+
+    def test_add_regex_once(self):
+        dispatcher = self._makeOne()
+        view_name = dispatcher.add('^a.*$')
+        self.assertEqual(dispatcher.add('^a.*$'), view_name)
+        self.assertEqual(dispatcher.actions, {})
+        self.assertEqual(dispatcher.pattern_views, [view_name])
+
+    def test___call__no_matchdict(self):
+        from pyramid.exceptions import PredicateMismatch
+        dispatcher = self._makeOne()
+        request = testing.DummyRequest()
+        self.assertRaises(PredicateMismatch, dispatcher, None, request)
+
+    def test___call__view_missing(self):
+        from pyramid.exceptions import PredicateMismatch
+        dispatcher = self._makeOne()
+        dispatcher.add('index')
+        testing.setUp()
+        try:
+            request = testing.DummyRequest()
+            request.matchdict = {'action':'index'}
+            self.assertRaises(PredicateMismatch, dispatcher, None, request)
+        finally:
+            testing.tearDown()
+
+class TestActionPatternGroup(unittest.TestCase):
+    def _makeOne(self, *patterns):
+        from pyramid_handlers import ActionPatternGroup
+        group = ActionPatternGroup()
+        for pattern in patterns:
+            group.add(pattern)
+        return group
+
+    def test_add_same_pattern_twice(self):
+        group = self._makeOne()
+        self.assertEqual(group.add('a.*'), 0)
+        self.assertEqual(group.add('b.*'), 1)
+        self.assertEqual(group.add('a.*'), 0)
+
+    def test_first(self):
+        group = self._makeOne('^a.*$', 'b|c', 'ab.*')
+        self.assertEqual(group.first('abc'), 0)
+        self.assertEqual(group.first('cx'), None)
+        self.assertEqual(group.first('bx'), 1) # 'b|c$' is an alternation
+        self.assertEqual(group.first('zzz'), None)
+        self.assertTrue(group.action_re)
+
+    def test_first_no_patterns(self):
+        group = self._makeOne()
+        self.assertEqual(group.first('abc'), None)
+
+    def test_first_memoized(self):
+        group = self._makeOne('a.*')
+        group.first('abc')
+        group.action_re = None
+        group.patterns = ['x']
+        self.assertEqual(group.first('abc'), 0)
+
+    def test_memo_is_bounded(self):
+        group = self._makeOne('a.*')
+        group.memo_size = 2
+        for action in ('a1', 'a2', 'a3'):
+            group.first(action)
+        self.assertEqual(list(group.memo), ['a3'])
+
+    def test_matches_later_pattern(self):
+        group = self._makeOne('ab.*', 'a.*', 'x')
+        self.assertEqual(group.matches(0, 'abc'), True)
+        self.assertEqual(group.matches(1, 'abc'), True)
+        self.assertEqual(group.matches(2, 'abc'), False)
+        self.assertEqual(group.matches(0, 'acd'), False)
+        self.assertEqual(list(group.matching('abc')), [0, 1])
+        self.assertEqual(list(group.matching('zzz')), [])
+
+    def test_uncombinable_patterns(self):
+        group = self._makeOne('(a)\\1', '(?P<x>b)', '(?P<x>c)d')
+        self.assertEqual(group.first('aa'), 0)
+        self.assertEqual(group.first('cd'), 2)
+        self.assertEqual(group.action_re, False)
+        group = self._makeOne('(?P<x>b)', '(?P<x>c)d')
+        self.assertEqual(group.first('cd'), 1)
+        self.assertEqual(group.action_re, False)
+
 class TestActionPredicate(unittest.TestCase):
     def _getTargetClass(self):
         from pyramid_handlers import ActionPredicate
@@ -465,6 +2178,60 @@ class TestActionPredicate(unittest.TestCase):
         request.matchdict = None
         self.assertEqual(pred(None, request), False)
 
+    def test_literal_action_not_compiled(self):
+        pred = self._makeOne('my_action-2')
+        self.assertEqual(pred.action_re, None)
+
+    def test_literal_action_requires_whole_name(self):
+        pred = self._makeOne()
+        request = testing.DummyRequest()
+        request.matchdict = {'action':'myaction2'}
+        self.assertEqual(pred(None, request), False)
+        request.matchdict = {'action':'amyaction'}
+        self.assertEqual(pred(None, request), False)
+
+    def test_regex_action_matches(self):
+        pred = self._makeOne('my.+')
+        request = testing.DummyRequest()
+        request.matchdict = {'action':'myaction'}
+        self.assertEqual(pred(None, request), True)
+        request.matchdict = {'action':'yourmyaction'}
+        self.assertEqual(pred(None, request), False)
+
+    def test_regex_action_compiled_once(self):
+        pred1 = self._makeOne('^my.+$')
+        pred2 = self._makeOne('^my.+$')
+        self.assertTrue(pred1.action_re is pred2.action_re)
+
+    def test_grouped_regex_actions(self):
+        from pyramid_handlers import ActionPatternGroup
+        cls = self._getTargetClass()
+        group = ActionPatternGroup()
+        pred1 = cls('^a.*$', group)
+        pred2 = cls('^ab$', group)
+        pred3 = cls('literal', group)
+        self.assertEqual(group.patterns, ['^a.*$', '^ab$'])
+        request = testing.DummyRequest()
+        request.matchdict = {'action':'ab'}
+        self.assertEqual(pred1(None, request), True)
+        self.assertEqual(pred2(None, request), True)
+        self.assertEqual(pred3(None, request), False)
+        request.matchdict = {'action':'ax'}
+        self.assertEqual(pred1(None, request), True)
+        self.assertEqual(pred2(None, request), False)
+
+    def test_interned(self):
+        from pyramid_handlers import ActionPatternGroup
+        cls = self._getTargetClass()
+        group1 = ActionPatternGroup()
+        group2 = ActionPatternGroup()
+        self.assertTrue(self._makeOne() is self._makeOne())
+        self.assertTrue(cls('literal', group1) is cls('literal', group2))
+        self.assertTrue(cls('a.+', group1) is cls('a.+', group1))
+        self.assertFalse(cls('a.+', group1) is cls('a.+', group2))
+        self.assertFalse(cls('a.+', group1) is cls('a.+'))
+        self.assertFalse(hasattr(self._makeOne(), '__dict__'))
+
     def test___hash__(self):
         pred1 = self._makeOne()
         pred2 = self._makeOne()
@@ -545,6 +2312,338 @@ if not PY3:
                               context, 'name', None, Handler)
 
 
+class Test_get_method_info(unittest.TestCase):
+    def _callFUT(self, cls):
+        from pyramid_handlers import get_method_info
+        return get_method_info(cls)
+
+    def test_it(self):
+        class Base(object):
+            def one(self): pass
+            def two(self): pass
+            def three(self): pass
+        class Handler(Base):
+            def two(self): pass
+            three = None
+            @staticmethod
+            def four(): pass
+            @classmethod
+            def five(cls): pass
+        info = self._callFUT(Handler)
+        self.assertEqual([name for name, method in info],
+                         ['four', 'one', 'two'])
+        self.assertTrue(dict(info)['two'] is Handler.__dict__['two'])
+        self.assertTrue(dict(info)['one'] is Base.__dict__['one'])
+
+    def test_doesnt_trigger_descriptors(self):
+        got = []
+        class Descriptor(object):
+            def __get__(self, inst, cls): # pragma: no cover
+                got.append(cls)
+                return lambda self: None
+        class Handler(object):
+            attr = Descriptor()
+            def one(self): pass
+        info = self._callFUT(Handler)
+        self.assertEqual([name for name, method in info], ['one'])
+        self.assertEqual(got, [])
+
+    def test_cached(self):
+        class Handler(object):
+            def one(self): pass
+        info1 = self._callFUT(Handler)
+        info2 = self._callFUT(Handler)
+        self.assertEqual(info1, info2)
+        self.assertFalse(info1 is info2)
+
+    def test_cache_invalidated_by_mutation(self):
+        class Base(object):
+            def one(self): pass
+        class Handler(Base):
+            pass
+        self.assertEqual(len(self._callFUT(Handler)), 1)
+        def two(self): pass
+        Handler.two = two
+        self.assertEqual(len(self._callFUT(Handler)), 2)
+        def one(self): pass
+        Base.one = one
+        self.assertTrue(dict(self._callFUT(Handler))['one'] is one)
+        del Base.one
+        self.assertEqual([name for name, method in self._callFUT(Handler)],
+                         ['two'])
+
+class TestHandlerManifest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _makeConfig(self, **settings):
+        import os
+        from pyramid_handlers import includeme
+        settings['pyramid_handlers.manifest'] = os.path.join(
+            self.tmpdir, 'manifest.json')
+        config = Configurator(autocommit=True, settings=settings)
+        config.include(includeme)
+        return config
+
+    def _addHandlers(self, config):
+        config.add_handler('name', '/{action}', LazyHandler)
+        config.add_handler('fixed', '/fixed/index', LazyHandler,
+                           action='index')
+
+    def _write(self, config):
+        from pyramid_handlers.manifest import write_manifest
+        write_manifest(config.registry)
+
+    def test_write_and_load(self):
+        import json
+        import pyramid_handlers
+        config = self._makeConfig()
+        self._addHandlers(config)
+        self._write(config)
+        with open(config.registry.settings['pyramid_handlers.manifest']) as f:
+            data = json.load(f)
+        self.assertEqual(data['routes']['name'],
+                         {'pattern':'/{action}', 'action':None,
+                          'handler':'pyramid_handlers.tests.LazyHandler'})
+        plans = data['handlers']['pyramid_handlers.tests.LazyHandler']['plans']
+        self.assertEqual(plans['*'], [['index', None, 'index', {}],
+                                      ['other', None, 'other', {}]])
+        self.assertEqual(plans['action:index'], [['index', None, True, {}]])
+        config = self._makeConfig()
+        def fail(*arg): # pragma: no cover
+            raise AssertionError('introspected')
+        saved = pyramid_handlers._scan_plan, pyramid_handlers._locate_plan
+        pyramid_handlers._scan_plan = pyramid_handlers._locate_plan = fail
+        try:
+            self._addHandlers(config)
+        finally:
+            pyramid_handlers._scan_plan, pyramid_handlers._locate_plan = saved
+        app = config.make_wsgi_app()
+        self.assertEqual(_get(app, '/other').body, b'other')
+        self.assertEqual(_get(app, '/fixed/index').body, b'index')
+
+    def test_stale_sources(self):
+        import pyramid_handlers
+        config = self._makeConfig()
+        self._addHandlers(config)
+        manifest = config.registry.queryUtility(
+            pyramid_handlers.IHandlerManifest)
+        for entry in manifest.handlers.values():
+            for fingerprint in entry['sources'].values():
+                fingerprint[1] += 1
+        self._write(config)
+        config = self._makeConfig()
+        called = []
+        def scan_plan(*arg):
+            called.append(arg)
+            return saved(*arg)
+        saved = pyramid_handlers._scan_plan
+        pyramid_handlers._scan_plan = scan_plan
+        try:
+            config.add_handler('name', '/{action}', LazyHandler)
+        finally:
+            pyramid_handlers._scan_plan = saved
+        self.assertEqual(len(called), 1)
+
+    def test_other_xformer(self):
+        from pyramid_handlers.interfaces import IHandlerManifest
+        config = self._makeConfig()
+        self._addHandlers(config)
+        self._write(config)
+        config = self._makeConfig(**{
+            'pyramid_handlers.method_name_xformer':'mypackage.xformer'})
+        manifest = config.registry.queryUtility(IHandlerManifest)
+        self.assertEqual(manifest.handlers, {})
+
+    def test_write_without_manifest(self):
+        from pyramid.exceptions import ConfigurationError
+        from pyramid_handlers.manifest import write_manifest
+        config = Configurator()
+        self.assertRaises(ConfigurationError, write_manifest,
+                          config.registry)
+
+    def test_local_handler_not_recorded(self):
+        from pyramid_handlers.interfaces import IHandlerManifest
+        config = self._makeConfig()
+        class Handler(object):
+            def index(self): pass
+        config.add_handler('name', '/{action}', Handler)
+        manifest = config.registry.queryUtility(IHandlerManifest)
+        self.assertEqual(manifest.handlers, {})
+
+class TestHistogram(unittest.TestCase):
+    def _makeOne(self, bounds=(0.001, 0.01, 0.1)):
+        from pyramid_handlers.timing import Histogram
+        return Histogram(bounds)
+
+    def test_record(self):
+        histogram = self._makeOne()
+        for elapsed in (0.0005, 0.001, 0.005, 0.5):
+            histogram.record(elapsed)
+        self.assertEqual(histogram.counts, [2, 1, 0, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.max, 0.5)
+        self.assertAlmostEqual(histogram.mean, 0.126625)
+
+    def test_percentile(self):
+        histogram = self._makeOne()
+        self.assertEqual(histogram.percentile(0.5), None)
+        self.assertEqual(histogram.mean, None)
+        for elapsed in (0.0005, 0.0005, 0.005, 0.5):
+            histogram.record(elapsed)
+        self.assertEqual(histogram.percentile(0.5), 0.001)
+        self.assertEqual(histogram.percentile(0.75), 0.01)
+        self.assertEqual(histogram.percentile(0.99), 0.5)
+
+    def test_reset(self):
+        histogram = self._makeOne()
+        histogram.record(0.5)
+        histogram.reset()
+        self.assertEqual(histogram.counts, [0, 0, 0, 0])
+        self.assertEqual(histogram.count, 0)
+
+class TestActionTimings(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid_handlers.timing import ActionTimings
+        return ActionTimings((0.001, 0.01))
+
+    def test_histogram_created_once(self):
+        timings = self._makeOne()
+        histogram = timings.histogram('route', 'handler', 'action')
+        self.assertTrue(
+            timings.histogram('route', 'handler', 'action') is histogram)
+        self.assertEqual(histogram.bounds, (0.001, 0.01))
+
+    def test_dump(self):
+        timings = self._makeOne()
+        timings.histogram('route', 'handler', 'b')
+        timings.histogram('route', 'handler', 'a').record(0.005)
+        self.assertEqual(timings.dump(), (
+            'route handler a count=1 mean=5ms p50=10ms p90=10ms p99=10ms '
+            'max=5ms\n'
+            '  <=10ms     1\n'
+            'route handler b count=0\n'))
+        timings.reset()
+        self.assertTrue('a count=0' in timings.dump())
+
+class Test_benchmark(unittest.TestCase):
+    def _callFUT(self, *argv):
+        from pyramid_handlers.benchmark import main
+        out = _Output()
+        self.assertEqual(main(('phandlersbench',) + argv, out=out), 0)
+        return out.getvalue()
+
+    def test_run(self):
+        import json
+        result = json.loads(self._callFUT('-s', '1,3', '-n', '2'))
+        results = result['results']
+        self.assertEqual([(r['size'], r['mode']) for r in results],
+                         [(1, 'predicates'), (1, 'single_view'),
+                          (3, 'predicates'), (3, 'single_view')])
+        self.assertEqual(sorted(results[0]['dispatch']),
+                         ['first', 'last', 'middle'])
+        self.assertTrue(results[0]['memory_per_action'] > 0)
+
+    def test_run_routes(self):
+        import json
+        result = json.loads(self._callFUT('-s', '2', '-m', 'predicates',
+                                          '-n', '1', '-r', '3'))
+        self.assertEqual(result['routes'], 3)
+        self.assertTrue(result['results'][0]['memory_per_action'] > 0)
+
+    def test_compare(self):
+        import os
+        import tempfile
+        fd, baseline = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self._callFUT('-s', '2', '-m', 'single_view', '-n', '1',
+                          '-o', baseline)
+            output = self._callFUT('-s', '2', '-m', 'single_view', '-n', '1',
+                                   '-c', baseline)
+        finally:
+            os.remove(baseline)
+        lines = output.splitlines()
+        self.assertTrue('dispatch_last' in lines[-2])
+        self.assertTrue(lines[-1].endswith('x'))
+
+class Test_report(unittest.TestCase):
+    def _makeConfig(self):
+        from pyramid.config import Configurator
+        from pyramid_handlers import action
+        from pyramid_handlers import includeme
+        class Users(object):
+            def __init__(self, request):
+                self.request = request
+            @action(renderer='string')
+            def index(self): pass
+            @action(name='edit', request_method='GET', renderer='string')
+            def edit(self): pass
+            @action(name='edit', request_method='POST', renderer='string')
+            def update(self): pass
+            @action(name='page-1', renderer='string')
+            def first_page(self): pass
+            @action(name=r'page-\d+', renderer='string')
+            def page(self): pass
+        config = Configurator(autocommit=True)
+        config.include(includeme)
+        config.add_route('early', '/users/index')
+        config.add_handler('users', '/users/{action}', Users)
+        config.add_handler('single', '/single/{action}', Users,
+                           single_view=True)
+        config.add_handler('home', '/', Users, action='index')
+        config.add_handler('lazy', '/lazy/{action}',
+                           'pyramid_handlers.tests:LazyHandler', lazy=True)
+        return config
+
+    def test_handler_reports(self):
+        from pyramid_handlers.report import handler_reports
+        reports = handler_reports(self._makeConfig().registry)
+        self.assertEqual([(r.name, r.mode, r.views, r.predicates,
+                           r.worst_case) for r in reports],
+                         [('users', 'predicates', 5, 7, 7),
+                          ('single', 'single_view', 5, 2, 3),
+                          ('home', 'action', 1, 0, 0),
+                          ('lazy', 'lazy', 0, 0, None)])
+        users = reports[0]
+        self.assertTrue(users.handler.endswith('Users'))
+        self.assertEqual(users.actions['edit'].methods, ['edit', 'update'])
+        self.assertEqual(users.ambiguous(), [('page-1', r'page-\d+')])
+        self.assertEqual(users.unreachable(), [('index', 'early')])
+        self.assertEqual(reports[1].unreachable(), [])
+
+    def test_handler_reports_without_handlers(self):
+        from pyramid.config import Configurator
+        from pyramid_handlers.report import handler_reports
+        self.assertEqual(handler_reports(Configurator().registry), [])
+
+    def test_main(self):
+        from pyramid_handlers.report import main
+        registry = self._makeConfig().registry
+        closed = []
+        def bootstrap(config_uri):
+            self.assertEqual(config_uri, 'development.ini')
+            return {'registry': registry, 'closer': lambda: closed.append(1)}
+        out = _Output()
+        self.assertEqual(main(['phandlers', '--sort', 'cost',
+                               'development.ini'], out, bootstrap), 0)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(closed, [1])
+        self.assertTrue(lines[0].startswith('users /users/{action} '))
+        self.assertTrue(lines[0].endswith('Users (predicates)'))
+        self.assertEqual(lines[1], '  views=5 predicates=7 literal=3 regex=1 '
+                         'worst_case=7')
+        self.assertTrue('  ambiguous: page-1 also matches page-\\d+' in lines)
+        self.assertTrue('  unreachable: index (matched by the route early)'
+                        in lines)
+        self.assertEqual(lines[-1], '  views=0 predicates=0 literal=0 '
+                         'regex=0 worst_case=?')
+
 class Test_includeme(unittest.TestCase):
     def test_it(self):
         from pyramid.config import Configurator
@@ -553,6 +2652,43 @@ class Test_includeme(unittest.TestCase):
         c = Configurator(autocommit=True)
         c.include(includeme)
         self.assertTrue(c.add_handler.__func__.__docobj__ is add_handler)
+        from pyramid.interfaces import IRendererFactory
+        self.assertTrue(c.registry.queryUtility(
+            IRendererFactory, name='json_stream') is not None)
+
+class LazyHandler(object):
+    def __init__(self, request):
+        self.request = request
+
+    def index(self):
+        from pyramid.response import Response
+        return Response('index')
+
+    def other(self):
+        from pyramid.response import Response
+        return Response('other')
+
+class WarmHandler(object):
+    calls = 0
+
+    def __init__(self, request):
+        self.request = request
+
+    def index(self):
+        from pyramid.response import Response
+        WarmHandler.calls += 1
+        return Response('index')
+    index.__exposed__ = [{'warmup': True}]
+
+try:
+    from io import StringIO as _Output
+except ImportError: # pragma: no cover
+    from StringIO import StringIO as _Output
+
+def _get(app, path, method='GET'):
+    from pyramid.request import Request
+    request = Request.blank(path, method=method)
+    return request.get_response(app)
 
 class DummyHandler(object): # pragma: no cover
     def __init__(self, request):
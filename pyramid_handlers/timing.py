@@ -0,0 +1,170 @@
+""" Per-action latency histograms.
+
+When timing is enabled (see :func:`pyramid_handlers.add_handler`), every
+view registered for a handler action is wrapped by a hook which reads a
+clock before and after calling it and counts the elapsed time in one of a
+fixed set of buckets.  One :class:`Histogram` is kept per route, handler
+and action, in an :class:`ActionTimings` utility of the registry::
+
+  from pyramid_handlers.timing import get_timings
+  for (route_name, handler, action), histogram in get_timings(registry):
+      print(route_name, action, histogram.percentile(0.99))
+
+The histograms are created when the views are registered, so the cost of a
+timed request is two clock reads, a bisection of the bucket bounds and an
+increment.  Warm-up requests (see :mod:`pyramid_handlers.warmup`) aren't
+counted.
+"""
+import bisect
+import threading
+import time
+
+from zope.interface import implementer
+
+from pyramid_handlers.interfaces import IActionTimings
+from pyramid_handlers.manifest import qualified_name
+from pyramid_handlers.warmup import ENVIRON_KEY
+
+# upper bounds of the buckets, in seconds; a last bucket counts the rest
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+clock = getattr(time, 'perf_counter', time.time)
+
+class Histogram(object):
+    """ Counts of the latencies of one action, in fixed buckets.  The
+    ``counts`` list has one more item than ``bounds``: the number of
+    latencies above the highest bound."""
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def record(self, elapsed):
+        """ Count a latency of ``elapsed`` seconds."""
+        i = bisect.bisect_left(self.bounds, elapsed)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += elapsed
+            if elapsed > self.max:
+                self.max = elapsed
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def percentile(self, fraction):
+        """ Return the upper bound of the bucket holding the latency below
+        which ``fraction`` (between 0 and 1) of the latencies fall, the
+        largest latency seen if that is the last bucket, or ``None`` if
+        nothing was counted."""
+        counts = list(self.counts)
+        count = sum(counts)
+        if not count:
+            return None
+        wanted = fraction * count
+        seen = 0
+        for bound, n in zip(self.bounds, counts):
+            seen += n
+            if seen >= wanted:
+                return bound
+        return self.max
+
+
+@implementer(IActionTimings)
+class ActionTimings(object):
+    """ The :class:`Histogram` of every timed action, keyed by
+    ``(route_name, handler_name, action)``."""
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.histograms = {}
+
+    def histogram(self, route_name, handler_name, action):
+        key = (route_name, handler_name, action)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.bounds)
+        return histogram
+
+    def __iter__(self):
+        return iter(sorted(self.histograms.items()))
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def dump(self):
+        """ Return the histograms as text: a summary line per action,
+        followed by the non-empty buckets."""
+        lines = []
+        for (route_name, handler_name, action), histogram in self:
+            count = histogram.count
+            if count:
+                lines.append(
+                    '%s %s %s count=%d mean=%s p50=%s p90=%s p99=%s '
+                    'max=%s' % (
+                        route_name, handler_name, action, count,
+                        _ms(histogram.mean), _ms(histogram.percentile(0.5)),
+                        _ms(histogram.percentile(0.9)),
+                        _ms(histogram.percentile(0.99)), _ms(histogram.max)))
+            else:
+                lines.append('%s %s %s count=0' % (
+                    route_name, handler_name, action))
+            bounds = ['<=' + _ms(bound) for bound in histogram.bounds]
+            bounds.append('>' + _ms(histogram.bounds[-1]))
+            for bound, n in zip(bounds, histogram.counts):
+                if n:
+                    lines.append('  %-10s %d' % (bound, n))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _ms(seconds):
+    return '%gms' % (seconds * 1000)
+
+
+def get_timings(registry):
+    """ Return the :class:`ActionTimings` of ``registry``, or ``None`` if no
+    action was timed."""
+    return registry.queryUtility(IActionTimings)
+
+
+def dump_timings(registry):
+    """ Return the latency histograms of ``registry`` as text."""
+    timings = get_timings(registry)
+    if timings is None:
+        return ''
+    return timings.dump()
+
+
+def timing_decorator(registry, route_name, handler, action):
+    """ Return a view decorator recording the latency of the view it wraps
+    into the histogram of ``action`` of ``handler`` on the route named
+    ``route_name``."""
+    handler_name = qualified_name(handler)
+    timings = registry.queryUtility(IActionTimings)
+    if timings is None:
+        timings = ActionTimings()
+        registry.registerUtility(timings, IActionTimings)
+    record = timings.histogram(route_name, handler_name, action).record
+    def decorator(view):
+        def timed_view(context, request):
+            if request.environ.get(ENVIRON_KEY):
+                # warm-up requests would skew the latencies
+                return view(context, request)
+            start = clock()
+            try:
+                return view(context, request)
+            finally:
+                record(clock() - start)
+        return timed_view
+    return decorator
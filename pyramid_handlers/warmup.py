@@ -0,0 +1,147 @@
+""" Warming handler views up before serving requests.
+
+The first request to an action is slower than the next ones: the handler
+may still have to be imported (``lazy=True``), the action patterns of its
+route compiled, its renderer looked up and its template loaded, and the
+modules and caches the action uses filled.  When the
+``pyramid_handlers.warmup`` setting is true, including ``pyramid_handlers``
+makes :func:`warm_up` run when the application is created (see
+:class:`pyramid.events.ApplicationCreated`), that is after the
+configuration is committed and before ``config.make_wsgi_app()`` returns,
+so before a server sends the application any request.  It:
+
+- builds the dispatch structures of the handler routes (see
+  :func:`pyramid_handlers.preload.prebuild`);
+
+- resolves the renderer of every view of those routes;
+
+- sends a synthetic ``GET`` request through the application to each action
+  decorated with ``@action(warmup=True)``.  ``warmup`` may also be a dict
+  of elements of the URL of the route, e.g. ``@action(warmup={'id': '1'})``;
+  an action named by a regular expression needs an ``action`` element.
+
+Synthetic requests have a true ``pyramid_handlers.warmup`` key in their
+environ, so that an action can tell them from others.  They bypass the
+response caches, coalescing and latency histograms of actions, whose
+contents they would otherwise skew or, since they aren't sent to the
+host or with the scheme of real requests, make wrong.  They are sent to
+``http://localhost`` unless the ``pyramid_handlers.warmup.base_url``
+setting names another URL.  A synthetic request which raises an exception
+or gets an error status is logged; if the ``pyramid_handlers.warmup.strict``
+setting is true, the application isn't created.
+"""
+import logging
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.interfaces import IRoutesMapper
+from pyramid.request import Request
+from pyramid.settings import asbool
+
+from zope.interface import implementer
+
+from pyramid_handlers.interfaces import IActionWarmups
+from pyramid_handlers.interfaces import IHandlerRoutes
+
+# imported by the modules of the view decorators pyramid_handlers imports,
+# so this module doesn't import pyramid_handlers itself at import time
+ENVIRON_KEY = 'pyramid_handlers.warmup'
+
+log = logging.getLogger(__name__)
+
+@implementer(IActionWarmups)
+class ActionWarmups(object):
+    """ The actions to send synthetic requests to, as ``(route_name,
+    action, elements)`` triples in the order they were added."""
+    def __init__(self):
+        self.targets = []
+
+    def add(self, route_name, action, elements=True):
+        """ Add the action ``action`` of the route named ``route_name``,
+        whose URL is generated from ``elements`` (a dict, or ``True`` for
+        none) and the action name."""
+        from pyramid_handlers import literal_action_re
+        if elements is True:
+            elements = {}
+        if not isinstance(elements, dict):
+            raise ConfigurationError(
+                'warmup of the action %r must be True or a dict of route '
+                'elements, not %r' % (action, elements))
+        if 'action' not in elements and not literal_action_re.match(action):
+            raise ConfigurationError(
+                'warmup of the action %r, a regular expression, requires an '
+                '"action" element' % (action,))
+        target = (route_name, action, elements)
+        if target not in self.targets:
+            self.targets.append(target)
+
+
+def get_warmups(registry):
+    """ Return the :class:`ActionWarmups` of ``registry``, creating it if
+    needed."""
+    warmups = registry.queryUtility(IActionWarmups)
+    if warmups is None:
+        warmups = ActionWarmups()
+        registry.registerUtility(warmups, IActionWarmups)
+    return warmups
+
+
+def resolve_renderers(registry):
+    """ Look up the renderer of every view of the handler routes of
+    ``registry``; return the number of renderers resolved."""
+    handler_routes = registry.queryUtility(IHandlerRoutes)
+    introspector = getattr(registry, 'introspector', None)
+    if handler_routes is None or introspector is None:
+        return 0
+    resolved = 0
+    for item in introspector.get_category('views'):
+        intr = item['introspectable']
+        helper = intr.get('renderer')
+        if (intr.get('route_name') in handler_routes.handlers and
+            helper is not None):
+            # a reified attribute: the renderer is created once
+            helper.renderer
+            resolved += 1
+    return resolved
+
+
+def warm_up(app):
+    """ Warm the handler views of the router ``app`` up; return a list of
+    ``(route_name, action, outcome)`` triples for the synthetic requests
+    sent, where ``outcome`` is the status of the response or the exception
+    raised."""
+    from pyramid_handlers.preload import prebuild
+    registry = app.registry
+    settings = registry.settings or {}
+    prebuild(registry)
+    resolve_renderers(registry)
+    warmups = registry.queryUtility(IActionWarmups)
+    mapper = registry.queryUtility(IRoutesMapper)
+    if warmups is None or mapper is None:
+        return []
+    base_url = settings.get('pyramid_handlers.warmup.base_url')
+    results = []
+    failed = []
+    for route_name, action, elements in warmups.targets:
+        route = mapper.get_route(route_name)
+        try:
+            path = route.generate(dict({'action': action}, **elements))
+            request = Request.blank(path, base_url=base_url,
+                                    environ={ENVIRON_KEY: True})
+            outcome = request.get_response(app).status
+        except Exception as e:
+            outcome = e
+        results.append((route_name, action, outcome))
+        if not isinstance(outcome, str) or int(outcome.split()[0]) >= 400:
+            log.warning('warm-up request to the action %r of the route %r '
+                        'failed: %s', action, route_name, outcome)
+            failed.append('%s %s: %s' % (route_name, action, outcome))
+    if failed and asbool(settings.get('pyramid_handlers.warmup.strict')):
+        raise ConfigurationError(
+            'warm-up requests failed: %s' % '; '.join(failed))
+    return results
+
+
+def warm_up_subscriber(event):
+    """ An :class:`~pyramid.events.ApplicationCreated` subscriber calling
+    :func:`warm_up` with the application created."""
+    warm_up(event.app)
@@ -68,6 +68,9 @@ setup(name='pyramid_handlers',
       tests_require = tests_require,
       test_suite="pyramid_handlers",
       entry_points = """
+      [console_scripts]
+      phandlersbench = pyramid_handlers.benchmark:main
+      phandlers = pyramid_handlers.report:main
       """
       )
 